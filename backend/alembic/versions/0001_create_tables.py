@@ -7,6 +7,11 @@ Create Date: 2025-07-24 12:00:00.000000
 from alembic import op
 import sqlalchemy as sa
 
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
 def upgrade():
     op.create_table(
         'wafers',
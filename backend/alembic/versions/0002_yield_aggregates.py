@@ -0,0 +1,29 @@
+"""
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'yield_aggregates',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('wafer_id', sa.Integer, sa.ForeignKey('wafers.id'), index=True),
+        sa.Column('batch_id', sa.String, index=True),
+        sa.Column('test_name', sa.String),
+        sa.Column('bucket', sa.DateTime, index=True),
+        sa.Column('total', sa.Integer, nullable=False),
+        sa.Column('passes', sa.Integer, nullable=False),
+        sa.UniqueConstraint('wafer_id', 'test_name', 'bucket')
+    )
+
+def downgrade():
+    op.drop_table('yield_aggregates')
@@ -0,0 +1,33 @@
+"""
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # Live monitoring and wafer maps: filter by wafer, newest first
+    ('ix_test_results_wafer_id_timestamp', ['wafer_id', 'timestamp']),
+    # Per-die lookups within a wafer
+    ('ix_test_results_wafer_die_test', ['wafer_id', 'die_x', 'die_y', 'test_name']),
+    # Analytics filtering on a test's values
+    ('ix_test_results_test_name_result_value', ['test_name', 'result_value']),
+]
+
+def upgrade():
+    # CONCURRENTLY on PostgreSQL so ingestion keeps running while the
+    # indexes build; it cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'test_results', columns, postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='test_results', postgresql_concurrently=True)
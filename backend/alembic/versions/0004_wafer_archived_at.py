@@ -0,0 +1,19 @@
+"""
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('wafers', sa.Column('archived_at', sa.DateTime, nullable=True))
+
+def downgrade():
+    op.drop_column('wafers', 'archived_at')
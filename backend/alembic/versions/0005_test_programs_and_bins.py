@@ -0,0 +1,47 @@
+"""
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'test_programs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String, unique=True, index=True),
+        sa.Column('version', sa.Integer, nullable=False, server_default='1'),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_table(
+        'test_limits',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('program_id', sa.Integer, sa.ForeignKey('test_programs.id'), nullable=False),
+        sa.Column('test_name', sa.String, nullable=False),
+        sa.Column('lsl', sa.Float, nullable=True),
+        sa.Column('usl', sa.Float, nullable=True),
+        sa.Column('fail_bin', sa.SmallInteger, nullable=False),
+        sa.UniqueConstraint('program_id', 'test_name')
+    )
+    # Batch mode: SQLite cannot add a foreign key with ALTER TABLE
+    with op.batch_alter_table('wafers') as batch:
+        batch.add_column(sa.Column(
+            'program_id', sa.Integer, sa.ForeignKey('test_programs.id', name='fk_wafers_program_id'), nullable=True
+        ))
+    op.add_column('test_results', sa.Column('bin', sa.SmallInteger, nullable=True))
+    # Existing results were judged against the fixed 0.001 threshold
+    op.execute("UPDATE test_results SET bin = CASE WHEN result_value <= 0.001 THEN 1 ELSE 2 END")
+
+def downgrade():
+    op.drop_column('test_results', 'bin')
+    with op.batch_alter_table('wafers') as batch:
+        batch.drop_column('program_id')
+    op.drop_table('test_limits')
+    op.drop_table('test_programs')
@@ -0,0 +1,21 @@
+"""
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Keyset pagination of /tests/results walks (wafer_id, id) in order
+    with op.get_context().autocommit_block():
+        op.create_index('ix_test_results_wafer_id_id', 'test_results', ['wafer_id', 'id'], postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_test_results_wafer_id_id', table_name='test_results', postgresql_concurrently=True)
@@ -0,0 +1,56 @@
+"""
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('test_results', sa.Column('insertion', sa.SmallInteger, nullable=False, server_default='1'))
+    # Retried runs used to insert every die again; keep the latest result.
+    # Yield aggregates of the affected wafers still count the duplicates,
+    # rebuild them afterwards with `python -m app.aggregates`.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("""
+            DELETE FROM test_results a
+            USING test_results b
+            WHERE a.wafer_id = b.wafer_id
+              AND a.die_x = b.die_x
+              AND a.die_y = b.die_y
+              AND a.test_name = b.test_name
+              AND a.insertion = b.insertion
+              AND a.id < b.id
+        """)
+    else:
+        # DELETE ... USING is PostgreSQL only
+        op.execute("""
+            DELETE FROM test_results
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM test_results
+                GROUP BY wafer_id, insertion, die_x, die_y, test_name
+            )
+        """)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_test_results_die_test', 'test_results',
+            ['wafer_id', 'insertion', 'die_x', 'die_y', 'test_name'],
+            unique=True, postgresql_concurrently=True
+        )
+        # Superseded by the unique index, which also leads with wafer_id
+        op.drop_index('ix_test_results_wafer_die_test', table_name='test_results', postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_test_results_wafer_die_test', 'test_results',
+            ['wafer_id', 'die_x', 'die_y', 'test_name'], postgresql_concurrently=True
+        )
+        op.drop_index('uq_test_results_die_test', table_name='test_results', postgresql_concurrently=True)
+    op.drop_column('test_results', 'insertion')
@@ -0,0 +1,19 @@
+"""
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('wafers', sa.Column('results_version', sa.Integer, nullable=False, server_default='0'))
+
+def downgrade():
+    op.drop_column('wafers', 'results_version')
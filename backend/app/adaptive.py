@@ -0,0 +1,349 @@
+"""
+Adaptive test flow: skip tests a wafer has shown to be redundant.
+
+``AdaptiveEngine`` keeps running statistics of every test over the dies of
+one wafer as results stream in. After ``warmup_dies`` dies, a test whose
+window has at most ``max_fails`` failures and a Cpk of at least ``min_cpk``
+is dropped, except ``keep_tests`` (default: the first test of the flow),
+so every die is still contacted and binned. A dropped test still runs:
+
+- on every ``sample_every``-th die, to keep watching the distribution
+- on every die next to a failing die, so unstable regions get the full
+  flow
+
+The window is frozen while a test is dropped. A sampled result that fails,
+or lies more than ``drift_sigma`` sigmas from the frozen mean, re-enables
+the test with a fresh window.
+
+Adaptive testing is off unless ``test_params["adaptive"]`` is set: ``true``
+for ``ADAPTIVE_POLICY``, or a dict overriding fields of it, e.g.
+
+    {"adaptive": {"min_cpk": 3, "sample_every": 5}}
+
+Dies are planned ``block_size`` at a time and each block goes to the
+instrument in one call, in the planned stepping order, with the tests of
+every die in ``params["die_tests"]``. Drivers without ``per_die_tests``
+get one call per test set of the block instead, through ``params["dies"]``
+and ``params["tests"]``, which steps the block one test set after the
+other. A die tested with a reduced flow counts as incomplete for resume
+after a failure, so it is probed again on the retry.
+
+``simulate`` replays stored results through a policy and reports the test
+time saved against the failures that would have escaped:
+
+    python -m app.adaptive simulate [--batch-id LOT] [--wafer-id ID ...] [--policy JSON]
+"""
+import argparse
+import json
+import math
+import os
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from .binning import PASS_BIN, BinTable, bin_table
+from .models import TestProgram, Wafer
+from .stats import NEIGHBOR_OFFSETS, load_results
+
+load_dotenv()
+ADAPTIVE_POLICY = json.loads(os.getenv("ADAPTIVE_POLICY", "{}"))
+
+
+@dataclass
+class AdaptivePolicy:
+    warmup_dies: int = 100
+    min_cpk: float = 2.0
+    max_fails: int = 0
+    sample_every: int = 10
+    neighborhood: bool = True
+    drift_sigma: float = 4.0
+    block_size: int = 64
+    # Never dropped; None keeps the first test of the flow
+    keep_tests: Optional[List[str]] = None
+    # Seconds per test per die, for the simulated test time (default 1)
+    test_times: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for name in ("warmup_dies", "sample_every", "block_size"):
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError(f"{name} must be a positive integer, got {value!r}")
+        if isinstance(self.max_fails, bool) or not isinstance(self.max_fails, int) or self.max_fails < 0:
+            raise ValueError(f"max_fails must be a non-negative integer, got {self.max_fails!r}")
+        if isinstance(self.min_cpk, bool) or not isinstance(self.min_cpk, (int, float)):
+            raise ValueError(f"min_cpk must be a number, got {self.min_cpk!r}")
+        if (isinstance(self.drift_sigma, bool) or not isinstance(self.drift_sigma, (int, float))
+                or not self.drift_sigma >= 0):
+            raise ValueError(f"drift_sigma must be a non-negative number, got {self.drift_sigma!r}")
+        if self.keep_tests is not None and (
+                not isinstance(self.keep_tests, list) or not all(isinstance(t, str) for t in self.keep_tests)):
+            raise ValueError(f"keep_tests must be a list of test names, got {self.keep_tests!r}")
+        if not isinstance(self.test_times, dict) or not all(
+                isinstance(t, (int, float)) and not isinstance(t, bool) and t >= 0 for t in self.test_times.values()):
+            raise ValueError(f"test_times must map test names to non-negative seconds, got {self.test_times!r}")
+
+    @classmethod
+    def from_params(cls, value) -> Optional["AdaptivePolicy"]:
+        """The policy ``test_params["adaptive"]`` asks for, or None when off."""
+        if not value:
+            return None
+        overrides = value if isinstance(value, dict) else {}
+        known = {f.name for f in fields(cls)}
+        unknown = set(overrides) - known
+        if unknown:
+            raise ValueError(f"Unknown adaptive policy fields: {', '.join(sorted(unknown))}")
+        return cls(**{**ADAPTIVE_POLICY, **overrides})
+
+
+class _TestState:
+    """Welford window of one test's values, plus its drop state."""
+
+    def __init__(self):
+        self.dropped = False
+        self.drops = 0
+        self.reenables = 0
+        self.runs = 0
+        self.skipped = 0
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.fails = 0
+
+    def add(self, value: float, failed: bool):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.fails += failed
+
+    @property
+    def sigma(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def cpk(self, lsl: float, usl: float) -> Optional[float]:
+        sides = [s for s in (usl - self.mean, self.mean - lsl) if not math.isnan(s)]
+        if not sides or self.n < 2:
+            return None
+        if self.sigma == 0:
+            return math.inf if min(sides) > 0 else -math.inf
+        return min(sides) / (3 * self.sigma)
+
+
+class AdaptiveEngine:
+    """
+    Per-wafer adaptive test flow.
+
+    Args:
+        policy: When to drop, sample and re-enable tests
+        tests: Test names of the full flow, in order
+        bins: Limits the results are judged against
+    """
+
+    def __init__(self, policy: AdaptivePolicy, tests: List[str], bins: BinTable):
+        self.policy = policy
+        self.tests = list(tests)
+        self.bins = bins
+        self.state = {t: _TestState() for t in self.tests}
+        self.keep = set(self.tests[:1] if policy.keep_tests is None else policy.keep_tests)
+        self._limits = {
+            t: (float(bins.lsl[bins.names.get(t, 0)]), float(bins.usl[bins.names.get(t, 0)])) for t in self.tests
+        }
+        self._bad = set()
+        self._planned = 0
+
+    def tests_for(self, die: Tuple[int, int]) -> List[str]:
+        """Tests to run on ``die``; call once per die, in stepping order."""
+        sample = self._planned % self.policy.sample_every == 0
+        self._planned += 1
+        unstable = self.policy.neighborhood and any(
+            (die[0] + dx, die[1] + dy) in self._bad for dy, dx in NEIGHBOR_OFFSETS
+        )
+        chosen = []
+        for t in self.tests:
+            if not self.state[t].dropped or sample or unstable:
+                chosen.append(t)
+            else:
+                self.state[t].skipped += 1
+        return chosen
+
+    def plan(self, dies: List[Tuple[int, int]]) -> List[Tuple[Tuple[int, int], List[str]]]:
+        """Tests of each die of a block, in stepping order; dies needing none are left out."""
+        planned = []
+        for die in dies:
+            tests = self.tests_for(die)
+            if tests:
+                planned.append((die, tests))
+        return planned
+
+    def observe(self, rows: List[dict]):
+        """Feed results (``{"x", "y", "test", "value"}``) back into the window."""
+        if not rows:
+            return
+        codes = self.bins.assign([r["test"] for r in rows], [r["value"] for r in rows])
+        for row, code in zip(rows, codes.tolist()):
+            state = self.state.get(row["test"])
+            if state is None:
+                continue
+            failed = code != PASS_BIN
+            if failed:
+                self._bad.add((row["x"], row["y"]))
+            value = row["value"]
+            state.runs += 1
+            if state.dropped:
+                if not failed and abs(value - state.mean) <= self.policy.drift_sigma * state.sigma:
+                    continue
+                # Drift: back to the full flow, learning a new window
+                state.dropped = False
+                state.reenables += 1
+                state.reset()
+            state.add(value, failed)
+            if (
+                not state.dropped
+                and row["test"] not in self.keep
+                and state.n >= self.policy.warmup_dies
+                and state.fails <= self.policy.max_fails
+            ):
+                cpk = state.cpk(*self._limits[row["test"]])
+                if cpk is not None and cpk >= self.policy.min_cpk:
+                    state.dropped = True
+                    state.drops += 1
+
+    def _calls(self, instrument, params: dict, planned: List[Tuple[Tuple[int, int], List[str]]]) -> List[dict]:
+        """Driver params running one planned block."""
+        if not planned:
+            return []
+        dies = [list(d) for d, _ in planned]
+        if instrument.per_die_tests:
+            return [{**params, "dies": dies, "die_tests": [tests for _, tests in planned]}]
+        groups: Dict[Tuple[str, ...], List[list]] = {}
+        for die, (_, tests) in zip(dies, planned):
+            groups.setdefault(tuple(tests), []).append(die)
+        entries = params.get("tests") or self.tests
+        return [
+            {**params, "dies": group, "tests": [t for t in entries if (t if isinstance(t, str) else t["name"]) in tests]}
+            for tests, group in groups.items()
+        ]
+
+    def iter_results(self, instrument, params: dict) -> Iterator[List[dict]]:
+        """Drive ``instrument`` over ``params``' dies with the adaptive flow, a block per call."""
+        dies = instrument.dies(params)
+        if dies is None:
+            raise ValueError("Adaptive testing needs the wafer's dies or diameter in the test params")
+        for start in range(0, len(dies), self.policy.block_size):
+            for call in self._calls(instrument, params, self.plan(dies[start:start + self.policy.block_size])):
+                for batch in instrument.iter_results(call):
+                    self.observe(batch)
+                    yield batch
+
+    def summary(self) -> dict:
+        return {
+            t: {"runs": s.runs, "skipped": s.skipped, "dropped": s.dropped, "drops": s.drops, "reenables": s.reenables}
+            for t, s in self.state.items()
+        }
+
+
+def simulate_wafer(arrays, policy: AdaptivePolicy, bins: BinTable) -> dict:
+    """
+    Replay one wafer's stored results (``stats.ResultArrays``) through the
+    engine, stepping dies in raster order.
+    """
+    order = np.lexsort((arrays.x, arrays.y))
+    history: Dict[Tuple[int, int], Dict[str, Tuple[float, int]]] = {}
+    for i in order.tolist():
+        die = (int(arrays.x[i]), int(arrays.y[i]))
+        history.setdefault(die, {})[arrays.tests[arrays.test[i]]] = (float(arrays.value[i]), int(arrays.bin[i]))
+
+    engine = AdaptiveEngine(policy, arrays.tests, bins)
+    times = {t: policy.test_times.get(t, 1.0) for t in arrays.tests}
+    full_time = run_time = 0.0
+    executed = {}
+    dies = list(history)
+    for start in range(0, len(dies), policy.block_size):
+        rows = []
+        for die, tests in engine.plan(dies[start:start + policy.block_size]):
+            executed[die] = set(tests)
+            for t in tests:
+                if t in history[die]:
+                    rows.append({"x": die[0], "y": die[1], "test": t, "value": history[die][t][0]})
+        engine.observe(rows)
+
+    summary = engine.summary()
+    for t in summary:
+        summary[t]["escapes"] = 0
+    failing = escapes = 0
+    for die, results in history.items():
+        ran = executed.get(die, set())
+        full_time += sum(times[t] for t in results)
+        run_time += sum(times[t] for t in results if t in ran)
+        failed = [t for t, (_, code) in results.items() if code != PASS_BIN]
+        if failed:
+            failing += 1
+            # An escape: every failing result of the die was skipped
+            if not ran.intersection(failed):
+                escapes += 1
+                for t in failed:
+                    summary[t]["escapes"] += 1
+    return {
+        "dies": len(history),
+        "failing_dies": failing,
+        "escapes": escapes,
+        "test_time": full_time,
+        "adaptive_test_time": run_time,
+        "tests": summary,
+    }
+
+
+def simulate(db: Session, wafers: List[Wafer], policy: AdaptivePolicy) -> dict:
+    """
+    Replay wafers one at a time and total the test time saved and the
+    escapes (failing dies whose failing tests were all skipped).
+    """
+    per_wafer = {}
+    for wafer in wafers:
+        version = db.query(TestProgram.version).filter(TestProgram.id == wafer.program_id).scalar()
+        per_wafer[wafer.id] = simulate_wafer(load_results(db, [wafer]), policy, bin_table(db, wafer.program_id, version))
+
+    totals = {k: sum(w[k] for w in per_wafer.values()) for k in ("dies", "failing_dies", "escapes", "test_time", "adaptive_test_time")}
+    saved = totals["test_time"] - totals["adaptive_test_time"]
+    return {
+        "policy": asdict(policy),
+        **totals,
+        "time_saved_pct": 100 * saved / totals["test_time"] if totals["test_time"] else 0.0,
+        "escape_rate": totals["escapes"] / totals["failing_dies"] if totals["failing_dies"] else 0.0,
+        "escape_ppm": 1e6 * totals["escapes"] / totals["dies"] if totals["dies"] else 0.0,
+        "wafers": per_wafer,
+    }
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Replay stored results through an adaptive test policy")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sim = commands.add_parser("simulate", help="Report test time saved versus escapes")
+    sim.add_argument("--batch-id")
+    sim.add_argument("--wafer-id", type=int, nargs="*")
+    sim.add_argument("--policy", default="true", help="JSON policy overrides, or true for ADAPTIVE_POLICY")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        query = db.query(Wafer).order_by(Wafer.id)
+        if args.wafer_id:
+            query = query.filter(Wafer.id.in_(args.wafer_id))
+        if args.batch_id is not None:
+            query = query.filter(Wafer.batch_id == args.batch_id)
+        report = simulate(db, query.all(), AdaptivePolicy.from_params(json.loads(args.policy)))
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Incrementally maintained yield aggregates.
+
+Every ingested chunk adds its per-(wafer, test, hour) totals to
+``yield_aggregates`` so /analytics/yield never scans ``test_results``.
+Existing data is loaded with:
+
+    python -m app.aggregates [--wafer-id ID ...]
+"""
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import case, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .binning import PASS_BIN
+from .models import TestResult, Wafer, YieldAggregate
+
+
+def bucket_of(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def dialect_insert(db: Session):
+    """
+    ``insert`` of the session's dialect, for ``on_conflict_do_update``, or
+    None on dialects other than PostgreSQL and SQLite.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    return None
+
+
+def update_yield_aggregates(
+    db: Session, wafer_id: int, batch_id: str, rows: List[dict], replaced: List[dict] = ()
+):
+    """
+    Add a chunk of freshly inserted result rows to the aggregates, taking
+    out the ``replaced`` rows they overwrote (no commit).
+    """
+    totals, passes = Counter(), Counter()
+    for sign, chunk in ((1, rows), (-1, replaced)):
+        for r in chunk:
+            key = (r["test_name"], bucket_of(r["timestamp"]))
+            totals[key] += sign
+            if r["bin"] == PASS_BIN:
+                passes[key] += sign
+
+    values = [
+        {
+            "wafer_id": wafer_id,
+            "batch_id": batch_id,
+            "test_name": test_name,
+            "bucket": bucket,
+            "total": total,
+            "passes": passes[(test_name, bucket)],
+        }
+        for (test_name, bucket), total in totals.items()
+        if total or passes[(test_name, bucket)]
+    ]
+    if not values:
+        return
+
+    table = YieldAggregate.__table__
+    upsert_insert = dialect_insert(db)
+    if upsert_insert is None:
+        # No ON CONFLICT: add to the existing buckets, insert the new ones
+        for value in values:
+            updated = db.execute(
+                update(table)
+                .where(
+                    table.c.wafer_id == value["wafer_id"],
+                    table.c.test_name == value["test_name"],
+                    table.c.bucket == value["bucket"],
+                )
+                .values(total=table.c.total + value["total"], passes=table.c.passes + value["passes"])
+            )
+            if not updated.rowcount:
+                db.execute(insert(table), value)
+        return
+
+    stmt = upsert_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.wafer_id, table.c.test_name, table.c.bucket],
+        set_={
+            "total": table.c.total + stmt.excluded.total,
+            "passes": table.c.passes + stmt.excluded.passes,
+        },
+    )
+    db.execute(stmt, values)
+
+
+def _bucket_expr(db: Session):
+    if db.get_bind().dialect.name == "sqlite":
+        # Match the string SQLAlchemy stores for a Python datetime
+        return func.strftime("%Y-%m-%d %H:00:00.000000", TestResult.timestamp)
+    return func.date_trunc("hour", TestResult.timestamp)
+
+
+def backfill_yield_aggregates(db: Session, wafer_ids: List[int] = None) -> int:
+    """
+    Rebuild aggregates from ``test_results``, one wafer per transaction.
+
+    Returns:
+        Number of wafers rebuilt
+    """
+    if wafer_ids is None:
+        wafer_ids = [w for (w,) in db.query(Wafer.id).order_by(Wafer.id)]
+
+    bucket = _bucket_expr(db)
+    for wafer_id in wafer_ids:
+        db.query(YieldAggregate).filter(YieldAggregate.wafer_id == wafer_id).delete()
+        grouped = (
+            select(
+                TestResult.wafer_id,
+                Wafer.batch_id,
+                TestResult.test_name,
+                bucket,
+                func.count(),
+                func.sum(case((TestResult.bin == PASS_BIN, 1), else_=literal(0))),
+            )
+            .join(Wafer, Wafer.id == TestResult.wafer_id)
+            .where(TestResult.wafer_id == wafer_id)
+            .group_by(TestResult.wafer_id, Wafer.batch_id, TestResult.test_name, bucket)
+        )
+        db.execute(
+            insert(YieldAggregate).from_select(
+                ["wafer_id", "batch_id", "test_name", "bucket", "total", "passes"], grouped
+            )
+        )
+        db.commit()
+    return len(wafer_ids)
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill yield aggregates from test_results")
+    parser.add_argument("--wafer-id", type=int, nargs="*", help="Only rebuild these wafers")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = backfill_yield_aggregates(db, args.wafer_id or None)
+    finally:
+        db.close()
+    print(f"Rebuilt yield aggregates for {count} wafers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Columnar export and archival of wafer test results.
+
+Results are written as Parquet, one file per wafer, in a Hive-partitioned
+layout under ``ARCHIVE_DIR``:
+
+    batch_id=<lot>/wafer_id=<id>/results.parquet
+
+so ``results_dataset()`` (or DuckDB, Spark, pandas) can scan months of
+results, pruned to a lot or wafer by directory, without touching the OLTP
+database.
+
+Archiving a wafer exports it, checks the file's row count against
+``test_results`` and only then deletes the wafer's rows and stamps
+``wafers.archived_at``. Yield aggregates are kept, so /analytics/yield and
+wafer map versions are unchanged; wafer maps and exports of an archived
+wafer are read back from its file. A Celery beat job archives wafers with
+no results in the last ``ARCHIVE_AFTER_DAYS`` days.
+
+    python -m app.archive export --out DIR [--batch-id LOT] [--wafer-id ID ...]
+    python -m app.archive archive [--older-than-days N]
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .models import TestResult, Wafer, YieldAggregate
+
+load_dotenv()
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "50000"))
+
+RESULT_SCHEMA = pa.schema([
+    ("wafer_id", pa.int64()),
+    ("batch_id", pa.string()),
+    ("die_x", pa.int32()),
+    ("die_y", pa.int32()),
+    ("test_name", pa.string()),
+    ("result_value", pa.float64()),
+    ("bin", pa.int16()),
+    ("insertion", pa.int16()),
+    ("timestamp", pa.timestamp("us")),
+])
+PARTITION_SCHEMA = pa.schema([RESULT_SCHEMA.field("batch_id"), RESULT_SCHEMA.field("wafer_id")])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+# Partition keys live in the directory names, not in the files
+FILE_SCHEMA = pa.schema([f for f in RESULT_SCHEMA if f.name not in PARTITION_SCHEMA.names])
+FILE_NAME = "results.parquet"
+
+
+def wafer_path(root: str, batch_id: str, wafer_id: int) -> str:
+    key = (ds.field("batch_id") == pa.scalar(batch_id, pa.string())) & (ds.field("wafer_id") == wafer_id)
+    directory, _ = PARTITIONING.format(key)
+    return os.path.join(root, directory, FILE_NAME)
+
+
+def results_dataset(root: str = ARCHIVE_DIR) -> ds.Dataset:
+    """All archived results as one dataset, with ``batch_id`` and ``wafer_id`` from the paths."""
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=RESULT_SCHEMA)
+
+
+def _db_batches(db: Session, wafer: Wafer, chunk_size: int) -> Iterator[pa.RecordBatch]:
+    query = (
+        select(
+            TestResult.die_x,
+            TestResult.die_y,
+            TestResult.test_name,
+            TestResult.result_value,
+            TestResult.bin,
+            TestResult.insertion,
+            TestResult.timestamp,
+        )
+        .where(TestResult.wafer_id == wafer.id)
+        .order_by(TestResult.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for rows in db.execute(query).partitions():
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=f.type) for col, f in zip(columns, FILE_SCHEMA)], schema=FILE_SCHEMA
+        )
+
+
+def _with_insertion(data, columns: List[str], stored: List[str]):
+    """
+    ``data`` (a table or record batch read from an archive file) with
+    ``columns`` in order. Files archived before results had an insertion
+    column read as insertion 1.
+    """
+    if "insertion" in columns and "insertion" not in stored:
+        data = data.append_column(
+            RESULT_SCHEMA.field("insertion"), pa.array([1] * data.num_rows, type=pa.int16())
+        )
+    return data.select(columns)
+
+
+def _archived_batches(wafer: Wafer, root: str, chunk_size: int) -> Iterator[pa.RecordBatch]:
+    with pq.ParquetFile(wafer_path(root, wafer.batch_id, wafer.id)) as f:
+        stored = f.schema_arrow.names
+        for batch in f.iter_batches(batch_size=chunk_size, columns=[c for c in FILE_SCHEMA.names if c in stored]):
+            yield _with_insertion(batch, FILE_SCHEMA.names, stored)
+
+
+def read_archived(wafer: Wafer, columns: List[str] = None, root: str = ARCHIVE_DIR) -> pa.Table:
+    """A wafer's archived results, all of ``FILE_SCHEMA`` or just ``columns``."""
+    path = wafer_path(root, wafer.batch_id, wafer.id)
+    columns = columns or FILE_SCHEMA.names
+    stored = pq.read_schema(path).names
+    return _with_insertion(pq.read_table(path, columns=[c for c in columns if c in stored]), columns, stored)
+
+
+def iter_wafer_batches(
+    db: Session, wafer: Wafer, chunk_size: int = EXPORT_CHUNK_SIZE, root: str = ARCHIVE_DIR
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream a wafer's results as ``RESULT_SCHEMA`` record batches, from the
+    database or, once archived, from its Parquet file.
+    """
+    if wafer.archived_at is not None:
+        source = _archived_batches(wafer, root, chunk_size)
+    else:
+        source = _db_batches(db, wafer, chunk_size)
+    for batch in source:
+        n = batch.num_rows
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array([wafer.id] * n, type=pa.int64()),
+                pa.array([wafer.batch_id] * n, type=pa.string()),
+                *batch.columns,
+            ],
+            schema=RESULT_SCHEMA,
+        )
+
+
+def export_wafer(db: Session, wafer: Wafer, root: str) -> int:
+    """
+    Write one wafer's results to its partition under ``root``, replacing
+    any earlier export.
+
+    Returns:
+        Number of rows written
+    """
+    path = wafer_path(root, wafer.batch_id, wafer.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    rows = 0
+    with pq.ParquetWriter(tmp, FILE_SCHEMA, compression="zstd") as writer:
+        for batch in iter_wafer_batches(db, wafer):
+            writer.write_batch(batch.select(FILE_SCHEMA.names))
+            rows += batch.num_rows
+    os.replace(tmp, path)
+    return rows
+
+
+def _wafers(db: Session, wafer_ids: List[int] = None, batch_id: str = None) -> List[Wafer]:
+    query = db.query(Wafer).order_by(Wafer.id)
+    if wafer_ids:
+        query = query.filter(Wafer.id.in_(wafer_ids))
+    if batch_id is not None:
+        query = query.filter(Wafer.batch_id == batch_id)
+    return query.all()
+
+
+def export_results(db: Session, root: str, wafer_ids: List[int] = None, batch_id: str = None) -> int:
+    """
+    Export wafers (all, a lot, or a list) to a partitioned Parquet tree.
+
+    Returns:
+        Number of rows written
+    """
+    return sum(export_wafer(db, wafer, root) for wafer in _wafers(db, wafer_ids, batch_id))
+
+
+def archive_wafer(db: Session, wafer: Wafer, root: str = ARCHIVE_DIR) -> int:
+    """
+    Move a wafer's results from ``test_results`` to its Parquet file.
+
+    Returns:
+        Number of rows archived
+
+    Raises:
+        RuntimeError: If the written file does not hold every row
+    """
+    if wafer.archived_at is not None:
+        return 0
+    rows = export_wafer(db, wafer, root)
+    expected = db.query(func.count(TestResult.id)).filter(TestResult.wafer_id == wafer.id).scalar()
+    written = pq.read_metadata(wafer_path(root, wafer.batch_id, wafer.id)).num_rows
+    if written != rows or written != expected:
+        raise RuntimeError(f"Archive of wafer {wafer.id} holds {written} rows, expected {expected}")
+
+    db.execute(delete(TestResult).where(TestResult.wafer_id == wafer.id))
+    wafer.archived_at = datetime.now()
+    db.commit()
+    return rows
+
+
+def cold_wafers(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS) -> List[Wafer]:
+    """Unarchived wafers created, and last tested, before the cutoff."""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    recent = select(YieldAggregate.wafer_id).where(YieldAggregate.bucket >= cutoff)
+    return (
+        db.query(Wafer)
+        .filter(Wafer.archived_at.is_(None), Wafer.created_at < cutoff, Wafer.id.not_in(recent))
+        .order_by(Wafer.id)
+        .all()
+    )
+
+
+def archive_cold_wafers(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, root: str = ARCHIVE_DIR) -> int:
+    """
+    Archive every cold wafer, one wafer per transaction.
+
+    Returns:
+        Number of rows archived
+    """
+    return sum(archive_wafer(db, wafer, root) for wafer in cold_wafers(db, older_than_days))
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_export(db: Session, wafers: List[Wafer], format: str = "parquet") -> Iterator[bytes]:
+    """
+    Encode wafers' results as one Parquet file or Arrow IPC stream, yielding
+    bytes as each record batch is written so memory stays bounded.
+    """
+    sink = _ChunkSink()
+    if format == "arrow":
+        writer = ipc.new_stream(sink, RESULT_SCHEMA)
+    else:
+        writer = pq.ParquetWriter(sink, RESULT_SCHEMA, compression="zstd")
+    with writer:
+        for wafer in wafers:
+            for batch in iter_wafer_batches(db, wafer):
+                writer.write_batch(batch)
+                if data := sink.drain():
+                    yield data
+    yield sink.drain()
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Export or archive wafer test results as Parquet")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write results to a partitioned Parquet tree")
+    export.add_argument("--out", required=True)
+    export.add_argument("--batch-id")
+    export.add_argument("--wafer-id", type=int, nargs="*")
+    archive = commands.add_parser("archive", help="Move cold wafers out of test_results")
+    archive.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    archive.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            rows = export_results(db, args.out, args.wafer_id, args.batch_id)
+            print(f"Exported {rows} rows to {args.out}")
+        else:
+            rows = archive_cold_wafers(db, args.older_than_days, args.root)
+            print(f"Archived {rows} rows to {args.root}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
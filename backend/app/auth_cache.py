@@ -0,0 +1,107 @@
+"""
+Per-process caches for the authentication fast path.
+
+- ``token_cache``: tokens whose signature and claims were already verified,
+  keyed by SHA-256 of the token (raw tokens are never kept) and dropped
+  once their ``exp`` passes
+- ``user_cache``: users by username for ``USER_CACHE_TTL`` seconds;
+  ``invalidate`` is called whenever a user is created, changed or deleted
+
+Invalidation is local to the process; other API workers see a change at
+the latest when their entry expires.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """What request handlers need of the current user, detached from any session."""
+
+    id: int
+    username: str
+    role: str
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries carry their own expiry time."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if time.time() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, expires: float):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {"size": size, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0}
+
+
+class TokenCache(TTLCache):
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[str]:
+        """Username of an already verified, unexpired token."""
+        return super().get(self._key(token))
+
+    def put(self, token: str, username: str, exp: float):
+        super().put(self._key(token), username, exp)
+
+
+class UserCache(TTLCache):
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def put(self, username: str, user: AuthUser):
+        super().put(username, user, time.time() + self.ttl)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
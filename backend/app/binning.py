@@ -0,0 +1,110 @@
+"""
+Test limits and bin assignment.
+
+Every ingested result gets a bin code: ``PASS_BIN`` when its value is
+within its test's limits, otherwise that test's fail bin. Bins are decided
+once per chunk at ingest and stored on ``test_results.bin``; yield
+aggregates, wafer maps, exports and statistics read the stored bin.
+
+Limits are defined per test program (``test_programs``/``test_limits``). A
+limit's ``test_name`` may be ``"*"`` to cover every test without its own
+entry; tests with no applicable limit always pass. Wafers tested without a
+program use ``TEST_LIMITS``, a JSON object of the same shape:
+
+    {"IV": {"usl": 0.001, "fail_bin": 3}, "*": {"usl": 0.001}}
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from .models import TestProgram
+
+load_dotenv()
+PASS_BIN = 1
+DEFAULT_FAIL_BIN = 2
+# Pass limit used before test programs existed, and the default for every test
+PASS_THRESHOLD = 0.001
+TEST_LIMITS = json.loads(os.getenv("TEST_LIMITS", json.dumps({"*": {"usl": PASS_THRESHOLD}})))
+
+
+@dataclass
+class BinTable:
+    """Limits of one program, laid out as arrays for vectorized binning."""
+
+    names: Dict[str, int]
+    lsl: np.ndarray
+    usl: np.ndarray
+    fail_bin: np.ndarray
+
+    @classmethod
+    def from_limits(cls, limits: dict) -> "BinTable":
+        # Index 0 is the catch-all: "*" if defined, otherwise always pass
+        entries = [("*", limits.get("*", {}))] + [(k, v) for k, v in limits.items() if k != "*"]
+        lsl, usl, fail_bin = [], [], []
+        for _, spec in entries:
+            lsl.append(np.nan if spec.get("lsl") is None else spec["lsl"])
+            usl.append(np.nan if spec.get("usl") is None else spec["usl"])
+            fail_bin.append(spec.get("fail_bin") or DEFAULT_FAIL_BIN)
+        return cls(
+            {name: i for i, (name, _) in enumerate(entries)},
+            np.asarray(lsl, dtype=np.float64),
+            np.asarray(usl, dtype=np.float64),
+            np.asarray(fail_bin, dtype=np.int16),
+        )
+
+    def limits(self) -> dict:
+        """The table as a ``TEST_LIMITS``-shaped dict."""
+        return {
+            name: {
+                "lsl": None if np.isnan(self.lsl[i]) else float(self.lsl[i]),
+                "usl": None if np.isnan(self.usl[i]) else float(self.usl[i]),
+                "fail_bin": int(self.fail_bin[i]),
+            }
+            for name, i in self.names.items()
+        }
+
+    def assign(self, test_names: List[str], values) -> np.ndarray:
+        """Bin codes for parallel sequences of test names and values."""
+        index = np.fromiter((self.names.get(n, 0) for n in test_names), np.int64, len(test_names))
+        values = np.asarray(values, dtype=np.float64)
+        # Comparisons against a missing (NaN) limit are False
+        failed = (values < self.lsl[index]) | (values > self.usl[index])
+        return np.where(failed, self.fail_bin[index], PASS_BIN).astype(np.int16)
+
+
+DEFAULT_BIN_TABLE = BinTable.from_limits(TEST_LIMITS)
+
+_tables: Dict[tuple, BinTable] = {}
+_lock = threading.Lock()
+
+
+def bin_table(db: Session, program_id: Optional[int], version: Optional[int] = None) -> BinTable:
+    """
+    The bin table of a program, cached per program version so workers pick
+    up edited limits on their next chunk.
+    """
+    if program_id is None:
+        return DEFAULT_BIN_TABLE
+    if version is None:
+        version = db.query(TestProgram.version).filter(TestProgram.id == program_id).scalar()
+    key = (program_id, version)
+    with _lock:
+        table = _tables.get(key)
+    if table is None:
+        program = db.get(TestProgram, program_id)
+        table = BinTable.from_limits({
+            limit.test_name: {"lsl": limit.lsl, "usl": limit.usl, "fail_bin": limit.fail_bin}
+            for limit in program.limits
+        })
+        with _lock:
+            # Older versions of the program are never looked up again
+            for stale in [k for k in _tables if k[0] == program_id]:
+                del _tables[stale]
+            _tables[key] = table
+    return table
@@ -1,8 +1,15 @@
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import celeryd_after_setup, task_postrun, task_prerun, worker_init, worker_process_shutdown
 from celery.utils.log import get_task_logger
 import os
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
+from app import metrics
+
 load_dotenv()
 
 logger = get_task_logger(__name__)
@@ -19,44 +26,248 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # Lot and wafer test priorities 0-9 (app.scheduler) on the Redis broker
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
+    beat_schedule={
+        "archive-cold-wafers": {
+            "task": "archive_cold_wafers",
+            "schedule": crontab(hour=3, minute=0),
+        },
+    },
 )
 
+@worker_process_shutdown.connect
+def close_instrument_sessions(**kwargs):
+    from app.hardware.session_pool import instrument_pool
+    instrument_pool.close()
+    metrics.mark_process_dead(os.getpid())
+
+@worker_init.connect
+def serve_worker_metrics(**kwargs):
+    if metrics.WORKER_METRICS_PORT:
+        metrics.serve(int(metrics.WORKER_METRICS_PORT))
+
+# Start times of running tasks, by task ID
+_task_starts = {}
+_task_starts_lock = threading.Lock()
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    with _task_starts_lock:
+        _task_starts[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    with _task_starts_lock:
+        start = _task_starts.pop(task_id, None)
+    if start is not None:
+        metrics.TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start)
+
+@celeryd_after_setup.connect
+def consume_instrument_queues(sender, instance, **kwargs):
+    # Each worker also consumes the queues of the instruments it serves
+    # (WORKER_INSTRUMENTS, comma-separated names; default all registered)
+    from app.instruments import registry
+    names = os.getenv("WORKER_INSTRUMENTS")
+    names = [n.strip() for n in names.split(",")] if names else list(registry)
+    for name in names:
+        instance.app.amqp.queues.select_add(registry[name].queue)
+
 @celery_app.task(bind=True, name="run_wafer_test")
-def run_wafer_test(self, wafer_id: int, instrument_type: str, test_params: dict):
-    from app.hardware.scpi_driver import SCPIInstrument
-    from app.hardware.rest_driver import RESTInstrument
+def run_wafer_test(
+    self,
+    wafer_id: int,
+    instrument_type: str,
+    test_params: dict,
+    instrument: str = None,
+    enqueued_at: float = None,
+    failures: int = 0,
+    insertion: int = 1,
+    started_at: float = None,
+    lot_id: str = None
+):
+    from app.adaptive import AdaptiveEngine, AdaptivePolicy
+    from app.binning import bin_table
+    from app.hardware.path_planner import plan_from_params
+    from app.hardware.session_pool import instrument_pool
     from app.database import SessionLocal
-    from app.models import TestResult
+    from app.ingest import bulk_insert_results, completed_dies, has_results
+    from app.models import Wafer
+    from app.instruments import registry
+    from app.scheduler import LockHeartbeat, state
+    from app.task_status import ProgressReporter
+    
+    if instrument is not None:
+        # One active job per instrument: wait our turn if another worker
+        # is already driving this prober
+        if not state.try_lock(instrument, self.request.id):
+            raise self.retry(countdown=5, max_retries=None)
+        if enqueued_at is not None:
+            wait = time.time() - enqueued_at
+            state.started(instrument, wait)
+            metrics.QUEUE_WAIT.labels(instrument).observe(wait)
+    if lot_id is not None and state.lot_cancelled(lot_id):
+        if instrument is not None:
+            state.unlock(instrument, self.request.id)
+        logger.info(f"Lot {lot_id} cancelled, skipping wafer {wafer_id}")
+        return {"status": "cancelled", "wafer_id": wafer_id, "results": 0}
     
     logger.info(f"Starting test for wafer {wafer_id}")
+    # Results written since the first attempt started are this run's
+    # checkpoint; retries carry the start time along
+    started_at = started_at or time.time()
+    heartbeat = None
     try:
-        # Initialize instrument
-        if instrument_type == "SCPI":
-            instr = SCPIInstrument(address=os.getenv("DEFAULT_SCPI_ADDRESS"))
+        if instrument is not None:
+            # Keeps the lock however long the wafer takes
+            heartbeat = LockHeartbeat(instrument, self.request.id).start()
+            address = registry[instrument].address
+        elif instrument_type == "SCPI":
+            address = os.getenv("DEFAULT_SCPI_ADDRESS")
+        elif instrument_type == "FAKE":
+            address = None
         else:
-            instr = RESTInstrument(base_url=os.getenv("DEFAULT_REST_API_URL"))
-        
-        # Run test
-        results = instr.run_test(test_params)
+            address = os.getenv("DEFAULT_REST_API_URL")
         
-        # Save results
+        # Run test on a pooled instrument session, saving each batch as the
+        # prober steps
         db = SessionLocal()
+        written = 0
+        status = "completed"
         try:
-            for die in results["die_data"]:
-                tr = TestResult(
-                    wafer_id=wafer_id,
-                    die_x=die["x"],
-                    die_y=die["y"],
-                    test_name=die["test"],
-                    result_value=die["value"]
-                )
-                db.add(tr)
-            db.commit()
+            with instrument_pool.acquire(instrument_type, address) as instr:
+                # Without dies or a diameter the prober steps its own die map:
+                # the params go through unchanged and there is no path to plan
+                dies, path, params, resumed = instr.dies(test_params), None, test_params, 0
+                if dies is not None:
+                    # Step the dies in the planned order, touchdown by touchdown
+                    plan, raster_plan = plan_from_params(dies, test_params.get("path"))
+                    path = plan.report(baseline=raster_plan)
+                    dies = plan.dies
+                    params = {**test_params, "dies": [list(d) for d in dies]}
+                    if failures:
+                        # Resume: only probe dies without a full set of results
+                        done = completed_dies(
+                            db, wafer_id, insertion, len(instr.test_names(test_params)),
+                            since=datetime.fromtimestamp(started_at)
+                        )
+                        remaining = [d for d in dies if d not in done]
+                        resumed = len(dies) - len(remaining)
+                        params = {**test_params, "dies": [list(d) for d in remaining]}
+                progress = ProgressReporter(self, len(dies) if dies is not None else None, resumed=resumed)
+                policy = AdaptivePolicy.from_params(test_params.get("adaptive"))
+                if policy is not None and dies is None:
+                    logger.warning(f"Wafer {wafer_id}: no die list to plan adaptive tests on, running the full flow")
+                    policy = None
+                if policy is not None:
+                    program_id = db.query(Wafer.program_id).filter(Wafer.id == wafer_id).scalar()
+                    engine = AdaptiveEngine(policy, instr.test_names(test_params), bin_table(db, program_id))
+                    batches = engine.iter_results(instr, params)
+                else:
+                    batches = instr.iter_results(params)
+                # Decided once: from its second batch on, a fresh wafer has
+                # results of its own and would otherwise be upserted
+                upsert = bool(failures) or has_results(db, wafer_id, insertion)
+                probe_start = time.monotonic()
+                if dies is None or len(dies) > resumed:
+                    for batch in batches:
+                        written += bulk_insert_results(db, wafer_id, batch, insertion=insertion, upsert=upsert)
+                        dies_before = progress.done
+                        progress.update(batch)
+                        metrics.DIES_TESTED.labels(instrument_type).inc(progress.done - dies_before)
+                        if heartbeat is not None and heartbeat.lost.is_set():
+                            # Another job may be driving the prober now;
+                            # retry once it is ours again
+                            raise RuntimeError(f"Lost the lock on instrument {instrument}")
+                        # A cancelled lot stops after the batch in hand
+                        if lot_id is not None and state.lot_cancelled(lot_id):
+                            status = "cancelled"
+                            break
+                probe_time = time.monotonic() - probe_start
         finally:
             db.close()
-            
-        return {"status": "completed", "wafer_id": wafer_id}
+        logger.info(f"Instrument pool: {instrument_pool.stats()}")
+
+        # Probe time the resumed dies would have cost at this run's rate
+        probed = progress.done - resumed
+        saved = resumed * probe_time / probed if probed else 0.0
+        if path is not None:
+            logger.info(
+                f"Wafer {wafer_id}: {path['strategy']} path over {path['dies']} dies, "
+                f"~{path['travel_s']:.1f}s of chuck travel ({path['travel_saved_pct']:.1f}% less than raster)"
+            )
+        if resumed:
+            logger.info(f"Wafer {wafer_id}: resumed past {resumed} dies, saved ~{saved:.1f}s of probing")
+
+        return {
+            "status": status,
+            "wafer_id": wafer_id,
+            "results": written,
+            "dies_resumed": resumed,
+            "probe_seconds_saved": round(saved, 1),
+            "adaptive": engine.summary() if policy is not None else None,
+            "path": path,
+        }
         
     except Exception as e:
         logger.error(f"Test failed for wafer {wafer_id}: {str(e)}")
-        raise self.retry(exc=e, countdown=30, max_retries=3)
+        # Waiting for the instrument lock also counts as a Celery retry, so
+        # failures are counted separately
+        if failures >= 3:
+            if lot_id is not None:
+                # Reported in the lot summary instead of failing the chord
+                return {"status": "failed", "wafer_id": wafer_id, "error": str(e)}
+            raise
+        kwargs = {**self.request.kwargs, "enqueued_at": None, "failures": failures + 1, "started_at": started_at}
+        raise self.retry(exc=e, countdown=30, max_retries=None, kwargs=kwargs)
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        if instrument is not None:
+            state.unlock(instrument, self.request.id)
+
+@celery_app.task(name="summarize_lot")
+def summarize_lot(chain_results, lot_id: str, batch_id: str, insertion: int = 1, created_at: float = None):
+    # Chord callback of a lot run: lot yield and per-wafer summaries. The
+    # chord only passes the last result of each instrument's chain, so every
+    # wafer's result is read back in one result backend lookup
+    from app.database import SessionLocal
+    from app.lots import summarize, wafer_bins
+    from app.scheduler import state
+    from app.task_status import task_statuses
+
+    wafers = state.get_lot(lot_id)["wafers"]
+    statuses = task_statuses(celery_app, [w["task_id"] for w in wafers.values()])
+    results = []
+    for wafer_id, wafer in wafers.items():
+        status = statuses[wafer["task_id"]]
+        if status["status"] == "SUCCESS":
+            results.append(status["result"])
+        else:
+            results.append({"status": "failed", "wafer_id": int(wafer_id), "error": str(status.get("result"))})
+
+    db = SessionLocal()
+    try:
+        bins = wafer_bins(db, [r["wafer_id"] for r in results], insertion)
+    finally:
+        db.close()
+    summary = summarize(results, bins, batch_id, created_at)
+    logger.info(
+        f"Lot {lot_id} ({batch_id}) {summary['status']}: {summary['wafers_completed']}/{summary['wafers_total']} "
+        f"wafers, yield {summary['yield'] or 0:.1%}, {summary['turnaround_seconds']}s"
+    )
+    return summary
+
+@celery_app.task(name="archive_cold_wafers")
+def archive_cold_wafers():
+    # Nightly: move wafers untouched for ARCHIVE_AFTER_DAYS to Parquet
+    from app.archive import archive_cold_wafers as archive
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = archive(db)
+    finally:
+        db.close()
+    logger.info(f"Archived {rows} results")
+    return {"status": "completed", "results": rows}
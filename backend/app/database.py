@@ -1,18 +1,177 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 import os
 from dotenv import load_dotenv
 
+from .metrics import instrument_engine
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# "api" for the FastAPI process, "worker" for Celery workers
+DB_ROLE = os.getenv("DB_ROLE", "api")
+
+ROLE_POOL_DEFAULTS = {
+    # Many concurrent requests per process
+    "api": {"POOL_SIZE": 10, "MAX_OVERFLOW": 20},
+    # One task at a time per prefork child; keep idle connections low
+    "worker": {"POOL_SIZE": 2, "MAX_OVERFLOW": 2},
+}
+
+def pool_setting(name: str, default):
+    """Read DB_<ROLE>_<NAME>, then DB_<NAME>, then the role default."""
+    value = os.getenv(f"DB_{DB_ROLE.upper()}_{name}", os.getenv(f"DB_{name}"))
+    if value is None:
+        return ROLE_POOL_DEFAULTS.get(DB_ROLE, {}).get(name, default)
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+# Behind pgbouncer (transaction pooling) the app keeps no pool of its own
+# and skips server-side prepared statements.
+DB_PGBOUNCER = pool_setting("PGBOUNCER", False)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching asyncio driver."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+
+class PoolStats:
+    """Counters for one engine's pool, updated from pool events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.pre_ping_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    stats: PoolStats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.stats is not None:
+                self.stats.record_wait(time.perf_counter() - start)
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_kwargs(poolclass):
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool, "pool_pre_ping": False}
+    kwargs = {
+        "pool_pre_ping": pool_setting("PRE_PING", True),
+        "pool_recycle": pool_setting("POOL_RECYCLE", 1800),
+    }
+    if make_url(DATABASE_URL).get_backend_name() != "sqlite":
+        kwargs.update(
+            poolclass=poolclass,
+            pool_size=pool_setting("POOL_SIZE", 5),
+            max_overflow=pool_setting("MAX_OVERFLOW", 10),
+            pool_timeout=pool_setting("POOL_TIMEOUT", 30.0),
+        )
+    return kwargs
+
+
+def _instrument(sync_engine) -> PoolStats:
+    stats = PoolStats()
+    sync_engine.pool.stats = stats
+    event.listen(sync_engine, "connect", lambda *a: stats.incr("connects"))
+    event.listen(sync_engine, "checkout", lambda *a: stats.incr("checkouts"))
+    event.listen(sync_engine, "invalidate", lambda *a: stats.incr("invalidations"))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(context):
+        if context.is_pre_ping:
+            stats.incr("pre_ping_failures")
+
+    return stats
+
+
+def _pool_status(sync_engine, stats: PoolStats) -> dict:
+    pool = sync_engine.pool
+    status = {
+        "pool": type(pool).__name__,
+        "checkouts": stats.checkouts,
+        "connects": stats.connects,
+        "invalidations": stats.invalidations,
+        "pre_ping_failures": stats.pre_ping_failures,
+        "wait_seconds_total": round(stats.wait_seconds_total, 6),
+        "wait_seconds_max": round(stats.wait_seconds_max, 6),
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checked_in=pool.checkedin(),
+        )
+    return status
+
+
+_async_connect_args = {"statement_cache_size": 0} if DB_PGBOUNCER and ASYNC_DATABASE_URL.startswith("postgresql+asyncpg") else {}
+
+engine = create_engine(DATABASE_URL, **_pool_kwargs(TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=_async_connect_args, **_pool_kwargs(TimedAsyncAdaptedQueuePool))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+_sync_stats = _instrument(engine)
+_async_stats = _instrument(async_engine.sync_engine)
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
+def pool_status() -> dict:
+    """Pool sizing and usage counters for this process's engines."""
+    return {
+        "role": DB_ROLE,
+        "pgbouncer": DB_PGBOUNCER,
+        "sync": _pool_status(engine, _sync_stats),
+        "async": _pool_status(async_engine.sync_engine, _async_stats),
+    }
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
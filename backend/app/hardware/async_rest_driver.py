@@ -0,0 +1,206 @@
+"""
+Asynchronous REST driver submitting die regions as concurrent jobs.
+
+The wafer's dies are split into regions of ``region_size`` dies, each
+submitted as ``POST /jobs``; at most ``max_in_flight`` jobs run at once.
+Each job's results are pulled page by page from
+``GET /jobs/{id}/results?cursor=...`` while it runs, so results stream
+back as regions finish. Requests time out after ``timeout`` seconds and
+transport errors, 429 and 5xx responses are retried with exponential
+backoff. A submit that may have reached the instrument (a read timeout,
+say) is only retried under the same ``Idempotency-Key``, so an instrument
+honouring the key never probes a region twice; one that does not is only
+resubmitted after connection errors. Jobs still running when the caller
+stops reading are cancelled with ``DELETE /jobs/{id}``.
+
+Use instrument type ``REST_ASYNC`` to run it from the Celery worker; the
+sync ``iter_dies`` bridge runs the event loop in a helper thread.
+"""
+import asyncio
+import contextlib
+import os
+import queue
+import threading
+import uuid
+from typing import AsyncIterator, List
+
+import httpx
+from dotenv import load_dotenv
+
+from ..metrics import INSTRUMENT_IO
+from .base import Instrument, round_wafer
+
+load_dotenv()
+REST_MAX_IN_FLIGHT = int(os.getenv("REST_MAX_IN_FLIGHT", "8"))
+REST_REGION_SIZE = int(os.getenv("REST_REGION_SIZE", "64"))
+REST_TIMEOUT = float(os.getenv("REST_TIMEOUT", "30"))
+REST_RETRIES = int(os.getenv("REST_RETRIES", "3"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Errors raised before a request reached the instrument
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class AsyncRESTInstrument(Instrument):
+    per_die_tests = True
+
+    def __init__(
+        self,
+        base_url: str,
+        max_in_flight: int = REST_MAX_IN_FLIGHT,
+        region_size: int = REST_REGION_SIZE,
+        timeout: float = REST_TIMEOUT,
+        retries: int = REST_RETRIES,
+        backoff: float = 0.25,
+        poll_interval: float = 0.05,
+        page_size: int = 500,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.region_size = region_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.transport = transport
+
+    async def _request(
+        self, client: httpx.AsyncClient, method: str, path: str, operation: str, idempotent: bool = True, **kwargs
+    ) -> dict:
+        timer = INSTRUMENT_IO.labels("REST_ASYNC", operation)
+        for attempt in range(self.retries + 1):
+            try:
+                with timer.time():
+                    response = await client.request(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} from {path}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                # The instrument may have acted on a request it got
+                if not idempotent and not isinstance(e, NOT_SENT_ERRORS):
+                    raise
+                error = e
+            if attempt == self.retries:
+                raise error
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _run_region(self, client, params: dict, region: dict, out: asyncio.Queue):
+        job = await self._request(
+            client, "POST", "/jobs", "submit", idempotent=False,
+            json={**params, **region}, headers={"Idempotency-Key": uuid.uuid4().hex},
+        )
+        cursor = 0
+        try:
+            while True:
+                page = await self._request(
+                    client, "GET", f"/jobs/{job['job_id']}/results", "results",
+                    params={"cursor": cursor, "limit": self.page_size},
+                )
+                if page["results"]:
+                    await out.put(page["results"])
+                cursor = page["next_cursor"]
+                if page["done"] and cursor >= page["total"]:
+                    return
+                if not page["results"]:
+                    await asyncio.sleep(self.poll_interval)
+        except asyncio.CancelledError:
+            # Free the prober; best effort, the caller has stopped anyway
+            with contextlib.suppress(httpx.HTTPError):
+                await client.delete(f"/jobs/{job['job_id']}", timeout=self.backoff * 4)
+            raise
+
+    async def aiter_results(self, params: dict) -> AsyncIterator[List[dict]]:
+        """Yield result pages as the concurrently running region jobs produce them."""
+        params = dict(params)
+        dies = [list(d) for d in params.pop("dies", None) or round_wafer(params.get("diameter", 30))]
+        die_tests = params.pop("die_tests", None)
+        regions = []
+        for i in range(0, len(dies), self.region_size):
+            region = {"dies": dies[i:i + self.region_size]}
+            if die_tests is not None:
+                region["die_tests"] = die_tests[i:i + self.region_size]
+            regions.append(region)
+
+        out: asyncio.Queue = asyncio.Queue(maxsize=self.max_in_flight * 2)
+        limit = asyncio.Semaphore(self.max_in_flight)
+        async with httpx.AsyncClient(
+            base_url=self.base_url, timeout=self.timeout, transport=self.transport,
+            limits=httpx.Limits(max_connections=self.max_in_flight * 2),
+        ) as client:
+
+            async def bounded(region):
+                async with limit:
+                    await self._run_region(client, params, region, out)
+
+            async def run_all():
+                try:
+                    await asyncio.gather(*(bounded(r) for r in regions))
+                finally:
+                    await out.put(None)
+
+            runner = asyncio.create_task(run_all())
+            try:
+                while (page := await out.get()) is not None:
+                    yield page
+                await runner
+            finally:
+                if not runner.done():
+                    # Let the regions cancel their jobs before the client closes
+                    runner.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await runner
+
+    def iter_dies(self, params: dict):
+        # Bridge for sync callers: run the event loop in a thread and hand
+        # pages over through a bounded queue
+        pages = queue.Queue(maxsize=4)
+        done = object()
+        stop = threading.Event()
+        producer = {}
+
+        async def produce():
+            loop = producer["loop"] = asyncio.get_running_loop()
+            producer["task"] = asyncio.current_task()
+            if stop.is_set():
+                return
+            async with contextlib.aclosing(self.aiter_results(params)) as results:
+                async for page in results:
+                    # Wait for room off the loop, so the region polls keep
+                    # running while a slow consumer catches up
+                    await loop.run_in_executor(None, pages.put, page)
+                    if stop.is_set():
+                        return
+
+        def run():
+            try:
+                asyncio.run(produce())
+            except asyncio.CancelledError:
+                pass
+            except BaseException as e:
+                pages.put(e)
+            else:
+                pages.put(done)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while (item := pages.get()) is not done:
+                if isinstance(item, BaseException):
+                    raise item
+                yield from item
+        finally:
+            # The caller stopped early (closed us or raised): stop the jobs
+            # and unblock the producer, which may be waiting on a full queue
+            stop.set()
+            if "task" in producer:
+                with contextlib.suppress(RuntimeError):
+                    producer["loop"].call_soon_threadsafe(producer["task"].cancel)
+            while thread.is_alive():
+                with contextlib.suppress(queue.Empty):
+                    pages.get(timeout=0.05)
+            thread.join()
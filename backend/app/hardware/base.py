@@ -0,0 +1,72 @@
+import os
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+DIE_BATCH_SIZE = int(os.getenv("DIE_BATCH_SIZE", "500"))
+
+
+def batched(iterable: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def round_wafer(diameter: int) -> List[Tuple[int, int]]:
+    """Die coordinates of a round wafer ``diameter`` dies across, raster order."""
+    r = diameter / 2
+    return [
+        (x, y)
+        for y in range(diameter)
+        for x in range(diameter)
+        if (x + 0.5 - r) ** 2 + (y + 0.5 - r) ** 2 <= r * r
+    ]
+
+
+class Instrument:
+    """
+    Common driver interface.
+
+    Drivers implement ``iter_dies`` as a generator of ``{"x", "y", "test",
+    "value"}`` dicts in the order the prober steps. ``iter_results`` groups
+    them into batches so callers can persist each batch while the prober
+    keeps going, holding at most one batch in memory.
+
+    Drivers with ``per_die_tests`` honour ``params["die_tests"]``: one list
+    of test names per die of ``params["dies"]``, replacing ``tests`` for
+    that die, so a mixed flow still goes to the prober in one call.
+    """
+
+    per_die_tests = False
+
+    def iter_dies(self, params: dict) -> Iterator[dict]:
+        raise NotImplementedError
+
+    def dies(self, params: dict) -> Optional[List[Tuple[int, int]]]:
+        """
+        Dies ``params`` will step, in order: ``dies`` or a round wafer of
+        ``diameter``. None when the caller gave neither and the prober
+        steps its own die map.
+        """
+        if "dies" in params:
+            return [tuple(d) for d in params["dies"]]
+        if "diameter" in params:
+            return round_wafer(params["diameter"])
+        return None
+
+    def test_names(self, params: dict) -> List[str]:
+        return [t if isinstance(t, str) else t["name"] for t in params.get("tests", ["IV"])]
+
+    def check(self):
+        """Raise if the instrument no longer responds."""
+
+    def close(self):
+        pass
+
+    def iter_results(self, params: dict, batch_size: int = None) -> Iterator[List[dict]]:
+        return batched(self.iter_dies(params), batch_size or DIE_BATCH_SIZE)
+
+    def run_test(self, params: dict) -> dict:
+        return {"status": "OK", "die_data": list(self.iter_dies(params))}
@@ -0,0 +1,58 @@
+import random
+import time
+
+from .base import Instrument, round_wafer
+
+class FakeInstrument(Instrument):
+    """
+    In-process instrument that steps a round wafer and emits synthetic results.
+
+    Args:
+        diameter: Wafer diameter in dies
+        tests: Test names run on every die
+        fail_rate: Fraction of results drawn from the failing distribution
+        step_delay: Seconds to sleep per die, to mimic prober stepping
+        seed: Seed for reproducible wafers
+
+    Any of these can be overridden per run through ``test_params``, and a
+    ``dies`` list there restricts the run to those dies. With a seed, every
+    die draws from its own stream, so its values do not depend on how a
+    wafer is split into runs.
+    """
+
+    per_die_tests = True
+
+    def __init__(self, diameter=30, tests=("IV",), fail_rate=0.05, step_delay=0.0, seed=None):
+        self.diameter = diameter
+        self.tests = tuple(tests)
+        self.fail_rate = fail_rate
+        self.step_delay = step_delay
+        self.seed = seed
+
+    def dies(self, params):
+        if "dies" in params:
+            return [tuple(d) for d in params["dies"]]
+        return round_wafer(params.get("diameter", self.diameter))
+
+    def test_names(self, params):
+        return list(params.get("tests", self.tests))
+
+    def iter_dies(self, params):
+        tests = params.get("tests", self.tests)
+        fail_rate = params.get("fail_rate", self.fail_rate)
+        step_delay = params.get("step_delay", self.step_delay)
+        seed = params.get("seed", self.seed)
+        die_tests = params.get("die_tests")
+        rng = random.Random(seed)
+
+        for i, (x, y) in enumerate(self.dies(params)):
+            if step_delay:
+                time.sleep(step_delay)
+            if seed is not None:
+                rng.seed(f"{seed}:{x}:{y}")
+            for test in die_tests[i] if die_tests is not None else tests:
+                if rng.random() < fail_rate:
+                    value = rng.uniform(0.0015, 0.01)
+                else:
+                    value = abs(rng.gauss(0.0005, 0.0001))
+                yield {"x": x, "y": y, "test": test, "value": value}
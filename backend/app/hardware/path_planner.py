@@ -0,0 +1,264 @@
+"""
+Prober stepping order.
+
+``plan_path`` orders a wafer's dies so the chuck travels as little as
+possible, leaving out dies to skip:
+
+- ``raster``: row by row, left to right (what drivers did before)
+- ``serpentine``: row by row, alternating direction
+- ``nearest``: greedy nearest unvisited die, then windowed 2-opt; wins
+  over serpentine when skipped dies leave holes and ragged edges
+- ``auto``: the cheaper of ``serpentine`` and ``nearest``
+
+Multi-DUT probe cards test a ``sites = (columns, rows)`` block of dies per
+touchdown. Touchdowns tile the wafer at the block's stride, aligned to
+need the fewest, and the touchdowns themselves are ordered by the chosen
+strategy. Dies are handed to drivers in touchdown order through
+``params["dies"]``; the drivers still step die by die, so travel is
+reported over the die path, with the touchdown count alongside.
+
+Travel is estimated with ``TravelModel``: X and Y move together, so a move
+takes the longer axis' distance over ``PROBER_SPEED_MM_S`` plus
+``PROBER_SETTLE_S`` to settle before contact.
+"""
+import math
+import os
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+DIE_PATH_STRATEGY = os.getenv("DIE_PATH_STRATEGY", "serpentine")
+PROBER_PITCH_X_MM = float(os.getenv("PROBER_PITCH_X_MM", "1.0"))
+PROBER_PITCH_Y_MM = float(os.getenv("PROBER_PITCH_Y_MM", "1.0"))
+PROBER_SPEED_MM_S = float(os.getenv("PROBER_SPEED_MM_S", "50"))
+PROBER_SETTLE_S = float(os.getenv("PROBER_SETTLE_S", "0.02"))
+# Ring radius past which the nearest-die search scans every unvisited die
+NEAREST_MAX_RING = 16
+TWO_OPT_WINDOW = 24
+TWO_OPT_PASSES = 2
+
+STRATEGIES = ("raster", "serpentine", "nearest", "auto")
+
+Die = Tuple[int, int]
+
+
+@dataclass
+class TravelModel:
+    pitch_x: float = PROBER_PITCH_X_MM
+    pitch_y: float = PROBER_PITCH_Y_MM
+    speed: float = PROBER_SPEED_MM_S
+    settle: float = PROBER_SETTLE_S
+
+    def scaled(self, columns: int, rows: int) -> "TravelModel":
+        """The model on a grid of ``columns`` x ``rows`` die blocks."""
+        return TravelModel(self.pitch_x * columns, self.pitch_y * rows, self.speed, self.settle)
+
+    def move_cost(self, a: Die, b: Die) -> float:
+        """Axis travel of a move in mm; ordering minimizes this."""
+        return max(abs(a[0] - b[0]) * self.pitch_x, abs(a[1] - b[1]) * self.pitch_y)
+
+    def travel(self, path: Sequence[Die]) -> Tuple[float, float]:
+        """Straight-line distance (mm) and time (s) of stepping ``path``."""
+        distance = seconds = 0.0
+        for a, b in zip(path, path[1:]):
+            distance += math.hypot((a[0] - b[0]) * self.pitch_x, (a[1] - b[1]) * self.pitch_y)
+            seconds += self.move_cost(a, b) / self.speed + self.settle
+        return distance, seconds
+
+
+def raster(dies: Iterable[Die]) -> List[Die]:
+    return sorted(dies, key=lambda d: (d[1], d[0]))
+
+
+def serpentine(dies: Iterable[Die]) -> List[Die]:
+    path = []
+    for i, (_, row) in enumerate(groupby(raster(dies), key=lambda d: d[1])):
+        row = list(row)
+        path.extend(reversed(row) if i % 2 else row)
+    return path
+
+
+def _ring(center: Die, radius: int) -> Iterable[Die]:
+    x, y = center
+    for dx in range(-radius, radius + 1):
+        yield x + dx, y - radius
+        yield x + dx, y + radius
+    for dy in range(-radius + 1, radius):
+        yield x - radius, y + dy
+        yield x + radius, y + dy
+
+
+def nearest_neighbor(dies: Iterable[Die], model: TravelModel) -> List[Die]:
+    """Greedy tour from the first die in raster order, searching the grid ring by ring."""
+    ordered = raster(dies)
+    if not ordered:
+        return []
+    unvisited = set(ordered)
+    current = ordered[0]
+    unvisited.remove(current)
+    path = [current]
+    min_pitch = min(model.pitch_x, model.pitch_y)
+    while unvisited:
+        # Ties go to the same row, then the lower x
+        def key(die):
+            return model.move_cost(current, die), die[1] != current[1], die[0]
+
+        best, best_key = None, (math.inf,)
+        radius = 1
+        # Ring r holds no die closer than r * min_pitch
+        while radius <= NEAREST_MAX_RING and radius * min_pitch < best_key[0]:
+            for die in _ring(current, radius):
+                if die in unvisited and key(die) < best_key:
+                    best, best_key = die, key(die)
+            radius += 1
+        if best is None:
+            best = min(unvisited, key=key)
+        unvisited.remove(best)
+        path.append(best)
+        current = best
+    return path
+
+
+def two_opt(path: List[Die], model: TravelModel, window: int = TWO_OPT_WINDOW, passes: int = TWO_OPT_PASSES) -> List[Die]:
+    """Reverse segments up to ``window`` long while that shortens the path."""
+    path = list(path)
+    cost = model.move_cost
+    for _ in range(passes):
+        improved = False
+        for i in range(len(path) - 2):
+            a, b = path[i], path[i + 1]
+            for j in range(i + 2, min(i + window, len(path) - 1)):
+                c, d = path[j], path[j + 1]
+                if cost(a, c) + cost(b, d) < cost(a, b) + cost(c, d) - 1e-9:
+                    path[i + 1:j + 1] = path[j:i:-1]
+                    b = path[i + 1]
+                    improved = True
+        if not improved:
+            break
+    return path
+
+
+def order(points: Iterable[Die], strategy: str, model: TravelModel) -> List[Die]:
+    if strategy == "raster":
+        return raster(points)
+    if strategy == "serpentine":
+        return serpentine(points)
+    if strategy == "nearest":
+        return two_opt(nearest_neighbor(points, model), model)
+    if strategy == "auto":
+        points = list(points)
+        candidates = [serpentine(points), two_opt(nearest_neighbor(points, model), model)]
+        return min(candidates, key=lambda p: model.travel(p)[1])
+    raise ValueError(f"Unknown die path strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+
+
+def tile(dies: Iterable[Die], sites: Tuple[int, int]) -> Tuple[Die, Dict[Die, List[Die]]]:
+    """
+    Group dies into touchdowns of a ``(columns, rows)`` probe card.
+
+    Returns:
+        The tiling's alignment, and each touchdown's dies in site order
+        keyed by its position on the touchdown grid
+    """
+    columns, rows = sites
+    dies = raster(dies)
+    best = None
+    for ox in range(columns):
+        for oy in range(rows):
+            blocks: Dict[Die, List[Die]] = {}
+            for x, y in dies:
+                blocks.setdefault(((x - ox) // columns, (y - oy) // rows), []).append((x, y))
+            if best is None or len(blocks) < len(best[1]):
+                best = ((ox, oy), blocks)
+    return best
+
+
+@dataclass
+class PathPlan:
+    strategy: str
+    sites: Tuple[int, int]
+    # Stepping order handed to the driver, touchdown by touchdown
+    dies: List[Die]
+    # Chuck positions (the touchdown's first-site die), in order
+    touchdowns: List[Die]
+
+    def report(self, model: Optional[TravelModel] = None, baseline: Optional["PathPlan"] = None) -> dict:
+        """Travel of stepping ``dies``, as the drivers do, optionally against ``baseline``."""
+        model = model or TravelModel()
+        distance, seconds = model.travel(self.dies)
+        report = {
+            "strategy": self.strategy,
+            "sites": list(self.sites),
+            "dies": len(self.dies),
+            "touchdowns": len(self.touchdowns),
+            "travel_mm": round(distance, 1),
+            "travel_s": round(seconds, 2),
+        }
+        if baseline is not None:
+            base_distance, base_seconds = model.travel(baseline.dies)
+            report["raster_travel_mm"] = round(base_distance, 1)
+            report["raster_travel_s"] = round(base_seconds, 2)
+            report["travel_saved_pct"] = round(100 * (1 - seconds / base_seconds), 1) if base_seconds else 0.0
+        return report
+
+
+def plan_path(
+    dies: Iterable[Die],
+    strategy: str = DIE_PATH_STRATEGY,
+    skip: Iterable[Die] = (),
+    sites: Tuple[int, int] = (1, 1),
+    model: Optional[TravelModel] = None,
+) -> PathPlan:
+    """
+    Plan the stepping order of ``dies`` minus ``skip``.
+
+    Raises:
+        ValueError: For an unknown strategy or an empty probe card
+    """
+    model = model or TravelModel()
+    columns, rows = sites
+    if columns < 1 or rows < 1:
+        raise ValueError(f"Probe card needs at least one site, got {columns}x{rows}")
+    skip = {tuple(d) for d in skip}
+    dies = [tuple(d) for d in dies if tuple(d) not in skip]
+
+    (ox, oy), blocks = tile(dies, (columns, rows))
+    blocks_order = order(blocks, strategy, model.scaled(columns, rows))
+    path, touchdowns = [], []
+    for bx, by in blocks_order:
+        touchdowns.append((ox + bx * columns, oy + by * rows))
+        path.extend(blocks[(bx, by)])
+    return PathPlan(strategy, (columns, rows), path, touchdowns)
+
+
+def path_options(options: Optional[dict]) -> dict:
+    """
+    Validate ``test_params["path"]``: ``strategy``, ``skip`` (``[[x, y],
+    ...]``) and ``sites`` (``[columns, rows]``).
+
+    Raises:
+        ValueError: If an option is unknown or malformed
+    """
+    options = options or {}
+    unknown = set(options) - {"strategy", "skip", "sites"}
+    if unknown:
+        raise ValueError(f"Unknown die path options: {', '.join(sorted(unknown))}")
+    strategy = options.get("strategy", DIE_PATH_STRATEGY)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown die path strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+    sites = tuple(options.get("sites", (1, 1)))
+    if len(sites) != 2 or not all(isinstance(n, int) and n >= 1 for n in sites):
+        raise ValueError(f"sites must be [columns, rows] of positive integers, got {list(sites)}")
+    skip = [tuple(d) for d in options.get("skip", ())]
+    return {"strategy": strategy, "skip": skip, "sites": sites}
+
+
+def plan_from_params(dies: Iterable[Die], options: Optional[dict]) -> Tuple[PathPlan, PathPlan]:
+    """The plan ``test_params["path"]`` asks for, and the raster plan of the same dies."""
+    options = path_options(options)
+    dies = list(dies)
+    plan = plan_path(dies, options["strategy"], options["skip"], options["sites"])
+    return plan, plan_path(dies, "raster", options["skip"], options["sites"])
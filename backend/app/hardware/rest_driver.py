@@ -1,10 +1,43 @@
+import json
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from ..metrics import INSTRUMENT_IO
+from .base import Instrument
+
+class RESTInstrument(Instrument):
+    per_die_tests = True
 
-class RESTInstrument:
-    def __init__(self, base_url):
+    def __init__(self, base_url, session=None):
         self.base_url = base_url
+        if session is None:
+            # Keep-alive connections are reused across runs of a pooled driver
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=4))
+            session.mount("https://", HTTPAdapter(pool_maxsize=4))
+        self.session = session
+
+    def close(self):
+        self.session.close()
 
     def run_test(self, params):
-        response = requests.post(f"{self.base_url}/start_test", json=params)
+        with INSTRUMENT_IO.labels("REST", "run_test").time():
+            response = self.session.post(f"{self.base_url}/start_test", json=params)
         response.raise_for_status()
         return response.json()
+
+    def iter_dies(self, params):
+        # Instruments that answer with NDJSON are consumed line by line as the
+        # prober steps; plain JSON responses fall back to the die_data list.
+        # Timed up to the response headers: the body arrives as dies are probed
+        with INSTRUMENT_IO.labels("REST", "start_test").time():
+            response = self.session.post(f"{self.base_url}/start_test", json=params, stream=True)
+        with response:
+            response.raise_for_status()
+            if "ndjson" in response.headers.get("Content-Type", ""):
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+            else:
+                yield from response.json()["die_data"]
@@ -0,0 +1,102 @@
+"""
+Local stand-in for a REST-controlled prober, for tests and benchmarks.
+
+    uvicorn app.hardware.rest_sim_server:app --port 9000
+
+Serves both driver protocols:
+
+- ``POST /start_test``: legacy whole-wafer run, answers once every die is
+  tested (``RESTInstrument``)
+- ``POST /jobs``, ``GET /jobs/{id}/results`` and ``DELETE /jobs/{id}``:
+  region jobs with paged results (``AsyncRESTInstrument``); a repeated
+  ``Idempotency-Key`` returns the job it created first
+
+Each die takes ``die_ms`` milliseconds (default ``SIM_DIE_MS``). Jobs run
+concurrently, up to ``SIM_SITES`` at a time, like a multi-site probe card.
+"""
+import asyncio
+import os
+import random
+import uuid
+
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
+
+from .base import round_wafer
+
+SIM_DIE_MS = float(os.getenv("SIM_DIE_MS", "2"))
+SIM_SITES = int(os.getenv("SIM_SITES", "8"))
+
+app = FastAPI(title="RapidProbe REST instrument simulator")
+jobs = {}
+# Job ID by Idempotency-Key
+job_keys = {}
+_sites = None
+
+
+def _value(rng: random.Random) -> float:
+    if rng.random() < 0.05:
+        return rng.uniform(0.0015, 0.01)
+    return abs(rng.gauss(0.0005, 0.0001))
+
+
+async def _test_dies(dies, tests, die_ms, rng, sink, die_tests=None):
+    for i, (x, y) in enumerate(dies):
+        await asyncio.sleep(die_ms / 1000)
+        for test in die_tests[i] if die_tests is not None else tests:
+            sink.append({"x": x, "y": y, "test": test, "value": _value(rng)})
+
+
+@app.post("/start_test")
+async def start_test(params: dict):
+    dies = params.get("dies") or round_wafer(params.get("diameter", 30))
+    die_data = []
+    await _test_dies(dies, params.get("tests", ["IV"]), params.get("die_ms", SIM_DIE_MS),
+                     random.Random(params.get("seed")), die_data, params.get("die_tests"))
+    return {"status": "OK", "die_data": die_data}
+
+
+@app.post("/jobs")
+async def create_job(params: dict, idempotency_key: Optional[str] = Header(None)):
+    global _sites
+    if _sites is None:
+        _sites = asyncio.Semaphore(SIM_SITES)
+    if idempotency_key in job_keys:
+        return {"job_id": job_keys[idempotency_key]}
+
+    job_id = uuid.uuid4().hex
+    if idempotency_key is not None:
+        job_keys[idempotency_key] = job_id
+    job = jobs[job_id] = {"results": [], "done": False}
+
+    async def run():
+        async with _sites:
+            await _test_dies(params["dies"], params.get("tests", ["IV"]), params.get("die_ms", SIM_DIE_MS),
+                             random.Random(params.get("seed")), job["results"], params.get("die_tests"))
+        job["done"] = True
+
+    job["task"] = asyncio.create_task(run())
+    return {"job_id": job_id}
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = jobs.pop(job_id, None)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["task"].cancel()
+    return {"job_id": job_id, "cancelled": True}
+
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, cursor: int = 0, limit: int = 500):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    done = job["done"]
+    page = job["results"][cursor:cursor + limit]
+    total = len(job["results"])
+    if done and cursor + len(page) >= total:
+        jobs.pop(job_id, None)
+    return {"results": page, "next_cursor": cursor + len(page), "total": total, "done": done}
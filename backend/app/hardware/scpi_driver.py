@@ -1,11 +1,23 @@
 import pyvisa
 
-class SCPIInstrument:
-    def __init__(self, address):
-        self.rm = pyvisa.ResourceManager()
+from .base import Instrument
+from .scpi_sequencer import compile_plan, run_plan
+
+class SCPIInstrument(Instrument):
+    def __init__(self, address, rm=None):
+        if address.startswith("SIM::"):
+            from .sim_visa import SimulatedResourceManager
+            rm = SimulatedResourceManager()
+        self.rm = rm or pyvisa.ResourceManager()
         self.inst = self.rm.open_resource(address)
 
-    def run_test(self, params):
-        idn = self.inst.query("*IDN?")
-        # Send SCPI test sequence...
-        return {"status": "OK", "die_data": [{"x":0,"y":0,"test":"IV","value":0.0012}]}
+    def check(self):
+        self.inst.query("*IDN?")
+
+    def close(self):
+        self.inst.close()
+
+    def iter_dies(self, params):
+        # Test plan is sent as buffered command lists and read back as
+        # binary blocks, see scpi_sequencer
+        yield from run_plan(self.inst, compile_plan(params))
@@ -0,0 +1,139 @@
+"""
+Per-process pool of open instrument sessions.
+
+Celery workers run many wafer tasks against the same few instruments, so
+drivers are kept open between tasks instead of reconnecting (VISA open plus
+handshake, or a new HTTP connection) every time. A session idle for longer
+than ``INSTRUMENT_CHECK_INTERVAL`` seconds is health-checked before reuse,
+and a session whose run raised is closed and reopened on next use.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from dotenv import load_dotenv
+
+from .base import Instrument
+
+load_dotenv()
+INSTRUMENT_CHECK_INTERVAL = float(os.getenv("INSTRUMENT_CHECK_INTERVAL", "60"))
+
+
+class _Entry:
+    def __init__(self, instrument: Instrument):
+        self.instrument = instrument
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class InstrumentPool:
+    def __init__(self, check_interval: float = INSTRUMENT_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._lock = threading.Lock()
+        self._rm = None
+        self.opens = 0
+        self.reuses = 0
+        self.failures = 0
+        self.setup_seconds = 0.0
+
+    def _resource_manager(self):
+        import pyvisa
+
+        if self._rm is None:
+            self._rm = pyvisa.ResourceManager()
+        return self._rm
+
+    def _open(self, instrument_type: str, address: str) -> Instrument:
+        start = time.perf_counter()
+        if instrument_type == "SCPI":
+            from .scpi_driver import SCPIInstrument
+            rm = None if address.startswith("SIM::") else self._resource_manager()
+            instrument = SCPIInstrument(address, rm=rm)
+            instrument.check()
+        elif instrument_type == "FAKE":
+            from .fake_driver import FakeInstrument
+            instrument = FakeInstrument()
+        elif instrument_type == "REST_ASYNC":
+            from .async_rest_driver import AsyncRESTInstrument
+            instrument = AsyncRESTInstrument(address)
+        else:
+            from .rest_driver import RESTInstrument
+            instrument = RESTInstrument(address)
+        self.setup_seconds += time.perf_counter() - start
+        self.opens += 1
+        return instrument
+
+    @staticmethod
+    def _close(instrument: Instrument):
+        try:
+            instrument.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def acquire(self, instrument_type: str, address: str = None):
+        """
+        Yield an open driver for ``address``, exclusive to the caller.
+
+        Any exception raised inside the block closes the driver so the next
+        caller gets a fresh connection.
+        """
+        key = (instrument_type, address)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(None)
+
+        with entry.lock:
+            stale = time.monotonic() - entry.last_used > self.check_interval
+            if entry.instrument is not None and stale:
+                try:
+                    entry.instrument.check()
+                except Exception:
+                    self.failures += 1
+                    self._close(entry.instrument)
+                    entry.instrument = None
+
+            if entry.instrument is None:
+                entry.instrument = self._open(instrument_type, address)
+            else:
+                self.reuses += 1
+
+            try:
+                yield entry.instrument
+            except Exception:
+                self.failures += 1
+                self._close(entry.instrument)
+                entry.instrument = None
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            with entry.lock:
+                if entry.instrument is not None:
+                    self._close(entry.instrument)
+                    entry.instrument = None
+
+    def stats(self) -> dict:
+        acquisitions = self.opens + self.reuses
+        avg_setup = self.setup_seconds / self.opens if self.opens else 0.0
+        return {
+            "open_sessions": sum(e.instrument is not None for e in list(self._entries.values())),
+            "opens": self.opens,
+            "reuses": self.reuses,
+            "failures": self.failures,
+            "reuse_ratio": self.reuses / acquisitions if acquisitions else 0.0,
+            "setup_seconds": round(self.setup_seconds, 6),
+            "setup_seconds_saved": round(self.reuses * avg_setup, 6),
+        }
+
+
+instrument_pool = InstrumentPool()
@@ -0,0 +1,102 @@
+"""
+In-process stand-in for a VISA prober/SMU pair, for offline runs and benchmarks.
+
+Understands the command set used by ``scpi_sequencer`` plus a per-die
+``MEAS? '<test>'`` query for comparing against an unbatched flow. Every
+``write``/``query`` counts as one round trip and sleeps ``latency``
+seconds, so batching savings show up in wall time the way they would on a
+GPIB or LAN link.
+Binary reads go through real IEEE 488.2 definite-length block encoding.
+
+Open it through ``SCPIInstrument`` with an address starting ``SIM::``.
+"""
+import random
+import re
+import time
+
+from pyvisa import util
+
+_STEP = re.compile(r"PROB:STEP\s+(-?\d+),(-?\d+)")
+_SEQ_NAME = re.compile(r"SEQ:STEP(\d+):NAME\s+'([^']*)'")
+_TRAC_POIN = re.compile(r"TRAC:POIN\s+(\d+)")
+
+
+class SimulatedResource:
+    def __init__(self, address: str, latency: float = 0.002, fail_rate: float = 0.05, seed: int = None):
+        self.address = address
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.round_trips = 0
+        self.sequence = {}
+        self.buffer = []
+        self.capacity = 0
+        self.armed = False
+        self.position = (0, 0)
+
+    def _reading(self) -> float:
+        if self.rng.random() < self.fail_rate:
+            return self.rng.uniform(0.0015, 0.01)
+        return abs(self.rng.gauss(0.0005, 0.0001))
+
+    def _execute(self, command: str):
+        command = command.strip().lstrip(":")
+        if m := _STEP.fullmatch(command):
+            self.position = (int(m.group(1)), int(m.group(2)))
+            if self.armed:
+                for _ in range(max(1, len(self.sequence))):
+                    if len(self.buffer) < self.capacity:
+                        self.buffer.append(self._reading())
+        elif m := _SEQ_NAME.fullmatch(command):
+            self.sequence[int(m.group(1))] = m.group(2)
+        elif m := _TRAC_POIN.fullmatch(command):
+            self.capacity = int(m.group(1))
+        elif command == "TRAC:CLE":
+            self.buffer = []
+        elif command == "INIT":
+            self.armed = True
+        elif command == "*CLS":
+            self.sequence = {}
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def write(self, message: str) -> int:
+        self._round_trip()
+        for command in message.split(";"):
+            if command.strip():
+                self._execute(command)
+        return len(message)
+
+    def query(self, message: str) -> str:
+        self._round_trip()
+        message = message.strip()
+        if message == "*IDN?":
+            return "RapidProbe,SimSMU,0,1.0"
+        if message == "*OPC?":
+            self.armed = False
+            return "1"
+        if message.startswith("MEAS?"):
+            return repr(self._reading())
+        raise ValueError(f"Unsupported query: {message}")
+
+    def query_binary_values(self, message: str, datatype="d", is_big_endian=False, container=list, **kwargs):
+        self._round_trip()
+        if message.strip() != "TRAC:DATA?":
+            raise ValueError(f"Unsupported binary query: {message}")
+        block = util.to_ieee_block(self.buffer, datatype, is_big_endian)
+        return util.from_ieee_block(block, datatype, is_big_endian, container)
+
+    def close(self):
+        pass
+
+
+class SimulatedResourceManager:
+    def __init__(self, **resource_kwargs):
+        self.resource_kwargs = resource_kwargs
+
+    def open_resource(self, address: str):
+        return SimulatedResource(address, **self.resource_kwargs)
+
@@ -0,0 +1,79 @@
+"""
+Cached health check.
+
+Load balancers and orchestrators probe /health every few seconds. A Celery
+ping broadcast waits out its whole timeout for replies, so running it (and
+a database round trip) on every probe ties up the API. ``HealthCheck``
+instead runs both checks concurrently, each bounded by ``HEALTH_TIMEOUT``,
+and serves the last result: a result older than ``HEALTH_CACHE_SECONDS``
+is refreshed in the background while the stale one is returned, and only
+the very first probe waits for a check.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import HEALTH
+
+load_dotenv()
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "10"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "2"))
+
+
+class HealthCheck:
+    def __init__(self, ttl: float = HEALTH_CACHE_SECONDS, timeout: float = HEALTH_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def _database(self) -> bool:
+        from .database import async_engine
+
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return True
+
+    async def _celery(self) -> bool:
+        from .celery_app import celery_app
+
+        return bool(await run_in_threadpool(celery_app.control.ping, timeout=self.timeout))
+
+    async def _bounded(self, check) -> bool:
+        try:
+            return await asyncio.wait_for(check(), self.timeout + 1)
+        except Exception:
+            return False
+
+    async def _check(self):
+        database, celery = await asyncio.gather(self._bounded(self._database), self._bounded(self._celery))
+        HEALTH.labels("database").set(database)
+        HEALTH.labels("celery").set(celery)
+        self._result = {
+            "status": "healthy" if database and celery else "unhealthy",
+            "celery": celery,
+            "database": database,
+        }
+        self._checked_at = time.monotonic()
+
+    def _start_refresh(self) -> asyncio.Task:
+        # One check in flight at a time, on the running loop
+        if self._refresh is None or self._refresh.done() or self._refresh.get_loop() is not asyncio.get_running_loop():
+            self._refresh = asyncio.create_task(self._check())
+        return self._refresh
+
+    async def status(self) -> dict:
+        if self._result is None:
+            await asyncio.shield(self._start_refresh())
+        elif time.monotonic() - self._checked_at > self.ttl:
+            self._start_refresh()
+        return {**self._result, "checked_seconds_ago": round(time.monotonic() - self._checked_at, 1)}
+
+
+health_check = HealthCheck()
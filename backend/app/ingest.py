@@ -0,0 +1,212 @@
+import csv
+import io
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from .aggregates import dialect_insert, update_yield_aggregates
+from .binning import BinTable, bin_table
+from .metrics import RESULTS_INGESTED
+from .models import TestProgram, TestResult, Wafer
+from .pubsub import publish_results
+
+load_dotenv()
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+
+COPY_COLUMNS = ("wafer_id", "die_x", "die_y", "test_name", "result_value", "bin", "insertion", "timestamp")
+# A result is identified by its die, test and insertion
+RESULT_KEY = ("die_x", "die_y", "test_name")
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[List]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _to_rows(
+    wafer_id: int, die_data: List[dict], timestamp: datetime, bins: BinTable, insertion: int = 1
+) -> List[dict]:
+    codes = bins.assign([die["test"] for die in die_data], [die["value"] for die in die_data])
+    return [
+        {
+            "wafer_id": wafer_id,
+            "die_x": die["x"],
+            "die_y": die["y"],
+            "test_name": die["test"],
+            "result_value": die["value"],
+            "bin": code,
+            "insertion": insertion,
+            "timestamp": timestamp,
+        }
+        for die, code in zip(die_data, codes.tolist())
+    ]
+
+
+def _use_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def _copy_rows(db: Session, rows: List[dict]):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in COPY_COLUMNS])
+    buf.seek(0)
+
+    raw = db.connection().connection
+    with raw.cursor() as cur:
+        cur.copy_expert(
+            f"COPY test_results ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+
+
+def _replaced_rows(db: Session, wafer_id: int, insertion: int, rows: List[dict]) -> List[dict]:
+    """Stored rows that ``rows`` will overwrite, for the aggregates."""
+    query = (
+        select(TestResult.test_name, TestResult.bin, TestResult.timestamp)
+        .where(
+            TestResult.wafer_id == wafer_id,
+            TestResult.insertion == insertion,
+            tuple_(TestResult.die_x, TestResult.die_y, TestResult.test_name).in_(
+                [tuple(r[c] for c in RESULT_KEY) for r in rows]
+            ),
+        )
+    )
+    return [row._asdict() for row in db.execute(query)]
+
+
+def _upsert_rows(db: Session, rows: List[dict]):
+    table = TestResult.__table__
+    upsert_insert = dialect_insert(db)
+    if upsert_insert is None:
+        # No ON CONFLICT: replace the stored rows of the chunk's keys
+        db.execute(
+            delete(table).where(
+                table.c.wafer_id == rows[0]["wafer_id"],
+                table.c.insertion == rows[0]["insertion"],
+                tuple_(*(table.c[c] for c in RESULT_KEY)).in_([tuple(r[c] for c in RESULT_KEY) for r in rows]),
+            )
+        )
+        db.execute(insert(table), rows)
+        return
+    stmt = upsert_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.wafer_id, table.c.insertion, *(table.c[c] for c in RESULT_KEY)],
+        set_={c: stmt.excluded[c] for c in ("result_value", "bin", "timestamp")},
+    )
+    db.execute(stmt, rows)
+
+
+def completed_dies(
+    db: Session, wafer_id: int, insertion: int, tests: int, since: datetime = None
+) -> Set[Tuple[int, int]]:
+    """
+    Dies of a wafer insertion that have a result for every one of ``tests``
+    tests, optionally only counting results written since ``since``.
+    """
+    query = (
+        select(TestResult.die_x, TestResult.die_y)
+        .where(TestResult.wafer_id == wafer_id, TestResult.insertion == insertion)
+        .group_by(TestResult.die_x, TestResult.die_y)
+        .having(func.count() >= tests)
+    )
+    if since is not None:
+        query = query.where(TestResult.timestamp >= since)
+    return {(x, y) for x, y in db.execute(query)}
+
+
+def has_results(db: Session, wafer_id: int, insertion: int = 1) -> bool:
+    """Whether the wafer insertion has any results stored."""
+    return db.execute(
+        select(TestResult.id).where(TestResult.wafer_id == wafer_id, TestResult.insertion == insertion).limit(1)
+    ).first() is not None
+
+
+def bulk_insert_results(
+    db: Session,
+    wafer_id: int,
+    die_data: Iterable[dict],
+    chunk_size: int = None,
+    commit: bool = True,
+    insertion: int = 1,
+    upsert: bool = None,
+) -> int:
+    """
+    Insert die results for a wafer in chunks.
+
+    Uses ``COPY ... FROM STDIN`` on PostgreSQL/psycopg2 and a batched
+    executemany ``INSERT`` everywhere else. Each chunk is committed on its
+    own when ``commit`` is set, so a writer never holds more than one chunk
+    in a transaction. Each chunk is binned in one vectorized pass against
+    the wafer's test program (``app.binning``). Yield aggregates are
+    updated in the same transaction as the rows, along with the wafer's
+    ``results_version``, and committed chunks are published to live
+    monitoring subscribers.
+
+    Writing is idempotent: once the wafer has results for ``insertion``,
+    chunks are upserted on (wafer, die, test, insertion) instead, so a
+    retried or repeated run replaces results rather than duplicating them.
+    A writer calling this once per batch should decide ``upsert`` once,
+    before its first batch, so a fresh wafer keeps the plain path
+    throughout.
+
+    Args:
+        db: Database session
+        wafer_id: Wafer the results belong to
+        die_data: Iterable of ``{"x", "y", "test", "value"}`` dicts as
+            returned by the instrument drivers
+        chunk_size: Rows per round trip, defaults to ``INGEST_CHUNK_SIZE``
+        commit: Commit after every chunk
+        insertion: Test insertion the results belong to
+        upsert: Upsert rather than insert; None checks whether the
+            insertion already has results
+
+    Returns:
+        Number of rows written
+    """
+    chunk_size = chunk_size or INGEST_CHUNK_SIZE
+    use_copy = _use_copy(db)
+    batch_id, program_id, version = (
+        db.query(Wafer.batch_id, Wafer.program_id, TestProgram.version)
+        .outerjoin(TestProgram, TestProgram.id == Wafer.program_id)
+        .filter(Wafer.id == wafer_id)
+        .first()
+    ) or (None, None, None)
+    bins = bin_table(db, program_id, version)
+    if upsert is None:
+        # Fresh wafers keep the plain COPY/INSERT path
+        upsert = has_results(db, wafer_id, insertion)
+    written = 0
+
+    for chunk in _chunks(die_data, chunk_size):
+        rows = _to_rows(wafer_id, chunk, datetime.now(), bins, insertion)
+        replaced = []
+        if upsert:
+            # ON CONFLICT may touch a row only once per statement
+            rows = list({tuple(r[c] for c in RESULT_KEY): r for r in rows}.values())
+            replaced = _replaced_rows(db, wafer_id, insertion, rows)
+            _upsert_rows(db, rows)
+        elif use_copy:
+            _copy_rows(db, rows)
+        else:
+            db.execute(insert(TestResult), rows)
+        update_yield_aggregates(db, wafer_id, batch_id, rows, replaced)
+        db.execute(update(Wafer).where(Wafer.id == wafer_id).values(results_version=Wafer.results_version + 1))
+        if commit:
+            db.commit()
+            publish_results(wafer_id, rows)
+        written += len(rows)
+        RESULTS_INGESTED.inc(len(rows))
+
+    return written
@@ -0,0 +1,52 @@
+"""
+Registry of the instruments on the test floor.
+
+Instruments are configured with ``INSTRUMENTS``, a JSON list such as:
+
+    [{"name": "prober-1", "type": "SCPI", "address": "TCPIP0::10.0.0.11::INSTR"},
+     {"name": "prober-2", "type": "REST", "address": "http://10.0.0.12:8080"}]
+
+Without it the registry holds the single ``DEFAULT_SCPI_ADDRESS`` /
+``DEFAULT_REST_API_URL`` instruments (when set) plus an in-process fake.
+Each instrument gets its own Celery queue, ``instrument.<name>``.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class InstrumentConfig:
+    name: str
+    type: str
+    address: Optional[str] = None
+
+    @property
+    def queue(self) -> str:
+        return f"instrument.{self.name}"
+
+
+def load_registry() -> Dict[str, InstrumentConfig]:
+    raw = os.getenv("INSTRUMENTS")
+    if raw:
+        configs = [InstrumentConfig(**item) for item in json.loads(raw)]
+    else:
+        configs = []
+        if os.getenv("DEFAULT_SCPI_ADDRESS"):
+            configs.append(InstrumentConfig("scpi-default", "SCPI", os.getenv("DEFAULT_SCPI_ADDRESS")))
+        if os.getenv("DEFAULT_REST_API_URL"):
+            configs.append(InstrumentConfig("rest-default", "REST", os.getenv("DEFAULT_REST_API_URL")))
+        configs.append(InstrumentConfig("fake", "FAKE"))
+    return {c.name: c for c in configs}
+
+
+registry = load_registry()
+
+
+def instruments_of_type(instrument_type: str) -> List[InstrumentConfig]:
+    return [c for c in registry.values() if c.type == instrument_type]
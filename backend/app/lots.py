@@ -0,0 +1,76 @@
+"""
+Lot summaries.
+
+A lot run (``scheduler.schedule_lot``) ends with ``summarize_lot``, which
+gets every wafer task's result and reads the die bins of all the lot's
+wafers in one grouped query: a die passes when its worst bin is the pass
+bin. The summary has the lot's yield and turnaround, and per wafer the
+task outcome, dies, good dies, yield and die counts per bin.
+"""
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .binning import PASS_BIN
+from .models import TestResult
+
+
+def wafer_bins(db: Session, wafer_ids: List[int], insertion: int = 1) -> Dict[int, Counter]:
+    """Dies per worst bin of each wafer's ``insertion``, in one pass over the results."""
+    per_die = (
+        select(TestResult.wafer_id, func.max(TestResult.bin).label("worst"))
+        .where(TestResult.wafer_id.in_(wafer_ids), TestResult.insertion == insertion)
+        .group_by(TestResult.wafer_id, TestResult.die_x, TestResult.die_y)
+        .subquery()
+    )
+    rows = db.execute(
+        select(per_die.c.wafer_id, per_die.c.worst, func.count())
+        .group_by(per_die.c.wafer_id, per_die.c.worst)
+    )
+    bins = {wafer_id: Counter() for wafer_id in wafer_ids}
+    for wafer_id, worst, dies in rows:
+        bins[wafer_id][worst] += dies
+    return bins
+
+
+def summarize(
+    results: List[dict], bins: Dict[int, Counter], batch_id: str, created_at: Optional[float] = None
+) -> dict:
+    """
+    Lot summary from the wafer tasks' ``results`` and ``wafer_bins``.
+
+    Wafers with no dies tested count towards neither dies nor yield.
+    """
+    wafers = {}
+    for result in results:
+        wafer_id = result["wafer_id"]
+        counts = bins.get(wafer_id, Counter())
+        dies = sum(counts.values())
+        wafers[wafer_id] = {
+            "status": result["status"],
+            "results": result.get("results", 0),
+            "dies": dies,
+            "good_dies": counts[PASS_BIN],
+            "yield": counts[PASS_BIN] / dies if dies else None,
+            "bins": {str(b): n for b, n in counts.items()},
+            "error": result.get("error"),
+        }
+    statuses = Counter(w["status"] for w in wafers.values())
+    dies = sum(w["dies"] for w in wafers.values())
+    good = sum(w["good_dies"] for w in wafers.values())
+    return {
+        "batch_id": batch_id,
+        "status": "cancelled" if statuses["cancelled"] else "completed",
+        "wafers_total": len(wafers),
+        "wafers_completed": statuses["completed"],
+        "wafers_failed": statuses["failed"],
+        "wafers_cancelled": statuses["cancelled"],
+        "dies": dies,
+        "good_dies": good,
+        "yield": good / dies if dies else None,
+        "turnaround_seconds": round(time.time() - created_at, 1) if created_at else None,
+        "wafers": wafers,
+    }
@@ -1,14 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 import json
 import os
 from dotenv import load_dotenv
-from sqlalchemy import text
 
-from .database import Base, engine
-from .routers import auth, users, tests, analytics
-from .celery_app import celery_app
+from .database import Base, engine, pool_status
+from .health import health_check
+from .metrics import MetricsMiddleware, render
+from .routers import auth, users, tests, analytics, programs
 
 # Load environment variables
 load_dotenv()
@@ -31,13 +31,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(tests.router, prefix="/tests", tags=["tests"])
 app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+app.include_router(programs.router, prefix="/programs", tags=["programs"])
 
 # Custom OpenAPI schema
 def custom_openapi():
@@ -70,23 +73,20 @@ app.openapi = custom_openapi
 
 # Health check endpoint
 @app.get("/health", tags=["health"])
-async def health_check():
-    try:
-        # Test database connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        db_status = True
-    except Exception:
-        db_status = False
-    
-    try:
-        # Test Celery connection
-        celery_status = bool(celery_app.control.ping())
-    except Exception:
-        celery_status = False
-    
-    return {
-        "status": "healthy" if db_status and celery_status else "unhealthy",
-        "celery": celery_status,
-        "database": db_status
-    }
+async def health():
+    """
+    Database and Celery reachability, checked in the background at most
+    every HEALTH_CACHE_SECONDS; see app.health.
+    """
+    return await health_check.status()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics of the API process (all processes in multiprocess mode)."""
+    body, content_type = render()
+    return Response(body, media_type=content_type)
+
+@app.get("/health/pool", tags=["health"])
+async def pool_health():
+    """Connection pool sizing and usage for this process."""
+    return pool_status()
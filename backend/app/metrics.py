@@ -0,0 +1,168 @@
+"""
+Prometheus metrics for the API, the Celery workers and the drivers.
+
+- ``http_request_duration_seconds``: request latency per router (first
+  path segment) and route template, recorded by ``MetricsMiddleware``
+- ``celery_task_duration_seconds``: task run time per task and final state,
+  from Celery's prerun/postrun signals
+- ``wafer_test_queue_wait_seconds``: time a wafer test waited for its
+  instrument
+- ``wafer_dies_tested_total`` and ``results_ingested_total``: take their
+  ``rate()`` for dies and results per second
+- ``db_query_duration_seconds``: SQL statement time per engine and
+  statement type, from SQLAlchemy cursor events
+- ``instrument_io_seconds``: driver I/O per driver and operation
+
+The API serves them on ``/metrics``. A worker serves its own on
+``WORKER_METRICS_PORT`` when set. Processes that fork (prefork Celery
+workers, several uvicorn workers) need ``PROMETHEUS_MULTIPROC_DIR`` set to
+an empty directory, so every child's samples are collected together.
+"""
+import os
+import time
+
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+load_dotenv()
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+# Fast API and SQL calls up to minute-long wafer tests
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ["method", "router", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task run time", ["task", "state"], buckets=TASK_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    "wafer_test_queue_wait_seconds", "Time a wafer test waited for its instrument",
+    ["instrument"], buckets=TASK_BUCKETS,
+)
+DIES_TESTED = Counter("wafer_dies_tested_total", "Dies tested and stored", ["instrument_type"])
+RESULTS_INGESTED = Counter("results_ingested_total", "Test results written to test_results")
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ["engine", "statement"], buckets=LATENCY_BUCKETS,
+)
+INSTRUMENT_IO = Histogram(
+    "instrument_io_seconds", "Instrument driver I/O time", ["driver", "operation"], buckets=LATENCY_BUCKETS,
+)
+HEALTH = Gauge("health_up", "Last health check result (1 up, 0 down)", ["component"], multiprocess_mode="livemax")
+
+
+def _registry() -> CollectorRegistry:
+    # This process's metrics, or every process's in multiprocess mode
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> tuple:
+    """Body and content type of a ``/metrics`` response."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests by the route they matched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = route_template(scope)
+            router = route.strip("/").split("/")[0] or "root"
+            HTTP_REQUEST_DURATION.labels(scope["method"], router, route, str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the route a request matched, e.g. ``/tests/status/{task_id}``.
+
+    The router records the matched route in the scope. Depending on the
+    FastAPI version its path may lack the ``include_router`` prefix, which
+    is then recovered from the request path. Unmatched requests share one
+    label so they cannot blow up cardinality.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    try:
+        rendered = route.path_format.format(**scope.get("path_params", {}))
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return path
+    if scope["path"].endswith(rendered):
+        return scope["path"][:len(scope["path"]) - len(rendered)] + path
+    return path
+
+
+def instrument_engine(sync_engine, name: str):
+    """Time every statement ``sync_engine`` (or an async engine's ``sync_engine``) executes."""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    # Histogram children by statement keyword, to skip the label lookup
+    children = {}
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        words = statement[:32].split(None, 1)
+        keyword = words[0].upper() if words else "OTHER"
+        child = children.get(keyword)
+        if child is None:
+            child = children[keyword] = DB_QUERY_DURATION.labels(name, keyword)
+        child.observe(elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        # after_cursor_execute does not run for a failed statement
+        if context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+def serve(port: int):
+    """Serve metrics over HTTP from a background thread, for Celery workers."""
+    start_http_server(port, registry=_registry())
+
+
+def mark_process_dead(pid: int):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, SmallInteger, String, DateTime, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -8,6 +8,12 @@ class Wafer(Base):
     id = Column(Integer, primary_key=True, index=True)
     batch_id = Column(String, index=True)
     created_at = Column(DateTime, default=func.now())
+    # Set once the wafer's results have moved to the Parquet archive
+    archived_at = Column(DateTime, nullable=True)
+    # Program whose limits binned this wafer's results
+    program_id = Column(Integer, ForeignKey('test_programs.id'), nullable=True)
+    # Bumped by every write of results; versions the cached wafer map
+    results_version = Column(Integer, nullable=False, default=0, server_default='0')
     test_results = relationship("TestResult", back_populates="wafer")
 
 class TestResult(Base):
@@ -18,8 +24,50 @@ class TestResult(Base):
     die_y = Column(Integer)
     test_name = Column(String)
     result_value = Column(Float)
+    # Bin assigned at ingest, see app.binning
+    bin = Column(SmallInteger)
+    # Test insertion (sort pass) the result belongs to; a die is tested at
+    # most once per test per insertion
+    insertion = Column(SmallInteger, nullable=False, default=1, server_default='1')
     timestamp = Column(DateTime, default=func.now())
     wafer = relationship("Wafer", back_populates="test_results")
+    __table_args__ = (
+        Index('ix_test_results_wafer_id_timestamp', 'wafer_id', 'timestamp'),
+        Index('uq_test_results_die_test', 'wafer_id', 'insertion', 'die_x', 'die_y', 'test_name', unique=True),
+        Index('ix_test_results_test_name_result_value', 'test_name', 'result_value'),
+        Index('ix_test_results_wafer_id_id', 'wafer_id', 'id'),
+    )
+
+class YieldAggregate(Base):
+    __tablename__ = 'yield_aggregates'
+    id = Column(Integer, primary_key=True, index=True)
+    wafer_id = Column(Integer, ForeignKey('wafers.id'), index=True)
+    batch_id = Column(String, index=True)
+    test_name = Column(String)
+    bucket = Column(DateTime, index=True)
+    total = Column(Integer, nullable=False, default=0)
+    passes = Column(Integer, nullable=False, default=0)
+    __table_args__ = (UniqueConstraint('wafer_id', 'test_name', 'bucket'),)
+
+class TestProgram(Base):
+    __tablename__ = 'test_programs'
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    # Bumped whenever the limits change
+    version = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=func.now())
+    limits = relationship("TestLimit", back_populates="program", cascade="all, delete-orphan")
+
+class TestLimit(Base):
+    __tablename__ = 'test_limits'
+    id = Column(Integer, primary_key=True, index=True)
+    program_id = Column(Integer, ForeignKey('test_programs.id'), nullable=False)
+    test_name = Column(String, nullable=False)
+    lsl = Column(Float, nullable=True)
+    usl = Column(Float, nullable=True)
+    fail_bin = Column(SmallInteger, nullable=False)
+    program = relationship("TestProgram", back_populates="limits")
+    __table_args__ = (UniqueConstraint('program_id', 'test_name'),)
 
 class User(Base):
     __tablename__ = 'users'
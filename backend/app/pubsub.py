@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "redis" if REDIS_URL else "memory")
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+def wafer_channel(wafer_id: int) -> str:
+    return f"wafer:{wafer_id}"
+
+
+class InMemoryBroker:
+    """
+    Fan-out of messages to subscribers living in this process.
+
+    ``publish`` is thread-safe so a worker thread (or an eager Celery task)
+    can publish to websocket handlers running on the event loop. A
+    subscriber that falls more than ``SUBSCRIBER_QUEUE_SIZE`` messages
+    behind has new messages dropped rather than stalling the publisher.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+
+    def _attach(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[channel].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def _detach(self, channel: str, queue: asyncio.Queue) -> bool:
+        """Remove a subscriber; returns True if the channel has none left."""
+        subscribers = self._subscribers[channel]
+        subscribers.discard((asyncio.get_running_loop(), queue))
+        if not subscribers:
+            del self._subscribers[channel]
+            return True
+        return False
+
+    def has_subscribers(self, channel: str) -> bool:
+        return bool(self._subscribers.get(channel))
+
+    def dispatch(self, channel: str, message: dict):
+        for loop, queue in list(self._subscribers.get(channel, ())):
+            loop.call_soon_threadsafe(self._put, queue, message)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, message: dict):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    def publish(self, channel: str, message: dict):
+        self.dispatch(channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        queue = self._attach(channel)
+        try:
+            yield queue
+        finally:
+            self._detach(channel, queue)
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Redis pub/sub broker for multi-process deployments.
+
+    Publishers do one ``PUBLISH`` per message. Each API process holds a
+    single Redis subscription per channel, no matter how many websocket
+    clients watch it, and fans messages out to them locally.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._client = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def publish(self, channel: str, message: dict):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(message))
+
+    async def _read(self):
+        while True:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Redis pub/sub reader failed, retrying")
+                await asyncio.sleep(1)
+                continue
+            if msg and msg["type"] == "message":
+                self.dispatch(msg["channel"].decode(), json.loads(msg["data"]))
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        import redis.asyncio as aioredis
+
+        if self._pubsub is None:
+            self._pubsub = aioredis.Redis.from_url(self.url).pubsub()
+
+        first = not self.has_subscribers(channel)
+        queue = self._attach(channel)
+        try:
+            if first:
+                await self._pubsub.subscribe(channel)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+            yield queue
+        finally:
+            if self._detach(channel, queue):
+                await self._pubsub.unsubscribe(channel)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = RedisBroker(REDIS_URL) if PUBSUB_BACKEND == "redis" else InMemoryBroker()
+    return _broker
+
+
+def publish_results(wafer_id: int, rows: list):
+    """Publish newly committed result rows for live monitoring; never raises."""
+    message = {
+        "wafer_id": wafer_id,
+        "results": [
+            {
+                "die_x": r["die_x"],
+                "die_y": r["die_y"],
+                "test_name": r["test_name"],
+                "result_value": r["result_value"],
+                "bin": r["bin"],
+                "timestamp": r["timestamp"].isoformat(),
+            }
+            for r in rows
+        ],
+    }
+    try:
+        get_broker().publish(wafer_channel(wafer_id), message)
+    except Exception:
+        logger.warning("Could not publish results for wafer %s", wafer_id, exc_info=True)
@@ -0,0 +1,78 @@
+"""
+Concurrency limiting for expensive endpoints.
+
+``ConcurrencyLimiter.slot(user, ip)`` admits a request only if that user
+has fewer than ``per_user`` and that client IP fewer than ``per_ip``
+requests in flight (operators behind one NAT share an IP, so the IP limit
+is the looser one), then waits up to ``queue_timeout`` seconds for one of
+``max_concurrency`` global slots. Either failure raises ``RateLimited``,
+which the login endpoint turns into 429 with a Retry-After header.
+
+Limits are per API process.
+"""
+import asyncio
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+LOGIN_MAX_CONCURRENCY = int(os.getenv("LOGIN_MAX_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+LOGIN_MAX_PER_USER = int(os.getenv("LOGIN_MAX_PER_USER", "2"))
+LOGIN_MAX_PER_IP = int(os.getenv("LOGIN_MAX_PER_IP", "20"))
+LOGIN_QUEUE_TIMEOUT = float(os.getenv("LOGIN_QUEUE_TIMEOUT", "5"))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many requests, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrency: int, per_user: int, per_ip: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.limits = {"user": per_user, "ip": per_ip}
+        self.queue_timeout = queue_timeout
+        self._in_flight = Counter()
+        self._semaphore = None
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, user: str = None, ip: str = None):
+        keys = [(kind, value) for kind, value in (("user", user), ("ip", ip)) if value]
+        if any(self._in_flight[k] >= self.limits[k[0]] for k in keys):
+            self.rejected += 1
+            raise RateLimited(1)
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        for k in keys:
+            self._in_flight[k] += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise RateLimited(self.queue_timeout)
+            try:
+                yield
+            finally:
+                self._semaphore.release()
+        finally:
+            for k in keys:
+                self._in_flight[k] -= 1
+                if not self._in_flight[k]:
+                    del self._in_flight[k]
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight_keys": len(self._in_flight),
+            "rejected": self.rejected,
+        }
+
+
+login_limiter = ConcurrencyLimiter(LOGIN_MAX_CONCURRENCY, LOGIN_MAX_PER_USER, LOGIN_MAX_PER_IP, LOGIN_QUEUE_TIMEOUT)
@@ -1,19 +1,197 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import TestResult
+import re
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..aggregates import bucket_of
+from ..archive import stream_export
+from ..binning import bin_table
+from ..database import SessionLocal, get_async_db
+from ..models import Wafer, YieldAggregate
+from ..stats import GDBN_MIN_BAD_NEIGHBORS, NNR_SIGMA, load_results, spatial_outliers, test_statistics
+from ..wafer_map import wafer_map_cache, wafer_version
 
 router = APIRouter()
 
+def yield_query(
+    batch_id: Optional[str] = None,
+    wafer_id: Optional[int] = None,
+    test_name: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    query = select(
+        func.coalesce(func.sum(YieldAggregate.total), 0),
+        func.coalesce(func.sum(YieldAggregate.passes), 0),
+    )
+    if batch_id is not None:
+        query = query.where(YieldAggregate.batch_id == batch_id)
+    if wafer_id is not None:
+        query = query.where(YieldAggregate.wafer_id == wafer_id)
+    if test_name is not None:
+        query = query.where(YieldAggregate.test_name == test_name)
+    if start is not None:
+        query = query.where(YieldAggregate.bucket >= bucket_of(start))
+    if end is not None:
+        query = query.where(YieldAggregate.bucket <= end)
+    return query
+
 @router.get("/yield")
-def get_yield_stats(db: Session = Depends(get_db)):
-    total = db.query(TestResult).count()
-    passes = db.query(TestResult).filter(TestResult.result_value <= 0.001).count()
+async def get_yield_stats(
+    batch_id: Optional[str] = None,
+    wafer_id: Optional[int] = None,
+    test_name: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Yield over all results matching the filters, served from the hourly
+    yield aggregates. ``start``/``end`` are matched against hour buckets.
+    """
+    total, passes = (await db.execute(yield_query(batch_id, wafer_id, test_name, start, end))).one()
     yield_rate = (passes / total * 100) if total else 0
     return {"total": total, "pass": passes, "yield": yield_rate}
 
 @router.get("/wafer_map/{wafer_id}")
-def get_wafer_map(wafer_id: int, db: Session = Depends(get_db)):
-    results = db.query(TestResult).filter(TestResult.wafer_id == wafer_id).all()
-    data = [{"x": r.die_x, "y": r.die_y, "status": "pass" if r.result_value <= 0.001 else "fail"} for r in results]
-    return {"wafer_id": wafer_id, "die_data": data}
+async def get_wafer_map(
+    wafer_id: int,
+    format: str = Query("json", pattern="^(json|binary)$"),
+    insertion: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Wafer map as JSON or, with ``format=binary``, as the compact encoding
+    described in ``app.wafer_map``, of one ``insertion`` or, by default,
+    of every insertion. Responses carry an ETag that changes whenever
+    results of the wafer are written.
+    """
+    version = await db.run_sync(wafer_version, wafer_id)
+    etag = f'"wm-{wafer_id}-{insertion or "all"}-{version}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+
+    wafer_map = await db.run_sync(wafer_map_cache.get, wafer_id, version, insertion)
+    if format == "binary":
+        return Response(wafer_map.to_bytes(), media_type="application/octet-stream", headers=headers)
+    return JSONResponse(wafer_map.to_json(), headers=headers)
+
+async def _select_wafers(db: AsyncSession, wafer_id: Optional[int], batch_id: Optional[str]):
+    if wafer_id is None and batch_id is None:
+        raise HTTPException(status_code=400, detail="Give a wafer_id or batch_id")
+    query = select(Wafer).order_by(Wafer.id)
+    if wafer_id is not None:
+        query = query.where(Wafer.id == wafer_id)
+    if batch_id is not None:
+        query = query.where(Wafer.batch_id == batch_id)
+    wafers = (await db.execute(query)).scalars().all()
+    if not wafers:
+        raise HTTPException(status_code=404, detail="No matching wafers")
+    return wafers
+
+def _limit_overrides(test_name: Optional[str], lsl: Optional[float], usl: Optional[float]) -> Optional[dict]:
+    if lsl is None and usl is None:
+        return None
+    return {test_name or "*": {"lsl": lsl, "usl": usl}}
+
+@router.get("/stats")
+async def get_test_stats(
+    wafer_id: Optional[int] = None,
+    batch_id: Optional[str] = None,
+    test_name: Optional[str] = None,
+    insertion: Optional[int] = Query(None, ge=1),
+    lsl: Optional[float] = None,
+    usl: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Per-test distribution statistics for a wafer or lot: count, mean,
+    sigma, min/max, percentiles, yield (from the stored bins) and Cpk
+    (against the wafers' test program limits).
+
+    Args:
+        insertion: Only this test insertion; every insertion by default
+        lsl, usl: Spec limits replacing the program's for ``test_name`` (or
+            every test when no test is given); yield is then re-evaluated
+            against them
+
+    Raises:
+        HTTPException: If neither wafer_id nor batch_id is given or nothing matches
+    """
+    wafers = await _select_wafers(db, wafer_id, batch_id)
+    arrays = await db.run_sync(lambda session: load_results(session, wafers, test_name, insertion))
+    overrides = _limit_overrides(test_name, lsl, usl)
+    # Cpk against the program's limits when the wafers share one
+    programs = {w.program_id for w in wafers}
+    defaults = None
+    if len(programs) == 1 and None not in programs:
+        defaults = (await db.run_sync(bin_table, programs.pop())).limits()
+    tests = await run_in_threadpool(test_statistics, arrays, overrides, defaults)
+    return {"wafers": len(wafers), "results": len(arrays), "tests": tests}
+
+@router.get("/outliers/{wafer_id}")
+async def get_spatial_outliers(
+    wafer_id: int,
+    test_name: Optional[str] = None,
+    insertion: int = Query(1, ge=1),
+    lsl: Optional[float] = None,
+    usl: Optional[float] = None,
+    k: float = Query(NNR_SIGMA, gt=0),
+    min_bad_neighbors: int = Query(GDBN_MIN_BAD_NEIGHBORS, ge=1, le=8),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Spatial outliers on a wafer's die grid: good dies with at least
+    ``min_bad_neighbors`` failing neighbours (GDBN), and values more than
+    ``k`` robust sigmas from their neighbourhood median (NNR), on the die
+    grid of one test ``insertion``.
+    """
+    wafers = await _select_wafers(db, wafer_id, None)
+    arrays = await db.run_sync(lambda session: load_results(session, wafers, test_name, insertion))
+    overrides = _limit_overrides(test_name, lsl, usl)
+    outliers = await run_in_threadpool(spatial_outliers, arrays, overrides, k, min_bad_neighbors)
+    return {"wafer_id": wafer_id, **outliers}
+
+EXPORT_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+@router.get("/export")
+async def export_results(
+    wafer_id: Optional[int] = None,
+    batch_id: Optional[str] = None,
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Download the results of a wafer or a whole lot as one Parquet file or
+    Arrow IPC stream, streamed record batch by record batch. Archived
+    wafers are read back from the archive.
+
+    Raises:
+        HTTPException: If neither filter is given or nothing matches
+    """
+    wafer_ids = [w.id for w in await _select_wafers(db, wafer_id, batch_id)]
+
+    def body():
+        # Runs in the threadpool; holds its own session for the whole download
+        session = SessionLocal()
+        try:
+            wafers = session.query(Wafer).filter(Wafer.id.in_(wafer_ids)).order_by(Wafer.id).all()
+            yield from stream_export(session, wafers, format)
+        finally:
+            session.close()
+
+    name = f"wafer_{wafer_id}" if wafer_id is not None else re.sub(r"[^\w.-]", "_", f"batch_{batch_id}")
+    extension = "parquet" if format == "parquet" else "arrows"
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
@@ -1,36 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
-import os
-from ..database import get_db
+from ..auth_cache import AuthUser, token_cache, user_cache
+from ..database import SessionLocal, get_async_db
 from ..models import User
-from ..schemas import UserCreate
-from ..utils import verify_password, create_access_token, hash_password
+from ..rate_limit import RateLimited, login_limiter
+from ..schemas import UserCreate, User as UserSchema
+from ..utils import (
+    ALGORITHM, JWT_SECRET, create_access_token, hash_password_async, needs_rehash, verify_password_async
+)
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _load_user(username: str):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        return AuthUser(user.id, user.username, user.role) if user else None
+    finally:
+        db.close()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> AuthUser:
+    """
+    Resolve the bearer token to its user. Verified tokens and users are
+    cached (``app.auth_cache``), so a repeat request touches neither the
+    JWT signature nor the database.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
+    username = token_cache.get(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        # Tokens without an expiry are verified every time
+        if payload.get("exp") is not None:
+            token_cache.put(token, username, payload["exp"])
     
-    user = db.query(User).filter(User.username == username).first()
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await run_in_threadpool(_load_user, username)
+        if user is None:
+            raise credentials_exception
+        user_cache.put(username, user)
     return user
 
-def get_current_admin(current_user: User = Depends(get_current_user)):
+async def get_current_admin(current_user: AuthUser = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -38,22 +65,54 @@ def get_current_admin(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-@router.post("/signup", response_model=User)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+@asynccontextmanager
+async def _limited(username: str, request: Request):
+    try:
+        async with login_limiter.slot(username, request.client.host if request.client else None):
+            yield
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts in progress",
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+@router.post("/signup", response_model=UserSchema)
+async def signup(user: UserCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_pw = hash_password(user.password)
+    async with _limited(None, request):
+        hashed_pw = await hash_password_async(user.password)
     new_user = User(username=user.username, hashed_pw=hashed_pw, role=user.role)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    user_cache.invalidate(new_user.username)
     return new_user
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == form_data.username).first()
-    if not db_user or not verify_password(form_data.password, db_user.hashed_pw):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+async def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Exchange username and password for an access token.
+
+    bcrypt runs in its own bounded thread pool, and concurrent attempts are
+    capped per user, per client IP and overall, so a login storm cannot
+    starve other endpoints.
+
+    Raises:
+        HTTPException: 401 on bad credentials, 429 when over the login limits
+    """
+    async with _limited(form_data.username, request):
+        db_user = await db.scalar(select(User).where(User.username == form_data.username))
+        if not db_user or not await verify_password_async(form_data.password, db_user.hashed_pw):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+        # Move the stored hash to the configured cost factor
+        if needs_rehash(db_user.hashed_pw):
+            db_user.hashed_pw = await hash_password_async(form_data.password)
+            await db.commit()
     token = create_access_token({"sub": db_user.username, "role": db_user.role})
     return {"access_token": token, "token_type": "bearer"}
@@ -0,0 +1,62 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import TestLimit as DBTestLimit, TestProgram as DBTestProgram
+from ..schemas import TestLimitBase, TestProgram, TestProgramCreate
+from ..routers.auth import get_current_admin, get_current_user
+
+router = APIRouter()
+
+def _check_limits(limits: List[TestLimitBase]):
+    names = [limit.test_name for limit in limits]
+    if len(names) != len(set(names)):
+        raise HTTPException(status_code=400, detail="Each test may have only one limit")
+
+@router.post("/", response_model=TestProgram, dependencies=[Depends(get_current_admin)])
+def create_program(program: TestProgramCreate, db: Session = Depends(get_db)):
+    """
+    Create a test program with its per-test limits and fail bins.
+
+    Raises:
+        HTTPException: If the name is taken or a test has two limits
+    """
+    if db.query(DBTestProgram).filter(DBTestProgram.name == program.name).first():
+        raise HTTPException(status_code=400, detail="Program name already registered")
+    _check_limits(program.limits)
+    new_program = DBTestProgram(
+        name=program.name,
+        version=1,
+        limits=[DBTestLimit(**limit.model_dump()) for limit in program.limits]
+    )
+    db.add(new_program); db.commit(); db.refresh(new_program)
+    return new_program
+
+@router.get("/", response_model=list[TestProgram], dependencies=[Depends(get_current_user)])
+def list_programs(db: Session = Depends(get_db)):
+    return db.query(DBTestProgram).order_by(DBTestProgram.id).all()
+
+@router.get("/{program_id}", response_model=TestProgram, dependencies=[Depends(get_current_user)])
+def get_program(program_id: int, db: Session = Depends(get_db)):
+    program = db.get(DBTestProgram, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Program not found")
+    return program
+
+@router.put("/{program_id}/limits", response_model=TestProgram, dependencies=[Depends(get_current_admin)])
+def replace_limits(program_id: int, limits: List[TestLimitBase], db: Session = Depends(get_db)):
+    """
+    Replace a program's limits. Results already ingested keep their bins;
+    workers pick up the new limits on their next chunk.
+    """
+    program = db.get(DBTestProgram, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Program not found")
+    _check_limits(limits)
+    # Flush the deletes first so re-adding a test doesn't hit the unique constraint
+    program.limits.clear()
+    db.flush()
+    program.limits.extend(DBTestLimit(**limit.model_dump()) for limit in limits)
+    program.version += 1
+    db.commit(); db.refresh(program)
+    return program
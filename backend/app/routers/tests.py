@@ -1,20 +1,73 @@
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from typing import Optional
-from ..database import get_db
-from ..models import Wafer, TestResult
-from ..celery_app import run_wafer_test
+import contextlib
+import json
+import logging
+import os
+import time
+from celery import states
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ..adaptive import AdaptivePolicy
+from ..hardware.path_planner import path_options
+from ..database import AsyncSessionLocal, get_async_db
+from ..models import TestProgram, Wafer, TestResult
+from ..celery_app import celery_app
+from ..scheduler import NoInstrumentError, instrument_status, schedule_lot, schedule_wafer_test, state
+from ..pubsub import get_broker, wafer_channel
 from ..routers.auth import get_current_user, get_current_admin
-from ..schemas import TestResult, WaferTestConfig
+from ..schemas import LotTestConfig, TaskStatusQuery, WaferTestConfig
+from ..task_status import task_statuses
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+RESULTS_PAGE_SIZE = int(os.getenv("RESULTS_PAGE_SIZE", "1000"))
+RESULTS_MAX_PAGE_SIZE = int(os.getenv("RESULTS_MAX_PAGE_SIZE", "10000"))
+# Rows fetched per server-side cursor round trip when streaming NDJSON
+RESULTS_STREAM_CHUNK = int(os.getenv("RESULTS_STREAM_CHUNK", "5000"))
+# Seconds between result backend lookups, and between keep-alive comments,
+# on a task status stream
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", "1.0"))
+STATUS_HEARTBEAT = float(os.getenv("STATUS_HEARTBEAT", "15"))
+
+RESULT_COLUMNS = (
+    TestResult.id,
+    TestResult.wafer_id,
+    TestResult.die_x,
+    TestResult.die_y,
+    TestResult.test_name,
+    TestResult.result_value,
+    TestResult.bin,
+    TestResult.insertion,
+    TestResult.timestamp,
+)
+
+def _check_test_params(test_params: dict):
+    try:
+        AdaptivePolicy.from_params(test_params.get("adaptive"))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid adaptive policy: {e}")
+    try:
+        path_options(test_params.get("path"))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid die path options: {e}")
+
+async def _program_id(db: AsyncSession, name: str) -> int:
+    program_id = await db.scalar(select(TestProgram.id).where(TestProgram.name == name))
+    if program_id is None:
+        raise HTTPException(status_code=400, detail=f"No test program named {name!r}")
+    return program_id
 
 @router.post("/run")
 async def start_test(
     config: WaferTestConfig,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Start a wafer test with the given configuration.
@@ -28,78 +81,403 @@ async def start_test(
         Dict with task ID and status
     
     Raises:
-        HTTPException: If wafer not found or user not authorized
+        HTTPException: If wafer not found, the wafer is archived (409), the
+            test program or a matching instrument is not registered, the
+            adaptive policy or die path options are invalid, or user not
+            authorized
     """
     # Verify wafer exists
-    wafer = db.query(Wafer).get(config.wafer_id)
+    wafer = await db.get(Wafer, config.wafer_id)
     if not wafer:
         raise HTTPException(status_code=404, detail="Wafer not found")
+    # Archived results are read from Parquet only, so new rows would never
+    # be seen or archived
+    if wafer.archived_at is not None:
+        raise HTTPException(status_code=409, detail=f"Wafer {config.wafer_id} is archived")
+    
+    _check_test_params(config.test_params)
+
+    # Bin this wafer's results against the program's limits
+    if config.program is not None:
+        wafer.program_id = await _program_id(db, config.program)
+        await db.commit()
         
-    # Start Celery task
-    task = run_wafer_test.delay(
-        wafer_id=config.wafer_id,
-        instrument_type=config.instrument_type,
-        test_params=config.test_params
-    )
+    # Queue the Celery task on the chosen instrument
+    try:
+        instrument, task = await run_in_threadpool(
+            schedule_wafer_test,
+            wafer_id=config.wafer_id,
+            instrument_type=config.instrument_type,
+            test_params=config.test_params,
+            instrument=config.instrument,
+            insertion=config.insertion,
+            priority=config.priority
+        )
+    except NoInstrumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "task_id": task.id,
         "status": "started",
-        "wafer_id": config.wafer_id
+        "wafer_id": config.wafer_id,
+        "instrument": instrument.name
+    }
+
+@router.post("/lots")
+async def start_lot(
+    config: LotTestConfig,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Test every wafer of a lot in parallel.
+
+    The lot's wafers (those not archived) are spread over the instruments
+    of ``instrument_type`` and their results summarized together once the
+    last one finishes; follow it with GET /tests/lots/{lot_id}.
+
+    Args:
+        config: Lot, instrument type and test settings shared by its wafers
+        current_user: The authenticated user making the request
+        db: Database session
+
+    Returns:
+        Dict with the lot ID and each wafer's task ID and instrument
+
+    Raises:
+        HTTPException: If the lot has no wafers, the test program or an
+            instrument of the type is not registered, or the test params
+            are invalid
+    """
+    wafers = (await db.scalars(
+        select(Wafer).where(Wafer.batch_id == config.batch_id, Wafer.archived_at.is_(None)).order_by(Wafer.id)
+    )).all()
+    if not wafers:
+        raise HTTPException(status_code=404, detail=f"No wafers in lot {config.batch_id!r}")
+
+    _check_test_params(config.test_params)
+
+    if config.program is not None:
+        program_id = await _program_id(db, config.program)
+        for wafer in wafers:
+            wafer.program_id = program_id
+        await db.commit()
+
+    try:
+        lot = await run_in_threadpool(
+            schedule_lot,
+            config.batch_id,
+            [w.id for w in wafers],
+            config.instrument_type,
+            config.test_params,
+            config.insertion,
+            config.priority
+        )
+    except NoInstrumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "started", **lot}
+
+async def _get_lot(lot_id: str) -> dict:
+    lot = await run_in_threadpool(state.get_lot, lot_id)
+    if lot is None:
+        raise HTTPException(status_code=404, detail="Lot not found")
+    return lot
+
+@router.get("/lots/{lot_id}")
+async def get_lot_status(
+    lot_id: str,
+    current_user = Depends(get_current_user)
+):
+    """
+    Status of a lot run: each wafer's task status and, once every wafer is
+    done, the lot summary with its yield. All tasks are looked up in one
+    result backend round trip.
+
+    Raises:
+        HTTPException: If the lot is unknown or expired
+    """
+    lot = await _get_lot(lot_id)
+    wafers = lot["wafers"]
+    task_ids = [lot_id] + [w["task_id"] for w in wafers.values()]
+    statuses = await run_in_threadpool(task_statuses, celery_app, task_ids)
+    return {
+        **lot,
+        "cancelled": await run_in_threadpool(state.lot_cancelled, lot_id),
+        "status": statuses[lot_id]["status"],
+        "summary": statuses[lot_id].get("result"),
+        "wafers": {
+            wafer_id: {**wafer, **statuses[wafer["task_id"]]} for wafer_id, wafer in wafers.items()
+        },
     }
 
+@router.post("/lots/{lot_id}/cancel")
+async def cancel_lot(
+    lot_id: str,
+    current_user = Depends(get_current_user)
+):
+    """
+    Cancel a lot run. Wafers still queued are skipped and running wafers
+    stop after their current batch, keeping the results stored so far; the
+    lot summary then covers what was tested.
+
+    Raises:
+        HTTPException: If the lot is unknown or expired
+    """
+    await _get_lot(lot_id)
+    await run_in_threadpool(state.cancel_lot, lot_id)
+    return {"lot_id": lot_id, "status": "cancelling"}
+
+@router.get("/instruments")
+async def list_instruments(current_user = Depends(get_current_user)):
+    """
+    Registered instruments with their queue depth, active task and queue
+    wait times.
+    """
+    return await run_in_threadpool(instrument_status)
+
+@router.post("/status")
+async def get_test_statuses(
+    query: TaskStatusQuery,
+    current_user = Depends(get_current_user)
+):
+    """
+    Status of many test tasks in one result backend round trip.
+
+    Args:
+        query: IDs of the tasks to look up
+        current_user: The authenticated user making the request
+
+    Returns:
+        Dict of task ID to status, progress while running and result once
+        ready
+    """
+    return await run_in_threadpool(task_statuses, celery_app, query.task_ids)
+
+async def _status_events(request: Request, task_ids: List[str]):
+    last = {}
+    last_sent = time.monotonic()
+    while True:
+        statuses = await run_in_threadpool(task_statuses, celery_app, task_ids)
+        for task_id, status in statuses.items():
+            if status != last.get(task_id):
+                last[task_id] = status
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {json.dumps(status, default=str)}\n\n"
+        if all(s["status"] in states.READY_STATES for s in statuses.values()):
+            yield "event: end\ndata: {}\n\n"
+            return
+        if time.monotonic() - last_sent >= STATUS_HEARTBEAT:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+        if await request.is_disconnected():
+            return
+
+@router.get("/status/stream")
+async def stream_test_status(
+    request: Request,
+    task_id: List[str] = Query(..., max_length=1000),
+    current_user = Depends(get_current_user)
+):
+    """
+    Server-sent events with the status of the given tasks.
+
+    Sends a ``status`` event per task on connect and then whenever a
+    task's status or progress changes, and an ``end`` event once every task
+    is ready. All tasks are looked up together every STATUS_POLL_INTERVAL
+    seconds, however many there are.
+
+    Args:
+        request: The incoming request, to notice client disconnects
+        task_id: Task IDs to watch, repeated
+        current_user: The authenticated user making the request
+    """
+    return StreamingResponse(
+        _status_events(request, list(dict.fromkeys(task_id))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/status/{task_id}")
 async def get_test_status(
     task_id: str,
     current_user = Depends(get_current_user)
 ):
     """
-    Get the status of a running test task.
+    Get the status of a running test task, with dies done and total while
+    it runs.
     """
-    task = run_wafer_test.AsyncResult(task_id)
+    statuses = await run_in_threadpool(task_statuses, celery_app, [task_id])
+    return statuses[task_id]
+
+def _parse_cursor(cursor: str):
+    try:
+        wafer_id, result_id = (int(part) for part in cursor.split(":"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return wafer_id, result_id
+
+def results_query(
+    wafer_id: Optional[int] = None,
+    batch_id: Optional[str] = None,
+    test_name: Optional[str] = None,
+    x_min: Optional[int] = None,
+    x_max: Optional[int] = None,
+    y_min: Optional[int] = None,
+    y_max: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[tuple] = None
+):
+    """Filtered results in keyset order (wafer_id, id), after the ``after`` key."""
+    query = select(*RESULT_COLUMNS).order_by(TestResult.wafer_id, TestResult.id)
+    if wafer_id is not None:
+        query = query.where(TestResult.wafer_id == wafer_id)
+    if batch_id is not None:
+        query = query.where(TestResult.wafer_id.in_(select(Wafer.id).where(Wafer.batch_id == batch_id)))
+    if test_name is not None:
+        query = query.where(TestResult.test_name == test_name)
+    if x_min is not None:
+        query = query.where(TestResult.die_x >= x_min)
+    if x_max is not None:
+        query = query.where(TestResult.die_x <= x_max)
+    if y_min is not None:
+        query = query.where(TestResult.die_y >= y_min)
+    if y_max is not None:
+        query = query.where(TestResult.die_y <= y_max)
+    if start is not None:
+        query = query.where(TestResult.timestamp >= start)
+    if end is not None:
+        query = query.where(TestResult.timestamp <= end)
+    if after is not None:
+        query = query.where(tuple_(TestResult.wafer_id, TestResult.id) > tuple_(*after))
+    return query
+
+def _result_dict(row) -> dict:
     return {
-        "task_id": task_id,
-        "status": task.status,
-        "result": task.result if task.ready() else None
+        "id": row.id,
+        "wafer_id": row.wafer_id,
+        "die_x": row.die_x,
+        "die_y": row.die_y,
+        "test_name": row.test_name,
+        "result_value": row.result_value,
+        "bin": row.bin,
+        "insertion": row.insertion,
+        "timestamp": row.timestamp.isoformat()
     }
 
+async def _stream_ndjson(query):
+    # Own session for the life of the download; yield_per makes the driver
+    # use a server-side cursor, so only one chunk is held at a time
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=RESULTS_STREAM_CHUNK))
+        async for rows in result.partitions():
+            yield "".join(json.dumps(_result_dict(row)) + "\n" for row in rows)
+
+@router.get("/results")
+async def list_results(
+    wafer_id: Optional[int] = None,
+    batch_id: Optional[str] = None,
+    test_name: Optional[str] = None,
+    x_min: Optional[int] = None,
+    x_max: Optional[int] = None,
+    y_min: Optional[int] = None,
+    y_max: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(RESULTS_PAGE_SIZE, ge=1, le=RESULTS_MAX_PAGE_SIZE),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Query raw test results, filtered by wafer or lot, test, die region
+    (inclusive ``x_min``..``y_max``) and time range.
+
+    Results are ordered by (wafer_id, id) and paged by keyset: pass a
+    page's ``next_cursor`` back as ``cursor`` to get the next page. With
+    ``format=ndjson`` every matching result after ``cursor`` is streamed
+    as one JSON object per line instead. Archived wafers are not in the
+    live table; download them with /analytics/export.
+
+    Returns:
+        Dict with the page of results and ``next_cursor`` (None on the last page)
+
+    Raises:
+        HTTPException: If the cursor is malformed
+    """
+    after = _parse_cursor(cursor) if cursor else None
+    query = results_query(wafer_id, batch_id, test_name, x_min, x_max, y_min, y_max, start, end, after)
+
+    if format == "ndjson":
+        return StreamingResponse(_stream_ndjson(query), media_type="application/x-ndjson")
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].wafer_id}:{rows[-1].id}"
+    return {"results": [_result_dict(row) for row in rows], "next_cursor": next_cursor}
+
+async def _latest_results(db: AsyncSession, wafer_id: int, limit: int = 10):
+    results = await db.scalars(
+        select(TestResult)
+        .where(TestResult.wafer_id == wafer_id)
+        .order_by(TestResult.timestamp.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "die_x": r.die_x,
+            "die_y": r.die_y,
+            "test_name": r.test_name,
+            "result_value": r.result_value,
+            "bin": r.bin,
+            "timestamp": r.timestamp.isoformat()
+        }
+        for r in results
+    ]
+
+async def _forward(websocket: WebSocket, queue: asyncio.Queue, wafer_id: int):
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except Exception:
+        # End the stream visibly rather than leave the client waiting
+        logger.exception("Live results for wafer %s stopped", wafer_id)
+        with contextlib.suppress(Exception):
+            await websocket.close(code=1011)
+
 @router.websocket("/ws/{wafer_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
-    wafer_id: int,
-    db: Session = Depends(get_db)
+    wafer_id: int
 ):
     """
-    WebSocket endpoint for real-time test monitoring
+    WebSocket endpoint for real-time test monitoring.
+
+    Sends the latest results once on connect, then pushes each batch of new
+    results as the worker publishes it.
     """
     await websocket.accept()
     try:
-        while True:
-            # Get latest results
-            results = (
-                db.query(TestResult)
-                .filter(TestResult.wafer_id == wafer_id)
-                .order_by(TestResult.timestamp.desc())
-                .limit(10)
-                .all()
-            )
-            
-            # Send updates
-            await websocket.send_json({
-                "wafer_id": wafer_id,
-                "results": [
-                    {
-                        "die_x": r.die_x,
-                        "die_y": r.die_y,
-                        "test_name": r.test_name,
-                        "result_value": r.result_value,
-                        "timestamp": r.timestamp.isoformat()
-                    }
-                    for r in results
-                ]
-            })
+        async with get_broker().subscribe(wafer_channel(wafer_id)) as queue:
+            # Snapshot after subscribing so nothing published in between is
+            # lost; the session is closed before streaming so long-lived
+            # connections don't pin a pooled DB connection.
+            async with AsyncSessionLocal() as db:
+                results = await _latest_results(db, wafer_id)
+            await websocket.send_json({"wafer_id": wafer_id, "results": results})
             
-            await asyncio.sleep(1)  # Update every second
+            forward = asyncio.create_task(_forward(websocket, queue, wafer_id))
+            try:
+                while True:
+                    await websocket.receive_text()
+            finally:
+                forward.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await forward
             
     except WebSocketDisconnect:
         print(f"Client disconnected from wafer {wafer_id} monitoring")
@@ -1,20 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..schemas import User, UserCreate
+from ..auth_cache import user_cache
+from ..database import get_async_db, get_db
+from ..schemas import User, UserCreate, UserUpdate
 from ..models import User as DBUser
-from ..utils import hash_password
+from ..utils import hash_password_async
 from ..routers.auth import get_current_admin
 
 router = APIRouter()
 
 @router.post("/", response_model=User, dependencies=[Depends(get_current_admin)])
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    hashed_pw = hash_password(user.password)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    hashed_pw = await hash_password_async(user.password)
     new_user = DBUser(username=user.username, hashed_pw=hashed_pw, role=user.role)
-    db.add(new_user); db.commit(); db.refresh(new_user)
+    db.add(new_user); await db.commit(); await db.refresh(new_user)
+    user_cache.invalidate(new_user.username)
     return new_user
 
 @router.get("/", response_model=list[User], dependencies=[Depends(get_current_admin)])
 def list_users(db: Session = Depends(get_db)):
     return db.query(DBUser).all()
+
+@router.patch("/{user_id}", response_model=User, dependencies=[Depends(get_current_admin)])
+async def update_user(user_id: int, changes: UserUpdate, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(DBUser, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if changes.password is not None:
+        user.hashed_pw = await hash_password_async(changes.password)
+    if changes.role is not None:
+        user.role = changes.role
+    await db.commit(); await db.refresh(user)
+    # Drop the cached user so a role change applies on the next request
+    user_cache.invalidate(user.username)
+    return user
+
+@router.delete("/{user_id}", status_code=204, dependencies=[Depends(get_current_admin)])
+def delete_user(user_id: int, db: Session = Depends(get_db)):
+    user = db.get(DBUser, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db.delete(user); db.commit()
+    # Tokens stay verified, but the user lookup now fails with 401
+    user_cache.invalidate(user.username)
@@ -0,0 +1,357 @@
+"""
+Instrument-aware dispatch of wafer tests.
+
+Each wafer test is routed to the Celery queue of one instrument, picked
+among idle instruments of the requested type with the shortest queue.
+Workers hold a per-instrument lock while testing, so no two jobs ever drive
+the same prober even when several workers consume its queue. The lock
+expires after ``INSTRUMENT_LOCK_TTL`` so a dead worker cannot hold it
+forever; a running job keeps it with a ``LockHeartbeat``. Queue depth and
+queue wait time are tracked per instrument.
+
+A lot (every wafer of a ``batch_id``) is fanned out as a Celery chord
+over the instruments of the type: a group with one chain of wafer tests
+per instrument, so an instrument's next wafer is only queued once it is
+free, joined by ``summarize_lot``, which totals lot yield once the last
+wafer is done.
+Lots can be cancelled: queued wafers are skipped and running ones stop
+after their current batch. Priorities run from 0 to 9, higher first.
+
+Shared state lives in Redis when ``REDIS_URL`` is set, otherwise in
+process memory (single node, eager Celery, tests).
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from .instruments import InstrumentConfig, instruments_of_type, registry
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+INSTRUMENT_LOCK_TTL = int(os.getenv("INSTRUMENT_LOCK_TTL", "3600"))
+LOT_TTL = int(os.getenv("LOT_TTL", str(7 * 24 * 3600)))
+DEFAULT_PRIORITY = 5
+
+
+class NoInstrumentError(LookupError):
+    pass
+
+
+class MemorySchedulerState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._depth = defaultdict(int)
+        self._owners = {}
+        self._waits = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        self._lots = {}
+        self._cancelled = set()
+
+    def enqueued(self, name: str):
+        with self._lock:
+            self._depth[name] += 1
+
+    def started(self, name: str, wait: float):
+        with self._lock:
+            self._depth[name] = max(0, self._depth[name] - 1)
+            stats = self._waits[name]
+            stats["count"] += 1
+            stats["total"] += wait
+            stats["max"] = max(stats["max"], wait)
+            stats["last"] = wait
+
+    def try_lock(self, name: str, owner: str) -> bool:
+        with self._lock:
+            if self._owners.get(name) not in (None, owner):
+                return False
+            self._owners[name] = owner
+            return True
+
+    def extend_lock(self, name: str, owner: str) -> bool:
+        with self._lock:
+            return self._owners.get(name) == owner
+
+    def unlock(self, name: str, owner: str):
+        with self._lock:
+            if self._owners.get(name) == owner:
+                del self._owners[name]
+
+    def snapshot(self, name: str) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._depth[name],
+                "active_task": self._owners.get(name),
+                "wait": dict(self._waits[name]),
+            }
+
+    def save_lot(self, lot_id: str, lot: dict):
+        with self._lock:
+            self._lots[lot_id] = lot
+
+    def get_lot(self, lot_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._lots.get(lot_id)
+
+    def cancel_lot(self, lot_id: str):
+        with self._lock:
+            self._cancelled.add(lot_id)
+
+    def lot_cancelled(self, lot_id: str) -> bool:
+        with self._lock:
+            return lot_id in self._cancelled
+
+
+class RedisSchedulerState:
+    _UNLOCK = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    _EXTEND = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('expire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _key(name: str, field: str) -> str:
+        return f"rapidprobe:instrument:{name}:{field}"
+
+    @staticmethod
+    def _lot_key(lot_id: str, field: str) -> str:
+        return f"rapidprobe:lot:{lot_id}:{field}"
+
+    def enqueued(self, name: str):
+        self.redis.incr(self._key(name, "depth"))
+
+    def started(self, name: str, wait: float):
+        wait_key = self._key(name, "wait")
+        pipe = self.redis.pipeline()
+        pipe.decr(self._key(name, "depth"))
+        pipe.hincrby(wait_key, "count", 1)
+        pipe.hincrbyfloat(wait_key, "total", wait)
+        pipe.hset(wait_key, "last", wait)
+        pipe.execute()
+        # Not atomic with the above, but only ever raises the max
+        if wait > float(self.redis.hget(wait_key, "max") or 0):
+            self.redis.hset(wait_key, "max", wait)
+
+    def try_lock(self, name: str, owner: str) -> bool:
+        key = self._key(name, "lock")
+        if self.redis.set(key, owner, nx=True, ex=INSTRUMENT_LOCK_TTL):
+            return True
+        return self.redis.get(key) == owner
+
+    def extend_lock(self, name: str, owner: str) -> bool:
+        """Restart the lock's TTL if ``owner`` still holds it."""
+        return bool(self.redis.eval(self._EXTEND, 1, self._key(name, "lock"), owner, INSTRUMENT_LOCK_TTL))
+
+    def unlock(self, name: str, owner: str):
+        self.redis.eval(self._UNLOCK, 1, self._key(name, "lock"), owner)
+
+    def snapshot(self, name: str) -> dict:
+        pipe = self.redis.pipeline()
+        pipe.get(self._key(name, "depth"))
+        pipe.get(self._key(name, "lock"))
+        pipe.hgetall(self._key(name, "wait"))
+        depth, owner, wait = pipe.execute()
+        return {
+            "queue_depth": max(0, int(depth or 0)),
+            "active_task": owner,
+            "wait": {
+                "count": int(wait.get("count", 0)),
+                "total": float(wait.get("total", 0.0)),
+                "max": float(wait.get("max", 0.0)),
+                "last": float(wait.get("last", 0.0)),
+            },
+        }
+
+    def save_lot(self, lot_id: str, lot: dict):
+        self.redis.set(self._lot_key(lot_id, "info"), json.dumps(lot), ex=LOT_TTL)
+
+    def get_lot(self, lot_id: str) -> Optional[dict]:
+        raw = self.redis.get(self._lot_key(lot_id, "info"))
+        return json.loads(raw) if raw else None
+
+    def cancel_lot(self, lot_id: str):
+        self.redis.set(self._lot_key(lot_id, "cancelled"), 1, ex=LOT_TTL)
+
+    def lot_cancelled(self, lot_id: str) -> bool:
+        return bool(self.redis.exists(self._lot_key(lot_id, "cancelled")))
+
+
+state = RedisSchedulerState(REDIS_URL) if REDIS_URL else MemorySchedulerState()
+
+
+class LockHeartbeat:
+    """
+    Extends an instrument lock from a background thread while a job runs,
+    every third of its TTL. ``lost`` is set once the lock turns out to
+    belong to someone else (it expired while the worker stalled), and the
+    job must then stop driving the prober.
+    """
+
+    def __init__(self, name: str, owner: str, interval: float = INSTRUMENT_LOCK_TTL / 3):
+        self.name = name
+        self.owner = owner
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"lock-heartbeat-{name}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not state.extend_lock(self.name, self.owner):
+                    self.lost.set()
+                    return
+            except Exception:
+                # Redis hiccup: try again next beat, the TTL still has time
+                continue
+
+    def start(self) -> "LockHeartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def pick_instrument(instrument_type: str, name: Optional[str] = None) -> InstrumentConfig:
+    """
+    Choose the instrument for a new job: the named one if given, otherwise
+    an idle instrument of the type with the shortest queue, otherwise the
+    busy one with the shortest queue.
+    """
+    if name is not None:
+        config = registry.get(name)
+        if config is None or config.type != instrument_type:
+            raise NoInstrumentError(f"No {instrument_type} instrument named {name!r}")
+        return config
+
+    candidates = instruments_of_type(instrument_type)
+    if not candidates:
+        raise NoInstrumentError(f"No {instrument_type} instruments registered")
+
+    def load(config):
+        snap = state.snapshot(config.name)
+        return (snap["active_task"] is not None, snap["queue_depth"])
+
+    return min(candidates, key=load)
+
+
+def broker_priority(priority: int) -> int:
+    # The Redis transport serves priority 0 first
+    return 9 - priority
+
+
+def wafer_test_signature(
+    wafer_id: int,
+    instrument_type: str,
+    test_params: dict,
+    instrument: Optional[str] = None,
+    insertion: int = 1,
+    priority: int = DEFAULT_PRIORITY,
+    lot_id: Optional[str] = None,
+):
+    """Pick the instrument for a wafer test; returns it and the task signature for its queue."""
+    from .celery_app import run_wafer_test
+
+    config = pick_instrument(instrument_type, instrument)
+    state.enqueued(config.name)
+    signature = run_wafer_test.signature(
+        kwargs={
+            "wafer_id": wafer_id,
+            "instrument_type": config.type,
+            "test_params": test_params,
+            "instrument": config.name,
+            "enqueued_at": time.time(),
+            "insertion": insertion,
+            "lot_id": lot_id,
+        },
+        queue=config.queue,
+        priority=broker_priority(priority),
+        task_id=str(uuid.uuid4()),
+    )
+    return config, signature
+
+
+def schedule_wafer_test(
+    wafer_id: int,
+    instrument_type: str,
+    test_params: dict,
+    instrument: Optional[str] = None,
+    insertion: int = 1,
+    priority: int = DEFAULT_PRIORITY,
+):
+    """Route a wafer test to an instrument queue; returns the instrument and AsyncResult."""
+    config, signature = wafer_test_signature(wafer_id, instrument_type, test_params, instrument, insertion, priority)
+    return config, signature.apply_async()
+
+
+def schedule_lot(
+    batch_id: str,
+    wafer_ids: List[int],
+    instrument_type: str,
+    test_params: dict,
+    insertion: int = 1,
+    priority: int = DEFAULT_PRIORITY,
+) -> dict:
+    """
+    Fan a lot's wafers out over the instruments of ``instrument_type``.
+
+    Returns:
+        The lot: its ID (the ``summarize_lot`` task's) and each wafer's
+        task and instrument
+
+    Raises:
+        NoInstrumentError: If no instrument of the type is registered
+    """
+    from celery import chain, chord
+
+    from .celery_app import summarize_lot
+
+    lot_id = str(uuid.uuid4())
+    wafers, chains = {}, defaultdict(list)
+    for wafer_id in wafer_ids:
+        config, signature = wafer_test_signature(
+            wafer_id, instrument_type, test_params, insertion=insertion, priority=priority, lot_id=lot_id
+        )
+        wafers[str(wafer_id)] = {"task_id": signature.id, "instrument": config.name}
+        chains[config.name].append(signature.set(immutable=True))
+    lot = {
+        "lot_id": lot_id,
+        "batch_id": batch_id,
+        "insertion": insertion,
+        "priority": priority,
+        "created_at": time.time(),
+        "wafers": wafers,
+    }
+    # Saved first: the first wafers may start before apply_async returns
+    state.save_lot(lot_id, lot)
+    callback = summarize_lot.signature(
+        kwargs={"lot_id": lot_id, "batch_id": batch_id, "insertion": insertion, "created_at": lot["created_at"]},
+        task_id=lot_id,
+    )
+    chord([chain(signatures) for signatures in chains.values()], callback).apply_async()
+    return lot
+
+
+def instrument_status() -> List[dict]:
+    return [
+        {"name": c.name, "type": c.type, "queue": c.queue, **state.snapshot(c.name)}
+        for c in registry.values()
+    ]
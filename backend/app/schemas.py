@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import datetime
 
 class WaferBase(BaseModel):
@@ -38,6 +39,10 @@ class UserCreate(UserBase):
     password: str
     role: str
 
+class UserUpdate(BaseModel):
+    password: Optional[str] = None
+    role: Optional[str] = None
+
 class User(UserBase):
     id: int
     role: str
@@ -45,7 +50,46 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class TestLimitBase(BaseModel):
+    test_name: str  # or "*" for every test without its own limit
+    lsl: Optional[float] = None
+    usl: Optional[float] = None
+    fail_bin: int = Field(2, ge=2)  # bin 1 is pass
+
+class TestLimit(TestLimitBase):
+    class Config:
+        from_attributes = True
+
+class TestProgramCreate(BaseModel):
+    name: str
+    limits: List[TestLimitBase]
+
+class TestProgram(BaseModel):
+    id: int
+    name: str
+    version: int
+    created_at: datetime.datetime
+    limits: List[TestLimit]
+
+    class Config:
+        from_attributes = True
+
 class WaferTestConfig(BaseModel):
     wafer_id: int
-    instrument_type: str  # "SCPI" or "REST"
+    instrument_type: str  # "SCPI", "REST", "REST_ASYNC" or "FAKE"
     test_params: dict
+    instrument: Optional[str] = None  # registry name; picked by the scheduler if omitted
+    program: Optional[str] = None  # test program whose limits bin the results
+    insertion: int = Field(1, ge=1)  # test insertion; re-running one replaces its results
+    priority: int = Field(5, ge=0, le=9)  # higher runs first
+
+class LotTestConfig(BaseModel):
+    batch_id: str
+    instrument_type: str
+    test_params: dict
+    program: Optional[str] = None
+    insertion: int = Field(1, ge=1)
+    priority: int = Field(5, ge=0, le=9)
+
+class TaskStatusQuery(BaseModel):
+    task_ids: List[str] = Field(min_length=1, max_length=1000)
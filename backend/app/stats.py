@@ -0,0 +1,287 @@
+"""
+Vectorized per-test statistics and spatial outlier detection.
+
+A wafer's or lot's results are loaded once into flat NumPy arrays
+(``ResultArrays``); everything else is array arithmetic with no per-row
+Python:
+
+- ``test_statistics``: count, mean, sigma, min/max, percentiles, yield and
+  Cpk per test, grouped with one sort and ``bincount``
+- ``spatial_outliers``: on the die_x/die_y grid of one wafer,
+  good-die-in-bad-neighborhood (GDBN, a passing die with at least
+  ``min_bad_neighbors`` failing neighbours) and nearest-neighbour residual
+  (NNR, a value more than ``k`` robust sigmas from its neighbourhood
+  median) outliers
+
+Pass/fail is the bin stored at ingest (``app.binning``). Cpk is computed
+against the test program's limits, or ``TEST_LIMITS`` for wafers tested
+without one. Callers may pass override limits in the same shape, in which
+case pass/fail is re-evaluated against them as well.
+"""
+import os
+import warnings
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from .archive import read_archived
+from .binning import PASS_BIN, TEST_LIMITS
+from .models import TestResult, Wafer
+
+load_dotenv()
+STATS_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+NNR_SIGMA = float(os.getenv("NNR_SIGMA", "3"))
+GDBN_MIN_BAD_NEIGHBORS = int(os.getenv("GDBN_MIN_BAD_NEIGHBORS", "5"))
+
+# 8-connected neighbourhood on the die grid
+NEIGHBOR_OFFSETS = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)]
+
+
+@dataclass
+class ResultArrays:
+    tests: List[str]
+    wafer_id: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    test: np.ndarray
+    value: np.ndarray
+    bin: np.ndarray
+    insertion: np.ndarray
+
+    def __len__(self) -> int:
+        return self.value.size
+
+    def select(self, mask: np.ndarray) -> "ResultArrays":
+        return ResultArrays(
+            self.tests,
+            self.wafer_id[mask],
+            self.x[mask],
+            self.y[mask],
+            self.test[mask],
+            self.value[mask],
+            self.bin[mask],
+            self.insertion[mask],
+        )
+
+
+def load_results(
+    db: Session, wafers: List[Wafer], test_name: Optional[str] = None, insertion: Optional[int] = None
+) -> ResultArrays:
+    """
+    Load the wafers' results, from the database or the archive, into
+    arrays; only ``test_name`` and ``insertion`` when given.
+    """
+    columns = {"wafer_id": [], "x": [], "y": [], "test": [], "value": [], "bin": [], "insertion": []}
+    codes: Dict[str, int] = {}
+
+    def add(wafer_ids, xs, ys, names, values, bins, insertions):
+        xs = np.asarray(xs, dtype=np.int64)
+        columns["wafer_id"].append(np.asarray(wafer_ids, dtype=np.int64))
+        columns["x"].append(xs)
+        columns["y"].append(np.asarray(ys, dtype=np.int64))
+        columns["test"].append(np.fromiter((codes.setdefault(n, len(codes)) for n in names), np.int64, xs.size))
+        columns["value"].append(np.asarray(values, dtype=np.float64))
+        columns["bin"].append(np.asarray(bins, dtype=np.int16))
+        columns["insertion"].append(np.asarray(insertions, dtype=np.int16))
+
+    live = [w.id for w in wafers if w.archived_at is None]
+    for wafer in wafers:
+        if wafer.archived_at is not None:
+            table = read_archived(wafer, columns=["die_x", "die_y", "test_name", "result_value", "bin", "insertion"])
+            if test_name is not None:
+                table = table.filter(table.column("test_name").to_numpy(zero_copy_only=False) == test_name)
+            if insertion is not None:
+                table = table.filter(table.column("insertion").to_numpy() == insertion)
+            add(np.full(table.num_rows, wafer.id), *(c.to_numpy(zero_copy_only=False) for c in table.columns))
+    if live:
+        query = db.query(
+            TestResult.wafer_id,
+            TestResult.die_x,
+            TestResult.die_y,
+            TestResult.test_name,
+            TestResult.result_value,
+            TestResult.bin,
+            TestResult.insertion,
+        ).filter(TestResult.wafer_id.in_(live))
+        if test_name is not None:
+            query = query.filter(TestResult.test_name == test_name)
+        if insertion is not None:
+            query = query.filter(TestResult.insertion == insertion)
+        rows = query.all()
+        if rows:
+            add(*zip(*rows))
+
+    tests = sorted(codes, key=codes.get)
+    if not columns["x"]:
+        empty = np.zeros(0, dtype=np.int64)
+        no_codes = np.zeros(0, dtype=np.int16)
+        return ResultArrays(tests, empty, empty, empty, empty, np.zeros(0), no_codes, no_codes)
+    return ResultArrays(tests, *(np.concatenate(columns[k]) for k in columns))
+
+
+def limits_for(tests: List[str], overrides: Optional[dict] = None, defaults: Optional[dict] = None):
+    """
+    Per-test LSL and USL arrays (NaN where a test has no such limit).
+    ``overrides`` wins over ``defaults``, which fall back to ``TEST_LIMITS``.
+    """
+    lsl = np.full(len(tests), np.nan)
+    usl = np.full(len(tests), np.nan)
+    for i, name in enumerate(tests):
+        for source in (overrides or {}, defaults or TEST_LIMITS):
+            spec = source.get(name, source.get("*"))
+            if spec is not None:
+                break
+        else:
+            continue
+        if spec.get("lsl") is not None:
+            lsl[i] = spec["lsl"]
+        if spec.get("usl") is not None:
+            usl[i] = spec["usl"]
+    return lsl, usl
+
+
+def fails(arrays: ResultArrays, lsl: np.ndarray, usl: np.ndarray, rebin: bool = False) -> np.ndarray:
+    """
+    Per-result failure mask: the stored bins, or with ``rebin`` the limits
+    (comparisons against NaN limits are False).
+    """
+    if not rebin:
+        return arrays.bin != PASS_BIN
+    low, high = lsl[arrays.test], usl[arrays.test]
+    return (arrays.value < low) | (arrays.value > high)
+
+
+def _optional(value) -> Optional[float]:
+    # NaN for a missing limit, inf for the Cpk of a test with no spread
+    return float(value) if np.isfinite(value) else None
+
+
+def test_statistics(
+    arrays: ResultArrays, overrides: Optional[dict] = None, defaults: Optional[dict] = None
+) -> List[dict]:
+    """Distribution summary, yield and Cpk for every test in ``arrays``."""
+    n_tests = len(arrays.tests)
+    if not len(arrays):
+        return []
+    counts = np.bincount(arrays.test, minlength=n_tests)
+    present = counts > 0
+    safe = np.maximum(counts, 1)
+    mean = np.bincount(arrays.test, arrays.value, n_tests) / safe
+    squares = np.bincount(arrays.test, (arrays.value - mean[arrays.test]) ** 2, n_tests)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(squares / (counts - 1))
+
+    # One sort groups every test's values in ascending order; each group's
+    # min, max and percentiles are then plain index arithmetic
+    order = np.lexsort((arrays.value, arrays.test))
+    ordered = arrays.value[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = (np.asarray(STATS_PERCENTILES) / 100)[None, :] * (safe - 1)[:, None]
+    lo = np.floor(ranks).astype(np.int64)
+    hi = np.minimum(lo + 1, safe[:, None] - 1)
+    frac = ranks - lo
+    first = starts[:, None]
+    percentiles = ordered[first + lo] * (1 - frac) + ordered[first + hi] * frac
+
+    lsl, usl = limits_for(arrays.tests, overrides, defaults)
+    failed = np.bincount(arrays.test, fails(arrays, lsl, usl, rebin=overrides is not None), n_tests)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cpu = (usl - mean) / (3 * sigma)
+        cpl = (mean - lsl) / (3 * sigma)
+    cpk = np.fmin(cpu, cpl)
+
+    return [
+        {
+            "test_name": arrays.tests[i],
+            "count": int(counts[i]),
+            "mean": float(mean[i]),
+            "sigma": _optional(sigma[i]),
+            "min": float(ordered[starts[i]]),
+            "max": float(ordered[starts[i] + counts[i] - 1]),
+            "percentiles": {f"p{p}": float(v) for p, v in zip(STATS_PERCENTILES, percentiles[i])},
+            "lsl": _optional(lsl[i]),
+            "usl": _optional(usl[i]),
+            "yield": float(1 - failed[i] / counts[i]) * 100,
+            "cpk": _optional(cpk[i]),
+        }
+        for i in np.flatnonzero(present)
+    ]
+
+
+def _neighbors(grid: np.ndarray, fill) -> np.ndarray:
+    """Stack of the 8 neighbour values of every cell, shape (8, h, w)."""
+    h, w = grid.shape
+    padded = np.pad(grid, 1, constant_values=fill)
+    return np.stack([padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w] for dy, dx in NEIGHBOR_OFFSETS])
+
+
+def spatial_outliers(
+    arrays: ResultArrays,
+    overrides: Optional[dict] = None,
+    k: float = NNR_SIGMA,
+    min_bad_neighbors: int = GDBN_MIN_BAD_NEIGHBORS,
+) -> dict:
+    """
+    GDBN and NNR outliers on one wafer's die grid.
+
+    A die fails if any of its results is binned as a fail (or, with
+    ``overrides``, is outside those limits). NNR is computed per test on
+    the die's mean value for that test.
+    """
+    if not len(arrays):
+        return {"gdbn": [], "nnr": []}
+    x0, y0 = int(arrays.x.min()), int(arrays.y.min())
+    shape = (int(arrays.y.max()) - y0 + 1, int(arrays.x.max()) - x0 + 1)
+    xs, ys = arrays.x - x0, arrays.y - y0
+
+    lsl, usl = limits_for(arrays.tests, overrides)
+    failed = fails(arrays, lsl, usl, rebin=overrides is not None)
+    tested = np.zeros(shape, dtype=bool)
+    tested[ys, xs] = True
+    bad = np.zeros(shape, dtype=bool)
+    bad[ys[failed], xs[failed]] = True
+    bad_neighbors = _neighbors(bad, False).sum(axis=0)
+    gy, gx = np.nonzero(tested & ~bad & (bad_neighbors >= min_bad_neighbors))
+    gdbn = [
+        {"x": int(x) + x0, "y": int(y) + y0, "bad_neighbors": int(bad_neighbors[y, x])}
+        for y, x in zip(gy, gx)
+    ]
+
+    nnr = []
+    flat = ys * shape[1] + xs
+    for code, name in enumerate(arrays.tests):
+        mask = arrays.test == code
+        if not mask.any():
+            continue
+        sums = np.bincount(flat[mask], arrays.value[mask], shape[0] * shape[1])
+        counts = np.bincount(flat[mask], minlength=shape[0] * shape[1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grid = (sums / counts).reshape(shape)
+        with warnings.catch_warnings():
+            # Dies with no tested neighbours have an all-NaN neighbourhood
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(_neighbors(grid, np.nan), axis=0)
+        residual = grid - median
+        valid = ~np.isnan(residual)
+        if not valid.any():
+            continue
+        r = residual[valid]
+        robust_sigma = 1.4826 * np.median(np.abs(r - np.median(r)))
+        if robust_sigma == 0:
+            continue
+        oy, ox = np.nonzero(valid & (np.abs(np.nan_to_num(residual)) > k * robust_sigma))
+        nnr.extend(
+            {
+                "x": int(x) + x0,
+                "y": int(y) + y0,
+                "test_name": name,
+                "value": float(grid[y, x]),
+                "neighborhood_median": float(median[y, x]),
+                "residual_sigma": float(residual[y, x] / robust_sigma),
+            }
+            for y, x in zip(oy, ox)
+        )
+    return {"gdbn": gdbn, "nnr": nnr}
@@ -0,0 +1,116 @@
+"""
+Progress reporting and batched status lookups for wafer test tasks.
+
+While ``run_wafer_test`` runs it stores a custom ``PROGRESS`` state whose
+meta holds dies done and total, the die being tested, the stepping rate
+and an ETA. ``ProgressReporter`` writes it at most every
+``PROGRESS_INTERVAL`` seconds so the result backend sees a handful of
+writes per wafer, not one per batch.
+
+``task_statuses`` resolves many task IDs at once. With a key-value result
+backend (Redis) that is a single ``MGET``; other backends fall back to one
+lookup per task.
+"""
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from celery import states
+from celery.backends.base import KeyValueStoreBackend
+from dotenv import load_dotenv
+
+load_dotenv()
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "1.0"))
+
+PROGRESS = "PROGRESS"
+
+
+class ProgressReporter:
+    """
+    Tracks dies done across result batches and publishes ``PROGRESS``.
+
+    Args:
+        task: The bound Celery task
+        total: Dies the run will step, if known
+        resumed: Dies already tested by an earlier attempt, counted as done
+        interval: Minimum seconds between state updates
+    """
+
+    def __init__(self, task, total: Optional[int], resumed: int = 0, interval: float = PROGRESS_INTERVAL):
+        self.task = task
+        self.total = total
+        self.interval = interval
+        self.resumed = resumed
+        self.done = resumed
+        self.current = None
+        self.started = time.monotonic()
+        self._last_update = None
+
+    def meta(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        rate = (self.done - self.resumed) / elapsed if elapsed > 0 else 0.0
+        remaining = None
+        if self.total is not None and rate:
+            remaining = max(self.total - self.done, 0) / rate
+        return {
+            "dies_done": self.done,
+            "dies_total": self.total,
+            "dies_resumed": self.resumed,
+            "current_die": list(self.current) if self.current else None,
+            "rate": round(rate, 2),
+            "eta_seconds": round(remaining, 1) if remaining is not None else None,
+        }
+
+    def update(self, batch: List[dict], force: bool = False):
+        # Results of a die arrive together, one per test, so a die is
+        # counted when the coordinates change
+        for row in batch:
+            die = (row["x"], row["y"])
+            if die != self.current:
+                self.current = die
+                self.done += 1
+        now = time.monotonic()
+        if force or self._last_update is None or now - self._last_update >= self.interval:
+            self._last_update = now
+            self.task.update_state(state=PROGRESS, meta=self.meta())
+
+
+def _status(task_id: str, meta: Optional[dict]) -> dict:
+    if meta is None:
+        return {"task_id": task_id, "status": states.PENDING, "progress": None, "result": None}
+    status, result = meta["status"], meta.get("result")
+    if status == PROGRESS:
+        return {"task_id": task_id, "status": status, "progress": result, "result": None}
+    if status in states.EXCEPTION_STATES:
+        result = str(result)
+    elif status not in states.READY_STATES:
+        result = None
+    return {"task_id": task_id, "status": status, "progress": None, "result": result}
+
+
+def task_statuses(app, task_ids: Iterable[str]) -> Dict[str, dict]:
+    """
+    Current status of each task: ``status``, ``progress`` (the ``PROGRESS``
+    meta, while running) and ``result`` (once ready; the error message for
+    failures). Unknown IDs read as ``PENDING``, as with ``AsyncResult``.
+    """
+    task_ids = list(dict.fromkeys(task_ids))
+    backend = app.backend
+    if isinstance(backend, KeyValueStoreBackend):
+        keys = [backend.get_key_for_task(t) for t in task_ids]
+        values = backend.mget(keys) if keys else []
+        # Redis returns a list in key order, memcached-style caches a dict
+        if hasattr(values, "items"):
+            values = [values.get(k) for k in keys]
+        return {
+            t: _status(t, backend.decode_result(v) if v is not None else None)
+            for t, v in zip(task_ids, values)
+        }
+
+    statuses = {}
+    for t in task_ids:
+        result = app.AsyncResult(t)
+        status = result.state
+        meta = None if status == states.PENDING else {"status": status, "result": result.info}
+        statuses[t] = _status(t, meta)
+    return statuses
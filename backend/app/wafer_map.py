@@ -0,0 +1,178 @@
+"""
+Dense wafer maps and their compact binary encoding.
+
+A wafer map is a ``uint8`` grid indexed ``[die_y - y0, die_x - x0]`` holding
+``UNTESTED``, ``PASS`` or ``FAIL`` per die (a die fails if any of its tests
+fail). The binary form is a little-endian header followed by either the raw
+grid or its run-length encoding, whichever is smaller:
+
+    magic "RPWM" | version u8 | encoding u8 | x0 i32 | y0 i32 | width u32 | height u32
+    raw: width * height u8 cells, row-major
+    rle: runs u32 | runs x value u8 | runs x length u32
+"""
+import os
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from .binning import PASS_BIN
+from .archive import read_archived
+from .models import TestResult, Wafer
+
+load_dotenv()
+WAFER_MAP_CACHE_SIZE = int(os.getenv("WAFER_MAP_CACHE_SIZE", "256"))
+WAFER_MAP_CHUNK_SIZE = int(os.getenv("WAFER_MAP_CHUNK_SIZE", "50000"))
+
+UNTESTED, PASS, FAIL = 0, 1, 2
+STATUS_NAMES = {PASS: "pass", FAIL: "fail"}
+
+MAGIC = b"RPWM"
+FORMAT_VERSION = 1
+ENCODING_RAW, ENCODING_RLE = 0, 1
+HEADER = struct.Struct("<4sBBiiII")
+
+
+@dataclass
+class WaferMap:
+    wafer_id: int
+    version: int
+    x0: int
+    y0: int
+    grid: np.ndarray
+
+    def to_json(self) -> dict:
+        ys, xs = np.nonzero(self.grid)
+        codes = self.grid[ys, xs]
+        data = [
+            {"x": int(x) + self.x0, "y": int(y) + self.y0, "status": STATUS_NAMES[int(c)]}
+            for x, y, c in zip(xs, ys, codes)
+        ]
+        return {"wafer_id": self.wafer_id, "die_data": data}
+
+    def to_bytes(self) -> bytes:
+        height, width = self.grid.shape
+        flat = self.grid.ravel()
+        values, lengths = run_length_encode(flat)
+        rle_size = 4 + values.size * 5
+        if rle_size < flat.size:
+            encoding = ENCODING_RLE
+            body = struct.pack("<I", values.size) + values.tobytes() + lengths.astype("<u4").tobytes()
+        else:
+            encoding = ENCODING_RAW
+            body = flat.tobytes()
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, encoding, self.x0, self.y0, width, height)
+        return header + body
+
+
+def run_length_encode(flat: np.ndarray):
+    if flat.size == 0:
+        return flat[:0], np.zeros(0, dtype=np.uint32)
+    starts = np.flatnonzero(np.concatenate(([True], flat[1:] != flat[:-1])))
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    return flat[starts], lengths
+
+
+def wafer_version(db: Session, wafer_id: int) -> int:
+    """
+    The wafer's ``results_version``, bumped by every ingested chunk.
+
+    A result count would not do: re-testing dies replaces their results
+    and leaves the count as it was.
+    """
+    version = db.query(Wafer.results_version).filter(Wafer.id == wafer_id).scalar()
+    return version or 0
+
+
+def _mark(grid: np.ndarray, x0: int, y0: int, xs, ys, bins):
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    codes = np.where(np.asarray(bins) == PASS_BIN, PASS, FAIL).astype(np.uint8)
+    np.maximum.at(grid, (ys - y0, xs - x0), codes)
+
+
+def build_wafer_map(db: Session, wafer_id: int, version: int, insertion: Optional[int] = None) -> WaferMap:
+    """The map of one ``insertion``, or of every insertion when None."""
+    wafer = db.get(Wafer, wafer_id)
+    if wafer is not None and wafer.archived_at is not None:
+        table = read_archived(wafer, columns=["die_x", "die_y", "bin", "insertion"])
+        if insertion is not None:
+            table = table.filter(table.column("insertion").to_numpy() == insertion)
+        table = table.select(["die_x", "die_y", "bin"])
+        if table.num_rows == 0:
+            return WaferMap(wafer_id, version, 0, 0, np.zeros((0, 0), dtype=np.uint8))
+        xs, ys, bins = (column.to_numpy() for column in table.columns)
+        x0, y0 = int(xs.min()), int(ys.min())
+        grid = np.zeros((int(ys.max()) - y0 + 1, int(xs.max()) - x0 + 1), dtype=np.uint8)
+        _mark(grid, x0, y0, xs, ys, bins)
+        return WaferMap(wafer_id, version, x0, y0, grid)
+
+    where = [TestResult.wafer_id == wafer_id]
+    if insertion is not None:
+        where.append(TestResult.insertion == insertion)
+    x0, x1, y0, y1 = (
+        db.query(func.min(TestResult.die_x), func.max(TestResult.die_x),
+                 func.min(TestResult.die_y), func.max(TestResult.die_y))
+        .filter(*where)
+        .one()
+    )
+    if x0 is None:
+        return WaferMap(wafer_id, version, 0, 0, np.zeros((0, 0), dtype=np.uint8))
+
+    # Fill the grid chunk by chunk from a server-side cursor rather than
+    # materializing every result of the wafer
+    grid = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+    result = db.execute(
+        select(TestResult.die_x, TestResult.die_y, TestResult.bin)
+        .where(*where)
+        .execution_options(yield_per=WAFER_MAP_CHUNK_SIZE)
+    )
+    for rows in result.partitions():
+        _mark(grid, x0, y0, *zip(*rows))
+    return WaferMap(wafer_id, version, x0, y0, grid)
+
+
+class WaferMapCache:
+    """
+    LRU cache of built wafer maps.
+
+    Entries carry the wafer's ``results_version`` at build time; a lookup
+    with a different version (results were written since) rebuilds the map.
+    """
+
+    def __init__(self, maxsize: int = WAFER_MAP_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, wafer_id: int, version: int = None, insertion: Optional[int] = None) -> WaferMap:
+        if version is None:
+            version = wafer_version(db, wafer_id)
+        key = (wafer_id, insertion)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = build_wafer_map(db, wafer_id, version, insertion)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, wafer_id: int):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == wafer_id]:
+                del self._entries[key]
+
+
+wafer_map_cache = WaferMapCache()
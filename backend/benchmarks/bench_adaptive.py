@@ -0,0 +1,86 @@
+"""
+Simulate adaptive test policies on synthetic wafer history.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_adaptive --wafers 5 --diameter 60
+
+Stores wafers whose tests behave differently: CONT is always far inside
+its limit, IV is tight with rare random fails, LEAK fails in clustered
+defects and VTH drifts towards its limit across the wafer. Every policy is
+then replayed with app.adaptive.simulate, which prints test time saved
+against escapes (failing dies whose failing tests were all skipped) in
+total and per test. Uses
+DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.adaptive import AdaptivePolicy, simulate
+from app.database import Base, SessionLocal, engine
+from app.hardware.base import round_wafer
+from app.ingest import bulk_insert_results
+from app.models import Wafer
+
+POLICIES = {
+    "default": {},
+    "aggressive": {"min_cpk": 1.33, "warmup_dies": 30, "sample_every": 25},
+    "no neighborhood": {"neighborhood": False},
+    "conservative": {"min_cpk": 3.0, "warmup_dies": 200, "sample_every": 5},
+}
+
+
+def synthetic_wafer(diameter: int, rng: random.Random):
+    dies = round_wafer(diameter)
+    defects = [rng.choice(dies) for _ in range(3)]
+    for x, y in dies:
+        drift = max(0.0, y / diameter - 0.6) * 0.002
+        clustered = any((x - dx) ** 2 + (y - dy) ** 2 <= 4 for dx, dy in defects)
+        yield {"x": x, "y": y, "test": "CONT", "value": rng.gauss(0.0002, 0.00002)}
+        iv = rng.uniform(0.0015, 0.003) if rng.random() < 0.001 else rng.gauss(0.0004, 0.00005)
+        yield {"x": x, "y": y, "test": "IV", "value": iv}
+        leak = rng.uniform(0.002, 0.004) if clustered else rng.gauss(0.0004, 0.00005)
+        yield {"x": x, "y": y, "test": "LEAK", "value": leak}
+        yield {"x": x, "y": y, "test": "VTH", "value": rng.gauss(0.0003 + drift, 0.00004)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wafers", type=int, default=5)
+    parser.add_argument("--diameter", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    rng = random.Random(args.seed)
+    try:
+        wafers = []
+        for _ in range(args.wafers):
+            wafer = Wafer(batch_id="ADAPTIVE")
+            db.add(wafer)
+            db.commit()
+            bulk_insert_results(db, wafer.id, synthetic_wafer(args.diameter, rng))
+            wafers.append(wafer)
+
+        tests = ("CONT", "IV", "LEAK", "VTH")
+        print(f"{'policy':>16} {'time saved':>11} {'failing':>8} {'escapes':>8} {'escape ppm':>11} "
+              f"{'re-enables':>11} " + " ".join(f"{t + ' esc':>9}" for t in tests))
+        for name, overrides in POLICIES.items():
+            report = simulate(db, wafers, AdaptivePolicy.from_params(overrides or True))
+            per_test = [w["tests"] for w in report["wafers"].values()]
+            reenables = sum(t["reenables"] for w in per_test for t in w.values())
+            escapes = " ".join(f"{sum(w[t]['escapes'] for w in per_test):9}" for t in tests)
+            print(f"{name:>16} {report['time_saved_pct']:10.1f}% {report['failing_dies']:8} "
+                  f"{report['escapes']:8} {report['escape_ppm']:11.0f} {reenables:11} {escapes}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
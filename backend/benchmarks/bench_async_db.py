@@ -0,0 +1,87 @@
+"""
+Load test: sync sessions inside async handlers vs. the async session path.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_async_db --requests 50 --query-ms 100
+
+Mounts two endpoints issuing the same slow query (a SQLite function that
+sleeps ``--query-ms``): one using the old blocking ``SessionLocal`` inside
+an ``async def``, one using ``get_async_db``. Each is hit with the same
+number of concurrent requests and the wall time is reported.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal, async_engine, engine, get_async_db
+
+SLOW_QUERY = text("SELECT slow_query(:ms)")
+
+
+def _sleep(ms):
+    time.sleep(ms / 1000)
+    return 1
+
+
+def install_slow_function():
+    def on_connect(dbapi_connection, _):
+        dbapi_connection.create_function("slow_query", 1, _sleep)
+
+    event.listen(engine, "connect", on_connect)
+    event.listen(async_engine.sync_engine, "connect", on_connect)
+
+
+def build_app(query_ms):
+    app = FastAPI()
+
+    @app.get("/blocking")
+    async def blocking():
+        db = SessionLocal()
+        try:
+            return {"value": db.execute(SLOW_QUERY, {"ms": query_ms}).scalar()}
+        finally:
+            db.close()
+
+    @app.get("/async")
+    async def non_blocking(db: AsyncSession = Depends(get_async_db)):
+        return {"value": (await db.execute(SLOW_QUERY, {"ms": query_ms})).scalar()}
+
+    return app
+
+
+async def load(client, path, n):
+    start = time.perf_counter()
+    await asyncio.gather(*(client.get(path) for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--query-ms", type=int, default=100)
+    args = parser.parse_args()
+
+    install_slow_function()
+    app = build_app(args.query_ms)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'handler':>10} {'wall s':>8} {'req/s':>8}")
+        for path in ("/blocking", "/async"):
+            elapsed = await load(client, path, args.requests)
+            print(f"{path[1:]:>10} {elapsed:8.2f} {args.requests / elapsed:8.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of per-request authentication overhead.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_auth --requests 2000
+
+Times get_current_user with cold caches (JWT verification and a users
+SELECT on every call, as before the caches existed) and warm caches, both
+as a bare dependency call and through an authenticated endpoint, and
+counts the SQL statements issued per request. Uses DATABASE_URL when set,
+otherwise a throwaway SQLite file.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.auth_cache import token_cache, user_cache
+from app.database import Base, SessionLocal, engine
+from app.main import app
+from app.models import User
+from app.routers.auth import get_current_user
+from app.utils import create_access_token, hash_password
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(*args):
+    global statements
+    statements += 1
+
+
+def clear_caches():
+    token_cache.clear()
+    user_cache.clear()
+
+
+def run(label, n, call, cold):
+    global statements
+    clear_caches()
+    call()
+    statements = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        if cold:
+            clear_caches()
+        call()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28} {elapsed / n * 1e6:10.1f} {statements / n:10.2f}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if not db.query(User).filter(User.username == "bench").first():
+        db.add(User(username="bench", hashed_pw=hash_password("bench"), role="user"))
+        db.commit()
+    db.close()
+
+    token = create_access_token({"sub": "bench", "role": "user"})
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(app)
+    loop = asyncio.new_event_loop()
+
+    def dependency():
+        loop.run_until_complete(get_current_user(token))
+
+    def endpoint():
+        client.get("/tests/instruments", headers=headers).raise_for_status()
+
+    print(f"{'':>28} {'us/request':>10} {'SQL/req':>10}")
+    for label, call in (("get_current_user", dependency), ("GET /tests/instruments", endpoint)):
+        cold = run(f"{label} (cold)", args.requests, call, cold=True)
+        warm = run(f"{label} (warm)", args.requests, call, cold=False)
+        print(f"{'speedup':>28} {cold / warm:9.1f}x")
+    print(f"token cache {token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
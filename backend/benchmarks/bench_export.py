@@ -0,0 +1,115 @@
+"""
+Benchmark result export and analytics over the Parquet archive.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_export --rows 1000000 --wafers 20
+
+Compares pulling a lot as JSON rows against the streamed Parquet and Arrow
+exports (time and bytes), then archives every wafer and times a per-test
+mean over the archive dataset against the same GROUP BY in the database.
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("ARCHIVE_DIR", tempfile.mkdtemp())
+
+from sqlalchemy import func
+
+from app.archive import ARCHIVE_DIR, archive_wafer, results_dataset, stream_export
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+
+TESTS = ("IV", "LEAK", "VTH", "IDSAT")
+
+
+def populate(db, rows, wafers):
+    per_wafer = rows // wafers
+    for _ in range(wafers):
+        wafer = Wafer(batch_id="LOT000")
+        db.add(wafer)
+        db.commit()
+        die_data = (
+            {"x": n % 200, "y": n // 200, "test": TESTS[n % len(TESTS)],
+             "value": random.gauss(0.0008, 0.0003)}
+            for n in range(per_wafer)
+        )
+        bulk_insert_results(db, wafer.id, die_data)
+
+
+def json_export(db, wafers):
+    size = 0
+    for wafer in wafers:
+        rows = db.query(TestResult).filter(TestResult.wafer_id == wafer.id).all()
+        body = json.dumps([
+            {"wafer_id": r.wafer_id, "die_x": r.die_x, "die_y": r.die_y, "test_name": r.test_name,
+             "result_value": r.result_value, "timestamp": r.timestamp.isoformat()}
+            for r in rows
+        ])
+        size += len(body)
+    return size
+
+
+def columnar_export(db, wafers, format):
+    return sum(len(chunk) for chunk in stream_export(db, wafers, format))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return time.perf_counter() - start, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--wafers", type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(TestResult).count() < args.rows:
+            start = time.perf_counter()
+            populate(db, args.rows, args.wafers)
+            print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+        wafers = db.query(Wafer).order_by(Wafer.id).all()
+
+        print(f"{'export':>10} {'seconds':>8} {'MB':>8}")
+        for label, fn, extra in (
+            ("json", json_export, ()),
+            ("parquet", columnar_export, ("parquet",)),
+            ("arrow", columnar_export, ("arrow",)),
+        ):
+            seconds, size = timed(fn, db, wafers, *extra)
+            print(f"{label:>10} {seconds:8.2f} {size / 1e6:8.1f}")
+
+        db_t, db_means = timed(lambda: dict(
+            db.query(TestResult.test_name, func.avg(TestResult.result_value))
+            .group_by(TestResult.test_name).all()
+        ))
+        seconds, rows = timed(lambda: sum(archive_wafer(db, w) for w in wafers))
+        print(f"Archived {rows:,} rows to {ARCHIVE_DIR} in {seconds:.1f}s")
+
+        def archive_means():
+            table = results_dataset().to_table(columns=["test_name", "result_value"])
+            grouped = table.group_by("test_name").aggregate([("result_value", "mean")])
+            return dict(zip(grouped["test_name"].to_pylist(), grouped["result_value_mean"].to_pylist()))
+
+        archive_t, archive_means = timed(archive_means)
+        match = all(abs(db_means[k] - archive_means[k]) < 1e-12 for k in db_means)
+        print(f"per-test mean: database {db_t * 1000:.0f} ms, archive {archive_t * 1000:.0f} ms, match {match}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark die-result ingestion: per-row ORM adds vs. bulk_insert_results.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ingest --sizes 10000 100000 1000000
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+
+
+def make_die_data(n_rows, tests=("IV", "LEAK", "VTH", "IDSAT")):
+    side = max(1, int((n_rows / len(tests)) ** 0.5) + 1)
+    rows = []
+    for i in range(n_rows):
+        die, t = divmod(i, len(tests))
+        rows.append({
+            "x": die % side,
+            "y": die // side,
+            "test": tests[t],
+            "value": random.gauss(0.001, 0.0002),
+        })
+    return rows
+
+
+def legacy_loop(db, wafer_id, die_data):
+    for die in die_data:
+        db.add(TestResult(
+            wafer_id=wafer_id,
+            die_x=die["x"],
+            die_y=die["y"],
+            test_name=die["test"],
+            result_value=die["value"],
+        ))
+    db.commit()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Skip the per-row loop for sizes larger than this")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    wafer = Wafer(batch_id="bench")
+    db.add(wafer)
+    db.commit()
+
+    print(f"{'rows':>10} {'legacy rows/s':>15} {'bulk rows/s':>15} {'speedup':>8}")
+    try:
+        for n in args.sizes:
+            die_data = make_die_data(n)
+
+            legacy = None
+            if args.skip_legacy_above is None or n <= args.skip_legacy_above:
+                legacy = timed(legacy_loop, db, wafer.id, die_data)
+                db.query(TestResult).delete()
+                db.commit()
+
+            bulk = timed(lambda: bulk_insert_results(db, wafer.id, die_data, chunk_size=args.chunk_size))
+            db.query(TestResult).delete()
+            db.commit()
+
+            legacy_rate = f"{n / legacy:15,.0f}" if legacy else f"{'skipped':>15}"
+            speedup = f"{legacy / bulk:7.1f}x" if legacy else f"{'-':>8}"
+            print(f"{n:>10,} {legacy_rate} {n / bulk:15,.0f} {speedup}")
+    finally:
+        db.query(Wafer).filter(Wafer.id == wafer.id).delete()
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
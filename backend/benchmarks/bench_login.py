@@ -0,0 +1,147 @@
+"""
+Load test: latency of other endpoints during a login burst.
+
+Run from the backend directory:
+
+    BCRYPT_ROUNDS=12 python -m benchmarks.bench_login --logins 200 --probers 4
+
+Serves the API on a local port and, while a burst of concurrent logins is
+in flight, keeps probing a sync endpoint (/programs/, which needs a
+request threadpool thread) and an async one (/health/pool). The burst is
+run against a copy of the old login (bcrypt inline in the shared request
+threadpool) and then against /auth/login, and p50/p99 probe latencies are
+printed next to an idle baseline.
+
+Every client connects from 127.0.0.1, so unless LOGIN_MAX_PER_IP and
+LOGIN_QUEUE_TIMEOUT are set the per-IP limit is lifted and logins queue
+rather than get a 429, and both runs do the same work. Uses DATABASE_URL
+when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.setdefault("LOGIN_MAX_PER_IP", "100000")
+os.environ.setdefault("LOGIN_QUEUE_TIMEOUT", "600")
+
+import httpx
+import uvicorn
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
+
+from app.database import Base, SessionLocal, engine, get_db
+from app.main import app
+from app.models import User
+from app.rate_limit import login_limiter
+from app.utils import create_access_token, hash_password, verify_password
+
+
+@app.post("/bench/legacy_login", include_in_schema=False)
+def legacy_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    db_user = db.query(User).filter(User.username == form_data.username).first()
+    if not db_user or not verify_password(form_data.password, db_user.hashed_pw):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    return {"access_token": create_access_token({"sub": db_user.username}), "token_type": "bearer"}
+
+
+def start_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def populate(n):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(User).count() < n + 1:
+            # One hash shared by every user keeps setup fast
+            hashed = hash_password("secret")
+            db.add_all(User(username=f"op{i}", hashed_pw=hashed, role="user") for i in range(n))
+            db.add(User(username="probe", hashed_pw=hashed, role="user"))
+            db.commit()
+    finally:
+        db.close()
+
+
+async def probe(client, url, headers, latencies, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def scenario(base, login_path, logins, probers, headers):
+    latencies = {"/programs/": [], "/health/pool": []}
+    codes = []
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=httpx.Limits(max_connections=None)) as client:
+
+        async def login(i):
+            response = await client.post(login_path, data={"username": f"op{i}", "password": "secret"})
+            codes.append(response.status_code)
+
+        probes = [
+            asyncio.create_task(probe(client, url, headers, latencies[url], stop))
+            for url in latencies for _ in range(probers)
+        ]
+        start = time.perf_counter()
+        if logins:
+            await asyncio.gather(*(login(i) for i in range(logins)))
+        else:
+            await asyncio.sleep(2)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*probes)
+    return latencies, codes, elapsed
+
+
+def report(label, latencies, codes, elapsed):
+    ok = codes.count(200)
+    limited = codes.count(429)
+    parts = [f"{label:>10} {elapsed:7.1f}s {ok:5} ok {limited:5} 429"]
+    for url, values in latencies.items():
+        values = sorted(values)
+        p99 = values[int(len(values) * 0.99) - 1] if len(values) >= 100 else values[-1]
+        parts.append(f"{url} p50 {statistics.median(values) * 1000:7.1f} ms p99 {p99 * 1000:7.1f} ms")
+    print("  ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--probers", type=int, default=4)
+    args = parser.parse_args()
+
+    populate(args.logins)
+    server, base = start_server()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'probe', 'role': 'user'})}"}
+    try:
+        for label, path, logins in (
+            ("idle", None, 0),
+            ("legacy", "/bench/legacy_login", args.logins),
+            ("limited", "/auth/login", args.logins),
+        ):
+            report(label, *asyncio.run(scenario(base, path, logins, args.probers, headers)))
+        print(f"login limiter {login_limiter.stats()}")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
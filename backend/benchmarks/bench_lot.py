@@ -0,0 +1,87 @@
+"""
+Benchmark lot turnaround: wafers one after another vs. a lot fan-out.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_lot --wafers 8 --instruments 4 --diameter 16 --step-ms 2
+
+Registers ``--instruments`` FAKE instruments (``--step-ms`` per die) and
+starts an in-process threaded Celery worker on an in-memory broker. The
+lot is first tested the way it had to be before lot runs, one
+/tests/run-style job at a time on a single instrument, then with
+scheduler.schedule_lot, which spreads the wafers over every instrument and
+summarizes the lot in a chord. Prints both turnarounds and the lot
+summary. Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wafers", type=int, default=8)
+    parser.add_argument("--instruments", type=int, default=4)
+    parser.add_argument("--diameter", type=int, default=16)
+    parser.add_argument("--step-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # The registry and Celery app read these at import
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["INSTRUMENTS"] = json.dumps([
+        {"name": f"fake-{i}", "type": "FAKE", "address": f"fake-{i}"} for i in range(args.instruments)
+    ])
+    os.environ["CELERY_BROKER_URL"] = "memory://"
+    os.environ["CELERY_RESULT_BACKEND"] = "cache+memory://"
+
+    from celery.contrib.testing.worker import start_worker
+
+    from app.celery_app import celery_app
+    from app.database import Base, SessionLocal, engine
+    from app.instruments import registry
+    from app.models import Wafer
+    from app.scheduler import schedule_lot, schedule_wafer_test
+
+    # The in-memory transport polls its queues once a second by default
+    celery_app.conf.broker_transport_options = {**celery_app.conf.broker_transport_options, "polling_interval": 0.01}
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        wafers = [Wafer(batch_id="BENCH-LOT") for _ in range(args.wafers)]
+        db.add_all(wafers)
+        db.commit()
+        wafer_ids = [w.id for w in wafers]
+    finally:
+        db.close()
+
+    params = {"diameter": args.diameter, "tests": ["IV", "LEAK"], "step_delay": args.step_ms / 1000, "seed": 1}
+    queues = ["celery"] + [c.queue for c in registry.values()]
+    with start_worker(celery_app, pool="threads", concurrency=args.instruments + 1, queues=queues,
+                      perform_ping_check=False, shutdown_timeout=30):
+        start = time.perf_counter()
+        for wafer_id in wafer_ids:
+            _, result = schedule_wafer_test(wafer_id, "FAKE", params, instrument="fake-0")
+            result.get(timeout=600, interval=0.01)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lot = schedule_lot("BENCH-LOT", wafer_ids, "FAKE", params, insertion=2)
+        summary = celery_app.AsyncResult(lot["lot_id"]).get(timeout=600, interval=0.01)
+        fanned_out = time.perf_counter() - start
+
+    per_instrument = {}
+    for wafer in lot["wafers"].values():
+        per_instrument[wafer["instrument"]] = per_instrument.get(wafer["instrument"], 0) + 1
+    print(f"{args.wafers} wafers, {args.instruments} instruments")
+    print(f"{'one at a time':>14} {sequential:8.2f}s")
+    print(f"{'lot fan-out':>14} {fanned_out:8.2f}s  ({sequential / fanned_out:.1f}x)")
+    print(f"wafers per instrument: {per_instrument}")
+    print(f"lot yield {summary['yield']:.1%} over {summary['dies']} dies, "
+          f"{summary['wafers_completed']}/{summary['wafers_total']} wafers completed")
+
+
+if __name__ == "__main__":
+    main()
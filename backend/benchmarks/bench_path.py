@@ -0,0 +1,65 @@
+"""
+Compare prober stepping orders by estimated chuck travel.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_path --diameter 30 100 --skip 0 0.3 --sites 1x1 2x2
+
+Plans round wafers with ``--skip`` of their dies left out (random dies
+plus an edge ring, as an inked or partially tested wafer has) for each
+probe card in ``--sites``, with every strategy of app.hardware.path_planner.
+Prints touchdowns, the travel distance and time of stepping the planned
+dies from TravelModel, the time saved against raster order and how long
+planning took. Needs no database.
+"""
+import argparse
+import random
+import time
+
+from app.hardware.base import round_wafer
+from app.hardware.path_planner import STRATEGIES, plan_path
+
+
+def skipped_dies(dies, fraction: float, rng: random.Random):
+    """Half the skips on the outermost dies, half at random."""
+    if not fraction:
+        return set()
+    count = int(len(dies) * fraction)
+    cx = sum(x for x, _ in dies) / len(dies)
+    cy = sum(y for _, y in dies) / len(dies)
+    by_radius = sorted(dies, key=lambda d: (d[0] - cx) ** 2 + (d[1] - cy) ** 2, reverse=True)
+    skip = set(by_radius[:count // 2])
+    skip.update(rng.sample([d for d in dies if d not in skip], count - len(skip)))
+    return skip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--diameter", type=int, nargs="+", default=[30, 100])
+    parser.add_argument("--skip", type=float, nargs="+", default=[0.0, 0.3], help="Fraction of dies to skip")
+    parser.add_argument("--sites", nargs="+", default=["1x1", "2x2"], help="Probe card sites, COLUMNSxROWS")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'diameter':>8} {'skip':>5} {'sites':>5} {'strategy':>10} {'touchdowns':>10} "
+          f"{'travel mm':>10} {'travel s':>9} {'saved':>7} {'plan ms':>8}")
+    for diameter in args.diameter:
+        dies = round_wafer(diameter)
+        for fraction in args.skip:
+            skip = skipped_dies(dies, fraction, rng)
+            for card in args.sites:
+                sites = tuple(int(n) for n in card.split("x"))
+                raster = plan_path(dies, "raster", skip, sites)
+                for strategy in STRATEGIES:
+                    start = time.perf_counter()
+                    plan = plan_path(dies, strategy, skip, sites)
+                    elapsed = time.perf_counter() - start
+                    report = plan.report(baseline=raster)
+                    print(f"{diameter:8} {fraction:5.0%} {card:>5} {strategy:>10} {report['touchdowns']:10} "
+                          f"{report['travel_mm']:10.0f} {report['travel_s']:9.1f} "
+                          f"{report['travel_saved_pct']:6.1f}% {1000 * elapsed:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark the hot test_results queries with and without the composite indexes.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_queries --rows 1000000 --wafers 50
+
+Drops the test_results indexes, prints each query's plan and best-of-N
+latency, recreates the indexes and repeats. Uses DATABASE_URL when set,
+otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import text
+
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+
+TESTS = ("IV", "LEAK", "VTH", "IDSAT")
+
+QUERIES = {
+    "latest results": (
+        "SELECT * FROM test_results WHERE wafer_id = :wafer_id "
+        "ORDER BY timestamp DESC LIMIT 10"
+    ),
+    "wafer map": (
+        "SELECT die_x, die_y, result_value FROM test_results WHERE wafer_id = :wafer_id"
+    ),
+    "single die": (
+        "SELECT result_value FROM test_results WHERE wafer_id = :wafer_id "
+        "AND die_x = :x AND die_y = :y AND test_name = :test"
+    ),
+    "test failures": (
+        "SELECT count(*) FROM test_results WHERE test_name = :test AND result_value > 0.001"
+    ),
+}
+
+
+def populate(db, rows, wafers):
+    per_wafer = rows // wafers
+    for _ in range(wafers):
+        wafer = Wafer(batch_id="bench")
+        db.add(wafer)
+        db.commit()
+        die_data = (
+            {"x": (n // len(TESTS)) % 100, "y": (n // len(TESTS)) // 100,
+             "test": TESTS[n % len(TESTS)], "value": random.gauss(0.0008, 0.0003)}
+            for n in range(per_wafer)
+        )
+        bulk_insert_results(db, wafer.id, die_data)
+
+
+def explain(conn, sql, params):
+    if engine.dialect.name == "postgresql":
+        rows = conn.execute(text("EXPLAIN ANALYZE " + sql), params)
+        return "\n".join(r[0] for r in rows)
+    rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)
+    return "\n".join(r[-1] for r in rows)
+
+
+def best_of(conn, sql, params, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(sql), params).fetchall()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(label, params):
+    print(f"\n== {label} ==")
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            latency = best_of(conn, sql, params)
+            print(f"-- {name}: {latency * 1000:.2f} ms")
+            print("   " + explain(conn, sql, params).replace("\n", "\n   "))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--wafers", type=int, default=50)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(TestResult).count() < args.rows:
+            populate(db, args.rows, args.wafers)
+        wafer_id = db.query(Wafer.id).order_by(Wafer.id.desc()).limit(1).scalar()
+    finally:
+        db.close()
+
+    params = {"wafer_id": wafer_id, "x": 10, "y": 10, "test": "LEAK"}
+    indexes = TestResult.__table__.indexes
+
+    for index in indexes:
+        index.drop(bind=engine, checkfirst=True)
+    run("without composite indexes", params)
+
+    for index in indexes:
+        index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    run("with composite indexes", params)
+
+
+if __name__ == "__main__":
+    main()
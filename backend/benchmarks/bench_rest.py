@@ -0,0 +1,67 @@
+"""
+Benchmark the blocking REST driver against the concurrent async driver.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_rest --diameter 40 --die-ms 2 --in-flight 8
+
+Starts the REST instrument simulator on a local port and runs the same
+wafer through ``RESTInstrument`` (one blocking whole-wafer request) and
+``AsyncRESTInstrument`` (concurrent region jobs with paged results).
+"""
+import argparse
+import socket
+import threading
+import time
+
+import uvicorn
+
+from app.hardware.async_rest_driver import AsyncRESTInstrument
+from app.hardware.rest_driver import RESTInstrument
+from app.hardware.rest_sim_server import app
+
+
+def start_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def timed(label, results):
+    start = time.perf_counter()
+    first, count = None, 0
+    for _ in results:
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8} {count:>9,} {elapsed:9.2f} {first:9.3f} {count / elapsed:12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--diameter", type=int, default=40)
+    parser.add_argument("--tests", nargs="+", default=["IV", "LEAK"])
+    parser.add_argument("--die-ms", type=float, default=2.0)
+    parser.add_argument("--in-flight", type=int, default=8)
+    parser.add_argument("--region-size", type=int, default=64)
+    args = parser.parse_args()
+
+    server, url = start_server()
+    params = {"diameter": args.diameter, "tests": args.tests, "die_ms": args.die_ms}
+    print(f"{'driver':>8} {'results':>9} {'wall s':>9} {'first s':>9} {'results/s':>12}")
+    try:
+        timed("sync", RESTInstrument(url).iter_dies(params))
+        timed("async", AsyncRESTInstrument(url, max_in_flight=args.in_flight,
+                                           region_size=args.region_size).iter_dies(params))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
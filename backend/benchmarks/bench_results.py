@@ -0,0 +1,102 @@
+"""
+Benchmark result paging and streaming: OFFSET vs. keyset, .all() vs. yield_per.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_results --rows 1000000 --wafers 10
+
+Times fetching a page at increasing depth with LIMIT/OFFSET and with the
+(wafer_id, id) keyset used by /tests/results, then compares peak Python
+memory of materializing a lot against streaming it in chunks. Uses
+DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+from app.routers.tests import RESULTS_STREAM_CHUNK, results_query
+
+TESTS = ("IV", "LEAK", "VTH", "IDSAT")
+PAGE = 1000
+
+
+def populate(db, rows, wafers):
+    per_wafer = rows // wafers
+    for _ in range(wafers):
+        wafer = Wafer(batch_id="LOT000")
+        db.add(wafer)
+        db.commit()
+        die_data = (
+            {"x": n % 200, "y": n // 200, "test": TESTS[n % len(TESTS)],
+             "value": random.gauss(0.0008, 0.0003)}
+            for n in range(per_wafer)
+        )
+        bulk_insert_results(db, wafer.id, die_data)
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        count = fn()
+        return tracemalloc.get_traced_memory()[1], count
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--wafers", type=int, default=10)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(TestResult).count() < args.rows:
+            start = time.perf_counter()
+            populate(db, args.rows, args.wafers)
+            print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'page at row':>12} {'offset ms':>10} {'keyset ms':>10}")
+        for depth in (0, args.rows // 10, args.rows // 2, args.rows - PAGE):
+            # Key of the last row before the page, as a client cursor would carry it
+            key = db.execute(results_query().offset(depth - 1).limit(1)).one() if depth else None
+            after = (key.wafer_id, key.id) if key else None
+            offset_t = best_of(lambda: db.execute(results_query().offset(depth).limit(PAGE)).all())
+            keyset_t = best_of(lambda: db.execute(results_query(after=after).limit(PAGE)).all())
+            print(f"{depth:12,} {offset_t * 1000:10.1f} {keyset_t * 1000:10.1f}")
+
+        def materialize():
+            return len(db.execute(results_query(batch_id="LOT000")).all())
+
+        def stream():
+            result = db.execute(results_query(batch_id="LOT000").execution_options(yield_per=RESULTS_STREAM_CHUNK))
+            return sum(len(rows) for rows in result.partitions())
+
+        for label, fn in (("all()", materialize), ("yield_per", stream)):
+            peak, count = peak_memory(fn)
+            print(f"{label:>10}: {count:,} rows, peak {peak / 1e6:.1f} MB")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
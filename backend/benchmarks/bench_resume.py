@@ -0,0 +1,95 @@
+"""
+Benchmark a wafer test that fails part way: restart from scratch vs. resume.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_resume --diameter 40 --step-ms 2 --fail-at 0.5 0.9
+
+Runs run_wafer_test eagerly on the FAKE instrument (``--step-ms`` per die)
+and makes the ingest fail once after ``--fail-at`` of the wafer's batches.
+The retry either probes the whole wafer again, as before checkpointing, or
+resumes past the dies already committed. Prints wall time, dies written
+and result rows stored for each. Uses DATABASE_URL when set, otherwise a
+throwaway SQLite file.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import func
+
+import app.celery_app as tasks
+import app.hardware.base as base
+import app.ingest as ingest
+from app.database import Base, SessionLocal, engine
+from app.hardware.base import round_wafer
+from app.models import TestResult, Wafer
+
+TESTS = ["IV", "LEAK"]
+
+
+def run(db, params, fail_after, resume):
+    wafer = Wafer(batch_id="BENCH")
+    db.add(wafer)
+    db.commit()
+
+    calls = {"n": 0, "dies": 0}
+    bulk_insert, completed_dies = ingest.bulk_insert_results, ingest.completed_dies
+
+    def flaky(db, wafer_id, batch, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == fail_after:
+            raise IOError("prober lost contact")
+        calls["dies"] += len(batch) // len(TESTS)
+        return bulk_insert(db, wafer_id, batch, **kwargs)
+
+    ingest.bulk_insert_results = flaky
+    if not resume:
+        ingest.completed_dies = lambda *args, **kwargs: set()
+    try:
+        start = time.perf_counter()
+        result = tasks.run_wafer_test.apply(kwargs={
+            "wafer_id": wafer.id, "instrument_type": "FAKE", "test_params": params,
+        }).get()
+        elapsed = time.perf_counter() - start
+    finally:
+        ingest.bulk_insert_results = bulk_insert
+        ingest.completed_dies = completed_dies
+    rows = db.query(func.count(TestResult.id)).filter(TestResult.wafer_id == wafer.id).scalar()
+    return elapsed, calls["dies"], rows, result["probe_seconds_saved"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--diameter", type=int, default=40)
+    parser.add_argument("--step-ms", type=float, default=2.0)
+    parser.add_argument("--batch-size", type=int, default=100, help="Results per committed batch")
+    parser.add_argument("--fail-at", type=float, nargs="+", default=[0.5, 0.9])
+    args = parser.parse_args()
+
+    base.DIE_BATCH_SIZE = args.batch_size
+    tasks.celery_app.conf.task_always_eager = True
+    Base.metadata.create_all(bind=engine)
+
+    dies = len(round_wafer(args.diameter))
+    batches = -(-dies * len(TESTS) // args.batch_size)
+    params = {"diameter": args.diameter, "tests": TESTS, "step_delay": args.step_ms / 1000, "seed": 1}
+    print(f"{dies} dies x {len(TESTS)} tests, {batches} batches")
+    print(f"{'fail at':>8} {'mode':>8} {'seconds':>8} {'dies written':>13} {'rows':>7} {'saved s':>8}")
+    db = SessionLocal()
+    try:
+        for fraction in args.fail_at:
+            fail_after = max(1, int(batches * fraction))
+            for mode, resume in (("restart", False), ("resume", True)):
+                elapsed, probed, rows, saved = run(db, params, fail_after, resume)
+                print(f"{fraction:8.0%} {mode:>8} {elapsed:8.2f} {probed:13} {rows:7} {saved:8.1f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark per-die SCPI queries vs. the buffered sequencer on a simulated link.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_scpi --diameter 40 --tests IV LEAK VTH --latency-ms 2
+
+Both flows run against SimulatedResource, which charges ``--latency-ms``
+per round trip, and the round-trip counts and wall times are compared.
+"""
+import argparse
+import time
+
+from app.hardware.base import round_wafer
+from app.hardware.scpi_sequencer import compile_plan, run_plan
+from app.hardware.sim_visa import SimulatedResource
+
+
+def per_die(resource, dies, tests):
+    """Unbatched flow: step, then one query per test, for every die."""
+    for x, y in dies:
+        resource.write(f"PROB:STEP {x},{y}")
+        for test in tests:
+            yield {"x": x, "y": y, "test": test, "value": float(resource.query(f"MEAS? '{test}'"))}
+
+
+def measure(label, resource, results):
+    start = time.perf_counter()
+    count = sum(1 for _ in results)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>10} {count:>9,} {resource.round_trips:>12,} {elapsed:9.2f} {count / elapsed:12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--diameter", type=int, default=40)
+    parser.add_argument("--tests", nargs="+", default=["IV", "LEAK", "VTH"])
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--block-size", type=int, default=256)
+    args = parser.parse_args()
+
+    dies = round_wafer(args.diameter)
+    latency = args.latency_ms / 1000
+    print(f"{len(dies):,} dies x {len(args.tests)} tests, {args.latency_ms} ms per round trip")
+    print(f"{'flow':>10} {'results':>9} {'round trips':>12} {'wall s':>9} {'results/s':>12}")
+
+    resource = SimulatedResource("SIM::legacy", latency=latency, seed=1)
+    measure("per-die", resource, per_die(resource, dies, args.tests))
+
+    resource = SimulatedResource("SIM::batched", latency=latency, seed=1)
+    plan = compile_plan({"tests": args.tests, "dies": dies, "block_size": args.block_size})
+    measure("batched", resource, run_plan(resource, plan))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark the vectorized statistics engine against per-row Python.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_stats --rows 1000000 --wafers 10
+
+Loads a lot once into arrays, then times per-test statistics over the lot
+and spatial outliers on each wafer, against the same computations written
+as dict-of-lists loops (the Python spatial pass does GDBN only, the NumPy
+one GDBN plus NNR on every test). Uses DATABASE_URL when set, otherwise a
+throwaway SQLite file.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+from app.stats import NEIGHBOR_OFFSETS, load_results, spatial_outliers, test_statistics
+
+TESTS = ("IV", "LEAK", "VTH", "IDSAT")
+USL = 0.001
+
+
+def populate(db, rows, wafers):
+    side = int(math.sqrt(rows // wafers // len(TESTS))) or 1
+    for _ in range(wafers):
+        wafer = Wafer(batch_id="LOT000")
+        db.add(wafer)
+        db.commit()
+        die_data = (
+            {"x": n % side, "y": n // side, "test": test, "value": random.gauss(0.0008, 0.0003)}
+            for n in range(side * side)
+            for test in TESTS
+        )
+        bulk_insert_results(db, wafer.id, die_data)
+
+
+def python_statistics(rows):
+    by_test = defaultdict(list)
+    for _, _, _, test, value in rows:
+        by_test[test].append(value)
+    out = {}
+    for test, values in by_test.items():
+        values.sort()
+        mean, sigma = statistics.fmean(values), statistics.stdev(values)
+        out[test] = {
+            "mean": mean,
+            "percentiles": statistics.quantiles(values, n=100, method="inclusive"),
+            "yield": sum(v <= USL for v in values) / len(values) * 100,
+            "cpk": (USL - mean) / (3 * sigma),
+        }
+    return out
+
+
+def python_gdbn(rows, wafer_id, min_bad=5):
+    bad, tested = set(), set()
+    for w, x, y, _, value in rows:
+        if w != wafer_id:
+            continue
+        tested.add((x, y))
+        if value > USL:
+            bad.add((x, y))
+    return [
+        (x, y) for x, y in tested - bad
+        if sum((x + dx, y + dy) in bad for dy, dx in NEIGHBOR_OFFSETS) >= min_bad
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return time.perf_counter() - start, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--wafers", type=int, default=10)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(TestResult).count() < args.rows * 0.9:
+            start = time.perf_counter()
+            populate(db, args.rows, args.wafers)
+            print(f"Loaded {db.query(TestResult).count():,} rows in {time.perf_counter() - start:.1f}s")
+        wafers = db.query(Wafer).filter(Wafer.batch_id == "LOT000").order_by(Wafer.id).all()
+
+        rows_t, rows = timed(lambda: db.query(
+            TestResult.wafer_id, TestResult.die_x, TestResult.die_y, TestResult.test_name, TestResult.result_value
+        ).all())
+        arrays_t, arrays = timed(load_results, db, wafers)
+        print(f"load: rows {rows_t:.2f}s, arrays {arrays_t:.2f}s ({len(arrays):,} results)")
+
+        print(f"{'step':>22} {'python s':>9} {'numpy s':>8} {'speedup':>8}")
+        py_t, _ = timed(python_statistics, rows)
+        np_t, _ = timed(test_statistics, arrays)
+        print(f"{'per-test statistics':>22} {py_t:9.3f} {np_t:8.3f} {py_t / np_t:7.1f}x")
+
+        py_t = np_t = 0.0
+        for wafer in wafers:
+            t, _ = timed(python_gdbn, rows, wafer.id)
+            py_t += t
+            t, _ = timed(spatial_outliers, arrays.select(arrays.wafer_id == wafer.id))
+            np_t += t
+        print(f"{'spatial outliers':>22} {py_t:9.3f} {np_t:8.3f} {py_t / np_t:7.1f}x")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark whole-wafer vs. batched result handoff from a driver to the database.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_streaming --diameter 200 --tests IV LEAK VTH
+
+Reports total time, time until the first results are committed and peak
+Python memory for each mode, using FakeInstrument so no hardware is needed.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.database import Base, SessionLocal, engine
+from app.hardware.fake_driver import FakeInstrument
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer
+
+
+def whole_wafer(db, wafer_id, instr, params, batch_size):
+    start = time.perf_counter()
+    results = instr.run_test(params)
+    bulk_insert_results(db, wafer_id, results["die_data"])
+    first = time.perf_counter() - start
+    return first
+
+
+def streaming(db, wafer_id, instr, params, batch_size):
+    start = time.perf_counter()
+    first = None
+    for batch in instr.iter_results(params, batch_size):
+        bulk_insert_results(db, wafer_id, batch, upsert=False)
+        if first is None:
+            first = time.perf_counter() - start
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--diameter", type=int, default=200)
+    parser.add_argument("--tests", nargs="+", default=["IV", "LEAK", "VTH"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--step-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    wafer = Wafer(batch_id="bench")
+    db.add(wafer)
+    db.commit()
+
+    instr = FakeInstrument(seed=1)
+    params = {"diameter": args.diameter, "tests": args.tests, "step_delay": args.step_delay}
+
+    print(f"{'mode':>12} {'rows':>10} {'total s':>9} {'first s':>9} {'peak MiB':>9}")
+    try:
+        for name, fn in (("whole-wafer", whole_wafer), ("streaming", streaming)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            first = fn(db, wafer.id, instr, params, args.batch_size)
+            total = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rows = db.query(TestResult).filter(TestResult.wafer_id == wafer.id).count()
+            db.query(TestResult).delete()
+            db.commit()
+            print(f"{name:>12} {rows:>10,} {total:9.2f} {first:9.3f} {peak / 2**20:9.1f}")
+    finally:
+        db.query(Wafer).filter(Wafer.id == wafer.id).delete()
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark /analytics/yield: full COUNT scans vs. the yield aggregate table.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_yield --rows 2000000 --wafers 40
+
+Loads the rows through bulk_insert_results (which maintains the
+aggregates), then times both query strategies with and without filters.
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.binning import PASS_BIN
+from app.database import Base, SessionLocal, engine
+from app.ingest import bulk_insert_results
+from app.models import TestResult, Wafer, YieldAggregate
+from app.routers.analytics import yield_query
+
+TESTS = ("IV", "LEAK", "VTH", "IDSAT")
+
+
+def populate(db, rows, wafers):
+    per_wafer = rows // wafers
+    for i in range(wafers):
+        wafer = Wafer(batch_id=f"LOT{i // 25:03d}")
+        db.add(wafer)
+        db.commit()
+        die_data = (
+            {"x": n % 200, "y": n // 200, "test": TESTS[n % len(TESTS)],
+             "value": random.gauss(0.0008, 0.0003)}
+            for n in range(per_wafer)
+        )
+        bulk_insert_results(db, wafer.id, die_data)
+
+
+def scan_yield(db, batch_id=None):
+    query = db.query(TestResult)
+    if batch_id is not None:
+        query = query.join(Wafer).filter(Wafer.batch_id == batch_id)
+    total = query.count()
+    passes = query.filter(TestResult.bin == PASS_BIN).count()
+    return total, passes
+
+
+def aggregate_yield(db, batch_id=None):
+    total, passes = db.execute(yield_query(batch_id=batch_id)).one()
+    return total, passes
+
+
+def best_of(fn, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--wafers", type=int, default=40)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(TestResult).count() < args.rows:
+            start = time.perf_counter()
+            populate(db, args.rows, args.wafers)
+            print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+        print(f"{db.query(YieldAggregate).count():,} aggregate rows")
+
+        print(f"{'query':>20} {'scan ms':>10} {'aggregate ms':>13} {'match':>6}")
+        for label, batch_id in (("all results", None), ("batch LOT000", "LOT000")):
+            scan_t, scan_v = best_of(scan_yield, db, batch_id)
+            agg_t, agg_v = best_of(aggregate_yield, db, batch_id)
+            print(f"{label:>20} {scan_t * 1000:10.1f} {agg_t * 1000:13.2f} {str(scan_v == agg_v):>6}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
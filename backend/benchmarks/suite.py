@@ -0,0 +1,368 @@
+"""
+Reproducible benchmark suite, for comparing performance between commits.
+
+Run from the backend directory:
+
+    python -m benchmarks.suite run --wafers 5 --dies 5000 --tests 4
+    python -m benchmarks.suite compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+``run`` builds a seeded synthetic lot (``benchmarks.synthetic``) and times:
+
+- ``ingest``: ``bulk_insert_results`` of whole wafers
+- ``yield``: ``/analytics/yield`` per lot, wafer and test
+- ``wafer_map``: ``/analytics/wafer_map`` as JSON and binary, built (cold
+  cache), cached (warm) and revalidated (304)
+- ``websocket``: ``publish_results`` fan-out to ``--ws-clients`` clients of
+  ``/tests/ws``
+- ``auth``: an authenticated endpoint with warm and cold auth caches,
+  against the same endpoint with authentication overridden
+
+Every case warms up before it is timed. Results go to a JSON file named
+after the commit (``benchmarks/results/<commit>.json`` by default) along
+with the configuration and database they were measured with. ``compare``
+prints the change of every metric and exits with status 1 when a median
+latency (``*p50_ms``, better lower) or a throughput (``*_per_s``, better
+higher) got worse by more than ``--threshold``. Tail latencies and the
+other numbers are printed for information only, they are too noisy to
+gate on.
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file. Point it at
+a scratch database: the suite adds a lot and a user to it.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _latencies(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def _time_requests(call, requests: int, warmup: int, before=None) -> dict:
+    for _ in range(warmup):
+        if before:
+            before()
+        call()
+    samples = []
+    for _ in range(requests):
+        if before:
+            before()
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return _latencies(samples)
+
+
+def _get(client, url: str, status: int = 200, **kwargs):
+    def call():
+        response = client.get(url, **kwargs)
+        assert response.status_code == status, f"GET {url}: {response.status_code} {response.text[:200]}"
+        return response
+    return call
+
+
+def bench_ingest(args, spec, rng) -> dict:
+    from app.database import SessionLocal
+    from app.ingest import bulk_insert_results
+    from app.models import TestResult, Wafer
+
+    from .synthetic import wafer_results
+
+    # Generated up front so only the writes are timed
+    wafers = [list(wafer_results(spec, rng)) for _ in range(args.repeat + 1)]
+    db = SessionLocal()
+    try:
+        times = []
+        for i, rows in enumerate(wafers):
+            wafer = Wafer(batch_id="SUITE-INGEST")
+            db.add(wafer)
+            db.commit()
+            start = time.perf_counter()
+            bulk_insert_results(db, wafer.id, rows)
+            elapsed = time.perf_counter() - start
+            # The first wafer is the warmup
+            if i:
+                times.append(elapsed)
+            db.query(TestResult).filter(TestResult.wafer_id == wafer.id).delete()
+            db.delete(wafer)
+            db.commit()
+    finally:
+        db.close()
+    rows = len(wafers[0])
+    return {
+        "rows": rows,
+        "rows_per_s": round(rows / statistics.median(times)),
+        "wafer_p50_ms": round(statistics.median(times) * 1000, 1),
+    }
+
+
+def bench_yield(args, client, batch_id, wafer_ids, spec) -> dict:
+    queries = {
+        "lot": {"batch_id": batch_id},
+        "wafer": {"wafer_id": wafer_ids[0]},
+        "test": {"batch_id": batch_id, "test_name": spec.tests[0]},
+    }
+    return {
+        name: _time_requests(_get(client, "/analytics/yield", params=params), args.requests, args.warmup)
+        for name, params in queries.items()
+    }
+
+
+def bench_wafer_map(args, client, wafer_ids) -> dict:
+    from app.wafer_map import wafer_map_cache
+
+    wafer_id = wafer_ids[0]
+    url = f"/analytics/wafer_map/{wafer_id}"
+    results = {}
+    for fmt in ("json", "binary"):
+        params = {"format": fmt}
+        etag = client.get(url, params=params).headers["ETag"]
+        results[fmt] = {
+            "cold": _time_requests(_get(client, url, params=params), args.requests, args.warmup,
+                                   before=lambda: wafer_map_cache.invalidate(wafer_id)),
+            "warm": _time_requests(_get(client, url, params=params), args.requests, args.warmup),
+            "not_modified": _time_requests(
+                _get(client, url, 304, params=params, headers={"If-None-Match": etag}), args.requests, args.warmup
+            ),
+            "bytes": len(client.get(url, params=params).content),
+        }
+    return results
+
+
+def bench_websocket(args, client, wafer_id, spec) -> dict:
+    from app.pubsub import publish_results
+
+    clients = args.ws_clients
+    messages = args.ws_messages
+    subscribed = threading.Barrier(clients + 1)
+    latencies = [[] for _ in range(clients)]
+    rows = [
+        {"die_x": x, "die_y": 0, "test_name": spec.tests[0], "result_value": 0.0, "bin": 1}
+        for x in range(args.ws_rows)
+    ]
+
+    def listen(i):
+        with client.websocket_connect(f"/tests/ws/{wafer_id}") as ws:
+            # The snapshot comes after subscribing
+            ws.receive_json()
+            subscribed.wait()
+            for _ in range(messages):
+                sent = ws.receive_json()["results"][0]["timestamp"]
+                received = datetime.datetime.now(datetime.timezone.utc)
+                latencies[i].append((received - datetime.datetime.fromisoformat(sent)).total_seconds())
+
+    threads = [threading.Thread(target=listen, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    subscribed.wait(timeout=30)
+    start = time.perf_counter()
+    for _ in range(messages):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        publish_results(wafer_id, [{**row, "timestamp": now} for row in rows])
+    for thread in threads:
+        thread.join(timeout=60)
+    elapsed = time.perf_counter() - start
+
+    received = [s for client_latencies in latencies for s in client_latencies]
+    return {
+        "clients": clients,
+        "messages": messages,
+        "rows_per_message": args.ws_rows,
+        "delivered": len(received),
+        "deliveries_per_s": round(len(received) / elapsed),
+        **_latencies(received or [0.0]),
+    }
+
+
+def bench_auth(args, client, app) -> dict:
+    from app.auth_cache import token_cache, user_cache
+    from app.routers.auth import get_current_user
+    from app.utils import create_access_token
+
+    def clear_caches():
+        token_cache.clear()
+        user_cache.clear()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'suite', 'role': 'user'})}"}
+    call = _get(client, "/tests/instruments", headers=headers)
+    results = {
+        "warm": _time_requests(call, args.requests, args.warmup),
+        "cold": _time_requests(call, args.requests, args.warmup, before=clear_caches),
+    }
+    # The same endpoint with authentication taken out
+    app.dependency_overrides[get_current_user] = lambda: None
+    try:
+        results["none"] = _time_requests(_get(client, "/tests/instruments"), args.requests, args.warmup)
+    finally:
+        app.dependency_overrides.pop(get_current_user)
+    results["warm_overhead_ms"] = round(results["warm"]["p50_ms"] - results["none"]["p50_ms"], 3)
+    results["cold_overhead_ms"] = round(results["cold"]["p50_ms"] - results["none"]["p50_ms"], 3)
+    return results
+
+
+CASES = ("ingest", "yield", "wafer_map", "websocket", "auth")
+
+
+def run(args):
+    # The app reads these at import
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+    from fastapi.testclient import TestClient
+
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+    from app.models import User
+    from app.utils import hash_password
+
+    from .synthetic import WaferSpec, create_lot
+
+    cases = args.cases or CASES
+    spec = WaferSpec.build(args.dies, args.tests, args.pattern, args.fail_rate)
+    rng = random.Random(args.seed)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.username == "suite").first():
+            db.add(User(username="suite", hashed_pw=hash_password("suite"), role="user"))
+            db.commit()
+        batch_id = f"SUITE-{args.seed}"
+        start = time.perf_counter()
+        wafer_ids = create_lot(db, batch_id, args.wafers, spec, rng)
+        print(f"lot {batch_id}: {args.wafers} wafers of {args.dies} dies x {args.tests} tests "
+              f"in {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+    results = {}
+    with TestClient(app) as client:
+        for case in cases:
+            start = time.perf_counter()
+            if case == "ingest":
+                results[case] = bench_ingest(args, spec, rng)
+            elif case == "yield":
+                results[case] = bench_yield(args, client, batch_id, wafer_ids, spec)
+            elif case == "wafer_map":
+                results[case] = bench_wafer_map(args, client, wafer_ids)
+            elif case == "websocket":
+                results[case] = bench_websocket(args, client, wafer_ids[0], spec)
+            elif case == "auth":
+                results[case] = bench_auth(args, client, app)
+            print(f"{case:>10} {time.perf_counter() - start:6.1f}s  {json.dumps(results[case])}")
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": engine.dialect.name,
+        "config": {k: v for k, v in vars(args).items() if k not in ("func", "output")},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(args) -> int:
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old['commit']}{' (dirty)' if old['dirty'] else ''} -> {new['commit']}{' (dirty)' if new['dirty'] else ''}")
+    for key in ("config", "database", "python"):
+        if old.get(key) != new.get(key):
+            print(f"warning: {key} differs, the numbers may not be comparable")
+
+    old_metrics, new_metrics = _flatten(old["results"]), _flatten(new["results"])
+    regressions = 0
+    print(f"{'metric':<40} {'old':>12} {'new':>12} {'change':>8}")
+    for name in sorted(old_metrics.keys() & new_metrics.keys()):
+        before, after = old_metrics[name], new_metrics[name]
+        change = (after - before) / before if before else 0.0
+        if name.endswith("_per_s"):
+            worse = change < -args.threshold
+        elif name.endswith("p50_ms"):
+            worse = change > args.threshold
+        else:
+            worse = False
+        regressions += worse
+        print(f"{name:<40} {before:>12,.3f} {after:>12,.3f} {change:>+8.1%}{'  REGRESSION' if worse else ''}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and write a results file")
+    run_parser.add_argument("--cases", nargs="+", choices=CASES, help="Cases to run (default: all)")
+    run_parser.add_argument("--wafers", type=int, default=5, help="Wafers in the synthetic lot")
+    run_parser.add_argument("--dies", type=int, default=5000, help="Dies per wafer")
+    run_parser.add_argument("--tests", type=int, default=4, help="Tests per die")
+    run_parser.add_argument("--pattern", default="mixed", help="Failure pattern, see benchmarks.synthetic")
+    run_parser.add_argument("--fail-rate", type=float, default=0.02)
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--requests", type=int, default=200, help="Timed requests per HTTP measurement")
+    run_parser.add_argument("--warmup", type=int, default=20, help="Untimed requests before each measurement")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed wafers for ingest")
+    run_parser.add_argument("--ws-clients", type=int, default=20)
+    run_parser.add_argument("--ws-messages", type=int, default=200)
+    run_parser.add_argument("--ws-rows", type=int, default=50, help="Result rows per published message")
+    run_parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Relative change counted as a regression (default 0.1)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Synthetic wafer and lot data for benchmarks.
+
+Generates round wafers with realistic spatial failure patterns:
+
+- ``random``: scattered fails at ``fail_rate``
+- ``cluster``: a few defect clusters
+- ``edge``: a ring of fails at the wafer edge
+- ``center``: a bullseye in the middle
+- ``scratch``: a line across the wafer
+- ``mixed``: one of the above per wafer
+
+Passing values are drawn around a nominal well inside the default limit
+(``binning.PASS_THRESHOLD``), a failing die fails one or more of its
+tests. Everything is seeded, so the same arguments always produce the
+same data. Results are stored through ``bulk_insert_results`` so bins and
+yield aggregates are maintained as in production.
+
+Populate a database (DATABASE_URL, SQLite or PostgreSQL) from the backend
+directory:
+
+    python -m benchmarks.synthetic --lots 2 --wafers 25 --dies 5000 --tests 4 --pattern mixed
+"""
+import argparse
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+from app.binning import PASS_THRESHOLD
+from app.hardware.base import round_wafer
+
+PATTERNS = ("random", "cluster", "edge", "center", "scratch")
+TEST_NAMES = ("CONT", "IV", "LEAK", "VTH", "IDSAT", "IDOFF", "RON", "BV")
+
+
+def diameter_for(dies: int) -> int:
+    """Diameter (in dies) of the smallest round wafer with at least ``dies`` dies."""
+    diameter = max(1, int(math.sqrt(4 * dies / math.pi)))
+    while len(round_wafer(diameter)) < dies:
+        diameter += 1
+    return diameter
+
+
+@dataclass
+class WaferSpec:
+    diameter: int = 80
+    tests: Tuple[str, ...] = TEST_NAMES[:4]
+    pattern: str = "mixed"
+    # Scattered fails on top of every pattern
+    fail_rate: float = 0.02
+
+    @classmethod
+    def build(cls, dies: int, tests: int, pattern: str = "mixed", fail_rate: float = 0.02) -> "WaferSpec":
+        if pattern not in PATTERNS + ("mixed",):
+            raise ValueError(f"Unknown failure pattern {pattern!r}")
+        if not 1 <= tests <= len(TEST_NAMES):
+            raise ValueError(f"tests must be between 1 and {len(TEST_NAMES)}")
+        return cls(diameter_for(dies), TEST_NAMES[:tests], pattern, fail_rate)
+
+
+def _fail_probability(pattern: str, diameter: int, rng: random.Random):
+    """Per-die fail probability of one wafer's pattern, as a function of (x, y)."""
+    r = diameter / 2
+
+    def radius(x, y):
+        return math.hypot(x + 0.5 - r, y + 0.5 - r) / r
+
+    if pattern == "cluster":
+        centers = [(rng.uniform(0, diameter), rng.uniform(0, diameter), rng.uniform(2, 0.08 * diameter + 2))
+                   for _ in range(rng.randint(2, 5))]
+        return lambda x, y: 0.9 if any(math.hypot(x - cx, y - cy) <= s for cx, cy, s in centers) else 0.0
+    if pattern == "edge":
+        return lambda x, y: 0.6 if radius(x, y) > 0.85 else 0.0
+    if pattern == "center":
+        return lambda x, y: 0.7 if radius(x, y) < 0.2 else 0.0
+    if pattern == "scratch":
+        # Line through the wafer at a random angle and offset
+        angle = rng.uniform(0, math.pi)
+        nx, ny = -math.sin(angle), math.cos(angle)
+        offset = rng.uniform(-0.3, 0.3) * r
+        return lambda x, y: 0.95 if abs((x + 0.5 - r) * nx + (y + 0.5 - r) * ny - offset) < 1.0 else 0.0
+    return lambda x, y: 0.0
+
+
+def wafer_results(spec: WaferSpec, rng: random.Random) -> Iterator[dict]:
+    """One wafer's ``{"x", "y", "test", "value"}`` results in raster order."""
+    pattern = rng.choice(PATTERNS) if spec.pattern == "mixed" else spec.pattern
+    fail_probability = _fail_probability(pattern, spec.diameter, rng)
+    # Every test has its own nominal and spread, well inside the limit
+    nominal = {t: (rng.uniform(0.2, 0.5) * PASS_THRESHOLD, rng.uniform(0.03, 0.08) * PASS_THRESHOLD) for t in spec.tests}
+    for x, y in round_wafer(spec.diameter):
+        failing = ()
+        if rng.random() < spec.fail_rate or rng.random() < fail_probability(x, y):
+            failing = set(rng.sample(spec.tests, rng.randint(1, len(spec.tests))))
+        for test in spec.tests:
+            if test in failing:
+                value = rng.uniform(1.2, 3.0) * PASS_THRESHOLD
+            else:
+                mean, sigma = nominal[test]
+                value = min(max(rng.gauss(mean, sigma), 0.0), 0.95 * PASS_THRESHOLD)
+            yield {"x": x, "y": y, "test": test, "value": value}
+
+
+def create_lot(db, batch_id: str, wafers: int, spec: WaferSpec, rng: random.Random) -> List[int]:
+    """Store a lot of synthetic wafers; returns their IDs."""
+    from app.ingest import bulk_insert_results
+    from app.models import Wafer
+
+    wafer_ids = []
+    for _ in range(wafers):
+        wafer = Wafer(batch_id=batch_id)
+        db.add(wafer)
+        db.commit()
+        bulk_insert_results(db, wafer.id, wafer_results(spec, rng))
+        wafer_ids.append(wafer.id)
+    return wafer_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populate DATABASE_URL with synthetic lots")
+    parser.add_argument("--lots", type=int, default=1)
+    parser.add_argument("--wafers", type=int, default=25, help="Wafers per lot")
+    parser.add_argument("--dies", type=int, default=5000, help="Dies per wafer (rounded up to a round wafer)")
+    parser.add_argument("--tests", type=int, default=4, help=f"Tests per die, 1-{len(TEST_NAMES)}")
+    parser.add_argument("--pattern", choices=PATTERNS + ("mixed",), default="mixed")
+    parser.add_argument("--fail-rate", type=float, default=0.02)
+    parser.add_argument("--batch-prefix", default="SYN")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app.database import Base, SessionLocal, engine
+
+    spec = WaferSpec.build(args.dies, args.tests, args.pattern, args.fail_rate)
+    rng = random.Random(args.seed)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for lot in range(args.lots):
+            start = time.perf_counter()
+            batch_id = f"{args.batch_prefix}{lot:03d}"
+            wafer_ids = create_lot(db, batch_id, args.wafers, spec, rng)
+            print(f"{batch_id}: wafers {wafer_ids[0]}-{wafer_ids[-1]}, {len(round_wafer(spec.diameter))} dies x "
+                  f"{len(spec.tests)} tests each, {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
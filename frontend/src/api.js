@@ -18,7 +18,43 @@ export async function fetchYieldData() {
   return res.data;
 }
 
+// Decoded wafer maps keyed by wafer id, revalidated with the server's ETag.
+const waferMapCache = new Map();
+
+function decodeWaferMap(waferId, buffer) {
+  const view = new DataView(buffer);
+  const encoding = view.getUint8(5);
+  const x0 = view.getInt32(6, true);
+  const y0 = view.getInt32(10, true);
+  const width = view.getUint32(14, true);
+  const height = view.getUint32(18, true);
+  let grid;
+  if (encoding === 0) {
+    grid = new Uint8Array(buffer, 22, width * height);
+  } else {
+    const runs = view.getUint32(22, true);
+    const values = new Uint8Array(buffer, 26, runs);
+    grid = new Uint8Array(width * height);
+    let offset = 0;
+    for (let i = 0; i < runs; i++) {
+      const length = view.getUint32(26 + runs + i * 4, true);
+      grid.fill(values[i], offset, offset + length);
+      offset += length;
+    }
+  }
+  return { wafer_id: waferId, x0, y0, width, height, grid };
+}
+
 export async function fetchWaferMap(id) {
-  const res = await API.get(`/analytics/wafer_map/${id}`);
-  return res.data;
+  const cached = waferMapCache.get(id);
+  const res = await API.get(`/analytics/wafer_map/${id}`, {
+    params: { format: 'binary' },
+    responseType: 'arraybuffer',
+    headers: cached ? { 'If-None-Match': cached.etag } : {},
+    validateStatus: status => status === 200 || status === 304,
+  });
+  if (res.status === 304 && cached) return cached.map;
+  const map = decodeWaferMap(id, res.data);
+  waferMapCache.set(id, { etag: res.headers.etag, map });
+  return map;
 }
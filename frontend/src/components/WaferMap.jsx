@@ -1,15 +1,25 @@
 import React, { useEffect, useState } from 'react';
 import { fetchWaferMap } from '../api';
 
+const COLORS = { 1: 'green', 2: 'red' };
+
 export default function WaferMap({ waferId }) {
-  const [map, setMap] = useState([]);
-  useEffect(() => { fetchWaferMap(waferId).then(res => setMap(res.die_data)); }, [waferId]);
+  const [map, setMap] = useState(null);
+  useEffect(() => { fetchWaferMap(waferId).then(setMap); }, [waferId]);
+  const cells = [];
+  if (map) {
+    for (let i = 0; i < map.grid.length; i++) {
+      const status = map.grid[i];
+      if (!status) continue;
+      const x = i % map.width, y = Math.floor(i / map.width);
+      cells.push(
+        <rect key={i} x={x*20} y={y*20} width="18" height="18" fill={COLORS[status]} />
+      );
+    }
+  }
   return (
     <svg width="400" height="400">
-      {map.map((d, i) => (
-        <rect key={i} x={d.x*20} y={d.y*20} width="18" height="18"
-          fill={d.status === 'pass' ? 'green' : 'red'} />
-      ))}
+      {cells}
     </svg>
   );
 }
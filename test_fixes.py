@@ -19,14 +19,64 @@ def test_python_syntax():
         "backend/app/utils.py",
         "backend/app/database.py",
         "backend/app/celery_app.py",
+        "backend/app/ingest.py",
+        "backend/app/pubsub.py",
+        "backend/app/aggregates.py",
+        "backend/app/wafer_map.py",
+        "backend/app/instruments.py",
+        "backend/app/scheduler.py",
+        "backend/app/archive.py",
+        "backend/app/stats.py",
+        "backend/app/binning.py",
+        "backend/app/auth_cache.py",
+        "backend/app/rate_limit.py",
+        "backend/app/task_status.py",
+        "backend/app/adaptive.py",
+        "backend/app/hardware/path_planner.py",
+        "backend/app/lots.py",
+        "backend/app/metrics.py",
+        "backend/app/health.py",
         "backend/app/routers/auth.py",
         "backend/app/routers/users.py",
         "backend/app/routers/tests.py",
         "backend/app/routers/analytics.py",
+        "backend/app/routers/programs.py",
         "backend/app/hardware/scpi_driver.py",
         "backend/app/hardware/rest_driver.py",
+        "backend/app/hardware/base.py",
+        "backend/app/hardware/fake_driver.py",
+        "backend/app/hardware/session_pool.py",
+        "backend/app/hardware/scpi_sequencer.py",
+        "backend/app/hardware/sim_visa.py",
+        "backend/app/hardware/async_rest_driver.py",
+        "backend/app/hardware/rest_sim_server.py",
         "backend/alembic/env.py",
-        "backend/alembic/versions/0001_create_tables.py"
+        "backend/alembic/versions/0001_create_tables.py",
+        "backend/alembic/versions/0002_yield_aggregates.py",
+        "backend/alembic/versions/0003_test_results_indexes.py",
+        "backend/alembic/versions/0004_wafer_archived_at.py",
+        "backend/alembic/versions/0005_test_programs_and_bins.py",
+        "backend/alembic/versions/0006_test_results_keyset_index.py",
+        "backend/alembic/versions/0007_test_results_unique_die.py",
+        "backend/alembic/versions/0008_wafer_results_version.py",
+        "backend/benchmarks/bench_ingest.py",
+        "backend/benchmarks/bench_streaming.py",
+        "backend/benchmarks/bench_yield.py",
+        "backend/benchmarks/bench_queries.py",
+        "backend/benchmarks/bench_async_db.py",
+        "backend/benchmarks/bench_scpi.py",
+        "backend/benchmarks/bench_rest.py",
+        "backend/benchmarks/bench_export.py",
+        "backend/benchmarks/bench_stats.py",
+        "backend/benchmarks/bench_results.py",
+        "backend/benchmarks/bench_auth.py",
+        "backend/benchmarks/bench_login.py",
+        "backend/benchmarks/bench_resume.py",
+        "backend/benchmarks/bench_adaptive.py",
+        "backend/benchmarks/bench_path.py",
+        "backend/benchmarks/bench_lot.py",
+        "backend/benchmarks/synthetic.py",
+        "backend/benchmarks/suite.py"
     ]
     
     for file_path in python_files: